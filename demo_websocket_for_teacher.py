@@ -38,31 +38,18 @@ def demo_websocket_for_teacher():
     def hello(data):
         print("👋 Server connection confirmed")
     
-    # Receive note creation event
+    # Receive coalesced note change event
     @sio.event
-    def note_created(data):
+    def notes_changed(data):
         timestamp = datetime.now().strftime('%H:%M:%S')
-        print(f"📝 [{timestamp}] Note Creation Event")
-        print(f"   Note ID: {data.get('id', 'unknown')}")
-        print("   → Description: User created a new note in the app")
-        print("-" * 40)
-    
-    # Receive note update event
-    @sio.event
-    def note_updated(data):
-        timestamp = datetime.now().strftime('%H:%M:%S')
-        print(f"✏️ [{timestamp}] Note Update Event")
-        print(f"   Note ID: {data.get('id', 'unknown')}")
-        print("   → Description: User edited a note in the app")
-        print("-" * 40)
-    
-    # Receive note deletion event
-    @sio.event
-    def note_deleted(data):
-        timestamp = datetime.now().strftime('%H:%M:%S')
-        print(f"🗑️ [{timestamp}] Note Deletion Event")
-        print(f"   Note ID: {data.get('id', 'unknown')}")
-        print("   → Description: User deleted a note in the app")
+        labels = {"created": "📝 Created", "updated": "✏️ Updated", "deleted": "🗑️ Deleted"}
+        print(f"🔔 [{timestamp}] Note Change Event")
+        for change in data.get('changes', []):
+            print(f"   {labels.get(change.get('op'), change.get('op'))}: Note ID {change.get('id', 'unknown')}")
+        if data.get('bodies_included'):
+            print(f"   → Carries {len(data.get('notes', []))} note(s), devices apply them without re-syncing")
+        else:
+            print("   → Too large to carry note bodies, devices run a sync")
         print("-" * 40)
     
     # Receive folder creation event
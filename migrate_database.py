@@ -1,107 +1,98 @@
 #!/usr/bin/env python3
 """
-Database migration script to update user table constraints
-- Remove UNIQUE constraint from username
-- Add UNIQUE constraint to email
+Bring the sync server database up to the current schema version.
+
+Runs the same versioned migrations as server startup (server/schema.py),
+so it can be used ahead of a deploy on a copy or on the live database:
+- --dry-run applies every pending DDL step in a transaction that is rolled
+  back, and reports how many rows each backfill would touch
+- --status lists applied, pending and interrupted migrations
+- backfills commit every --batch-size rows; an interrupted run resumes from
+  the last committed batch when started again
 """
 
-import sqlite3
+import argparse
 import os
+import sqlite3
+import sys
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server")
+sys.path.insert(0, SERVER_DIR)
+
+from migrations import MigrationRunner, MigrationError, schema_version  # noqa: E402
+from note_bodies import register_functions  # noqa: E402
+from schema import MIGRATIONS  # noqa: E402
+
+
+def open_database(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    register_functions(conn)  # the full-text backfill reads resolved note bodies
+    return conn
+
+
+def migrate_database(db_path, dry_run=False, batch_size=1000):
+    """Apply pending migrations to `db_path`; returns False if one failed"""
+    if not os.path.exists(db_path):
+        print(f"⚠️  Database not found: {db_path}")
+        return False
+
+    conn = open_database(db_path)
+    try:
+        runner = MigrationRunner(conn, MIGRATIONS, batch_size=batch_size)
+        current = schema_version(conn)
+        print(f"🔄 {db_path}: schema v{current}, latest v{runner.latest}")
+        if current >= runner.latest:
+            print("✅ Already up to date")
+            return True
+
+        if dry_run:
+            for step in runner.run(dry_run=True):
+                backfill = step["rows_to_backfill"]
+                detail = f"{backfill} rows to backfill" if backfill is not None else "schema only"
+                resumed = f" (resuming after {step['rows_done']} rows)" if step["resuming"] else ""
+                print(f"📝 v{step['version']} {step['name']}: {detail}{resumed}")
+            print("✅ Dry run: DDL checked and rolled back, nothing written")
+            return True
+
+        for step in runner.run():
+            print(f"✅ v{step['version']} {step['name']}: {step['rows']} rows backfilled in {step['seconds']}s")
+        return True
+    except MigrationError as e:
+        print(f"❌ {e}")
+        print("   Committed batches are kept; run again to resume.")
+        return False
+    finally:
+        conn.close()
+
+
+def print_status(db_path):
+    conn = open_database(db_path)
+    try:
+        for step in MigrationRunner(conn, MIGRATIONS).status():
+            if step["applied"]:
+                state = "applied"
+            elif step["in_progress"]:
+                state = f"in progress ({step['rows_done']} rows backfilled)"
+            else:
+                state = "pending"
+            print(f"📋 v{step['version']} {step['name']}: {state}")
+    finally:
+        conn.close()
 
-def migrate_database():
-    """Migrate the database to allow duplicate usernames but unique emails"""
-    
-    # Database paths
-    backend_db = "server/mynote_sync.db"
-    frontend_db = "mynote_sync.db"
-    
-    databases = [backend_db, frontend_db]
-    
-    for db_path in databases:
-        if not os.path.exists(db_path):
-            print(f"⚠️  Database not found: {db_path}")
-            continue
-            
-        print(f"🔄 Migrating database: {db_path}")
-        
-        try:
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            
-            # Check current schema
-            cursor.execute("PRAGMA table_info(users)")
-            columns = cursor.fetchall()
-            print(f"📋 Current users table columns: {[col[1] for col in columns]}")
-            
-            # Check current constraints
-            cursor.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='users'")
-            create_sql = cursor.fetchone()[0]
-            print(f"📝 Current CREATE TABLE statement: {create_sql}")
-            
-            # Create new table with correct constraints
-            cursor.execute("""
-                CREATE TABLE users_new(
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT,
-                    email TEXT UNIQUE,
-                    password TEXT,
-                    avatar TEXT,
-                    created_at TEXT
-                )
-            """)
-            
-            # Copy data from old table to new table
-            cursor.execute("""
-                INSERT INTO users_new (id, username, email, password, avatar, created_at)
-                SELECT id, username, email, password, 
-                       CASE WHEN avatar IS NULL THEN NULL ELSE avatar END,
-                       CASE WHEN created_at IS NULL THEN datetime('now') ELSE created_at END
-                FROM users
-            """)
-            
-            # Drop old table
-            cursor.execute("DROP TABLE users")
-            
-            # Rename new table
-            cursor.execute("ALTER TABLE users_new RENAME TO users")
-            
-            # Recreate indexes
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_notes_dirty ON notes(dirty)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_syncq_user ON sync_queue(user_id, created_at)")
-            
-            conn.commit()
-            print(f"✅ Successfully migrated: {db_path}")
-            
-            # Verify the new schema
-            cursor.execute("PRAGMA table_info(users)")
-            new_columns = cursor.fetchall()
-            print(f"📋 New users table columns: {[col[1] for col in new_columns]}")
-            
-            # Check for unique constraints
-            cursor.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='users'")
-            new_create_sql = cursor.fetchone()[0]
-            print(f"📝 New CREATE TABLE statement: {new_create_sql}")
-            
-            conn.close()
-            
-        except Exception as e:
-            print(f"❌ Error migrating {db_path}: {e}")
-            if 'conn' in locals():
-                conn.close()
 
 if __name__ == "__main__":
-    print("🚀 Starting database migration...")
-    print("📝 This will:")
-    print("   - Remove UNIQUE constraint from username")
-    print("   - Add UNIQUE constraint to email")
-    print("   - Preserve all existing data")
-    print()
-    
-    migrate_database()
-    
-    print()
-    print("✅ Migration completed!")
-    print("📋 Summary:")
-    print("   - Username can now be duplicated")
-    print("   - Email must be unique")
-    print("   - All existing data preserved")
+    default_db = os.environ.get("MYNOTE_DB_PATH") or os.path.join(SERVER_DIR, "mynote_sync.db")
+    parser = argparse.ArgumentParser(description="Migrate the sync server database to the current schema")
+    parser.add_argument("db_path", nargs="?", default=default_db, help=f"database file (default {default_db})")
+    parser.add_argument("--dry-run", action="store_true", help="check pending migrations without changing anything")
+    parser.add_argument("--status", action="store_true", help="show which migrations are applied")
+    parser.add_argument("--batch-size", type=int, default=1000, help="rows per backfill transaction")
+    args = parser.parse_args()
+
+    if args.status:
+        print_status(args.db_path)
+    else:
+        sys.exit(0 if migrate_database(args.db_path, args.dry_run, args.batch_size) else 1)
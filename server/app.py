@@ -1,263 +1,682 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, has_request_context, Response, stream_with_context, send_file
 from flask_cors import CORS
-from flask_socketio import SocketIO, emit, join_room
-import sqlite3, os, datetime, json
+from flask_socketio import SocketIO, emit, join_room, ConnectionRefusedError
+import sqlite3, os, datetime, json, threading, base64, hashlib, re
+from db_pool import ConnectionPool, PoolTimeout
+from sync_status import SyncStatusTracker
+from compression import compress_response
+from realtime import EventBatcher
+from metrics import Metrics
+from write_pipeline import GroupCommitWriter, WriteQueueTimeout
+from read_cache import UserCache
+from note_bodies import BodyStore, content_sql, register_functions, migrate_inline_bodies, purge_unreferenced_bodies
+from blobs import BlobStore, BlobError, HASH_RE
+from bulk_transfer import (EXPORT_FORMAT, EXPORT_VERSION, ImportFormatError, ZipStream, ndjson_line, note_html,
+                           note_markdown, note_path, read_records)
+from maintenance import MaintenanceScheduler, is_interrupt
+from message_bus import create_bus
+from rate_limit import RateLimiter, ConcurrencyLimiter, retry_after_header
+from serialization import RowLayout, dumps, json_object_tail
+from timestamps import client_timestamp, ms_to_iso, now_ms, to_ms
+from migrations import MigrationRunner, schema_version
+from schema import MIGRATIONS, SCHEMA_VERSION, FTS_AVAILABLE, TOMBSTONE_AGE_SQL, table_exists
 
-DB_PATH = os.path.join(os.path.dirname(__file__), "mynote_sync.db")
+DB_PATH = os.environ.get("MYNOTE_DB_PATH") or os.path.join(os.path.dirname(__file__), "mynote_sync.db")
+
+# Connection pool tuning (see db_pool.py): read-only handlers share up to
+# DB_POOL_SIZE read-only connections, every write goes through DB_WRITERS
+# read-write connections (1 = a single serialized writer)
+DB_POOL_SIZE = int(os.environ.get("MYNOTE_DB_POOL_SIZE", "8"))
+DB_WRITERS = int(os.environ.get("MYNOTE_DB_WRITERS", "1"))
+DB_POOL_TIMEOUT = float(os.environ.get("MYNOTE_DB_POOL_TIMEOUT", "10"))
+DB_BUSY_TIMEOUT_MS = int(os.environ.get("MYNOTE_DB_BUSY_TIMEOUT_MS", "5000"))
+
+SYNC_STATUS_PATH = os.environ.get("MYNOTE_SYNC_STATUS_PATH") or os.path.join(os.path.dirname(__file__), "sync_status.json")
+SYNC_STATUS_FLUSH_INTERVAL = float(os.environ.get("MYNOTE_SYNC_STATUS_FLUSH_INTERVAL", "2"))
+
+# Realtime batching: note events per user room are coalesced for this many
+# seconds, and carry note bodies when they serialize to at most this many bytes
+REALTIME_BATCH_WINDOW = float(os.environ.get("MYNOTE_REALTIME_BATCH_WINDOW", "0.15"))
+REALTIME_MAX_PAYLOAD_BYTES = int(os.environ.get("MYNOTE_REALTIME_MAX_PAYLOAD_BYTES", "65536"))
+
+# Responses smaller than this are not worth compressing
+COMPRESS_MIN_BYTES = int(os.environ.get("MYNOTE_COMPRESS_MIN_BYTES", "1024"))
+
+# Group commit: single-row writes arriving within this window share one
+# transaction (see write_pipeline.py); MYNOTE_GROUP_COMMIT=0 commits each alone
+GROUP_COMMIT = os.environ.get("MYNOTE_GROUP_COMMIT", "1") != "0"
+GROUP_COMMIT_WINDOW_MS = float(os.environ.get("MYNOTE_GROUP_COMMIT_WINDOW_MS", "2"))
+GROUP_COMMIT_MAX_BATCH = int(os.environ.get("MYNOTE_GROUP_COMMIT_MAX_BATCH", "128"))
+
+# In-memory per-user cache of folder listings and note metadata (0 disables)
+CACHE_MAX_ENTRIES = int(os.environ.get("MYNOTE_CACHE_MAX_ENTRIES", "50000"))
+CACHE_NOTES_PER_USER = int(os.environ.get("MYNOTE_CACHE_NOTES_PER_USER", "1000"))
+
+# Optional at-rest compression: note bodies of at least this many bytes are
+# stored once per distinct text in note_bodies (see note_bodies.py)
+BODY_COMPRESSION = os.environ.get("MYNOTE_BODY_COMPRESSION", "0") == "1"
+BODY_COMPRESS_MIN_BYTES = int(os.environ.get("MYNOTE_BODY_COMPRESS_MIN_BYTES", "1024"))
+
+# Attachment blobs (see blobs.py): storage directory, size limits, and how long
+# an unreferenced blob or an abandoned upload is kept before collection
+BLOB_DIR = os.environ.get("MYNOTE_BLOB_DIR") or os.path.join(os.path.dirname(__file__), "blob_store")
+BLOB_MAX_BYTES = int(os.environ.get("MYNOTE_BLOB_MAX_BYTES", str(100 * 1024 * 1024)))
+BLOB_CHUNK_MAX = int(os.environ.get("MYNOTE_BLOB_CHUNK_MAX", str(8 * 1024 * 1024)))
+BLOB_GC_GRACE = float(os.environ.get("MYNOTE_BLOB_GC_GRACE", "86400"))
+
+# Existing databases are only switched to auto_vacuum=INCREMENTAL on request,
+# since that takes a full VACUUM at startup (new databases get it automatically)
+ENABLE_INCREMENTAL_VACUUM = os.environ.get("MYNOTE_ENABLE_INCREMENTAL_VACUUM", "0") == "1"
+
+# Rows per transaction when a schema migration backfills existing data
+MIGRATION_BATCH = int(os.environ.get("MYNOTE_MIGRATION_BATCH", "1000"))
+
+# Statements slower than this are logged with their parameter shapes
+SLOW_QUERY_MS = float(os.environ.get("MYNOTE_SLOW_QUERY_MS", "100"))
+
+# Admission control (see rate_limit.py): per-user token buckets (requests per
+# second and burst; a rate of 0 disables) for API reads, API writes and Socket.IO
+# connects, plus a cap on concurrent API requests with a bounded wait queue
+RATE_LIMIT_READ = float(os.environ.get("MYNOTE_RATE_LIMIT_READ", "50"))
+RATE_LIMIT_READ_BURST = float(os.environ.get("MYNOTE_RATE_LIMIT_READ_BURST", "200"))
+RATE_LIMIT_WRITE = float(os.environ.get("MYNOTE_RATE_LIMIT_WRITE", "20"))
+RATE_LIMIT_WRITE_BURST = float(os.environ.get("MYNOTE_RATE_LIMIT_WRITE_BURST", "100"))
+RATE_LIMIT_CONNECT = float(os.environ.get("MYNOTE_RATE_LIMIT_CONNECT", "0.5"))
+RATE_LIMIT_CONNECT_BURST = float(os.environ.get("MYNOTE_RATE_LIMIT_CONNECT_BURST", "10"))
+MAX_CONCURRENT_REQUESTS = int(os.environ.get("MYNOTE_MAX_CONCURRENT_REQUESTS", "64"))
+MAX_QUEUED_REQUESTS = int(os.environ.get("MYNOTE_MAX_QUEUED_REQUESTS", "256"))
+REQUEST_QUEUE_TIMEOUT = float(os.environ.get("MYNOTE_REQUEST_QUEUE_TIMEOUT", "5"))
+
+# Multi-process mode (see run_workers.py): workers share the database and pass
+# realtime events and sync status updates to each other over the message bus
+MESSAGE_BUS = os.environ.get("MYNOTE_MESSAGE_BUS", "local")
+WORKER_INDEX = int(os.environ.get("MYNOTE_WORKER_INDEX", "0"))
 
 app = Flask(__name__)
 CORS(app)
 socketio = SocketIO(app, cors_allowed_origins="*")  # ← Added
 
+metrics = Metrics(slow_query_ms=SLOW_QUERY_MS)
+bus = create_bus(MESSAGE_BUS)
+
 def now_iso():
     return datetime.datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
 
-def update_folders_list(sync_data):
-    """Update folders list in sync_status.json"""
+_sync_tracker = None
+_sync_tracker_lock = threading.Lock()
+
+def get_sync_tracker():
+    """Return the live sync status model, seeding its counters on first use"""
+    global _sync_tracker
+    if _sync_tracker is None:
+        with _sync_tracker_lock:
+            if _sync_tracker is None:
+                # Every worker keeps the whole model (via the bus); only the first one writes the file
+                tracker = SyncStatusTracker(SYNC_STATUS_PATH if WORKER_INDEX == 0 else None,
+                                            flush_interval=SYNC_STATUS_FLUSH_INTERVAL)
+                conn = read_db()
+                try:
+                    tracker.load_counts(conn)
+                finally:
+                    conn.close()
+                tracker.start()
+                _sync_tracker = tracker
+    return _sync_tracker
+
+def load_notes_for_push(uid, ids):
+    """Current rows (list_notes shape) for realtime payloads, keyed by id"""
+    conn = read_db()
     try:
-        conn = db()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, user_id, name, created_at, updated_at FROM folders ORDER BY id")
-        folders = []
-        for row in cursor.fetchall():
-            folders.append({
-                "id": row[0],
-                "user_id": row[1],
-                "name": row[2],
-                "created_at": row[3],
-                "updated_at": row[4]
-            })
+        found = {}
+        for i in range(0, len(ids), SQL_IN_CHUNK):
+            chunk = ids[i:i + SQL_IN_CHUNK]
+            c = conn.execute(f"SELECT {NOTE_COLUMNS} FROM notes WHERE user_id=? AND id IN ({','.join('?' * len(chunk))})",
+                             (uid, *chunk))
+            for r in c.fetchall():
+                found[r["remote_id"]] = dict(r)
+        return found
+    finally:
         conn.close()
-        
-        sync_data["folders"] = folders
-    except Exception as e:
-        print(f"Error updating folders list: {e}")
 
-def update_sync_status(operation_type, data=None):
-    """Update sync_status.json with real-time data"""
+def emit_to_room(event, payload, room):
+    socketio.emit(event, payload, to=room)
+    metrics.on_emit(event, room)
+    # Devices in this room may be connected to other workers
+    bus.publish("emit", {"event": event, "payload": payload, "room": room})
+
+def deliver_emit(message):
+    socketio.emit(message["event"], message["payload"], to=message["room"])
+    metrics.on_emit(message["event"], message["room"])
+
+bus.subscribe("emit", deliver_emit)
+
+realtime = EventBatcher(emit_to_room, load_notes_for_push, window=REALTIME_BATCH_WINDOW,
+                        max_payload_bytes=REALTIME_MAX_PAYLOAD_BYTES, now=lambda: now_iso())
+
+def update_sync_status(operation_type, data=None, users=0, notes=0, folders=0):
+    """Record a write in the sync status model (deltas are row count changes)"""
     try:
-        sync_file = os.path.join(os.path.dirname(__file__), "sync_status.json")
-        
-        # Load existing data
-        if os.path.exists(sync_file):
-            with open(sync_file, 'r') as f:
-                sync_data = json.load(f)
-        else:
-            sync_data = {
-                "sync_status": {
-                    "last_updated": now_iso(),
-                    "status": "active",
-                    "total_users": 0,
-                    "total_notes": 0,
-                    "total_folders": 0,
-                    "pending_sync_operations": 0,
-                    "websocket_connections": 0,
-                    "last_sync_operation": None
-                },
-                "users": [],
-                "notes": [],
-                "folders": [],
-                "recent_operations": []
-            }
-        
-        # Update sync status
-        sync_data["sync_status"]["last_updated"] = now_iso()
-        sync_data["sync_status"]["last_sync_operation"] = operation_type
-        
-        # Add to recent operations (keep last 10 for cleaner view)
-        operation = {
-            "type": operation_type,
-            "timestamp": now_iso(),
-            "data": data
-        }
-        sync_data["recent_operations"].insert(0, operation)
-        sync_data["recent_operations"] = sync_data["recent_operations"][:10]
-        
-        # Always update folders list
-        update_folders_list(sync_data)
-        
-        # Get all users data
-        conn = db()
-        cursor = conn.cursor()
-        
-        # Get all users
-        cursor.execute("SELECT id, username, email, password FROM users ORDER BY id")
-        users = []
-        for row in cursor.fetchall():
-            users.append({
-                "id": row[0],
-                "username": row[1],
-                "email": row[2],
-                "password": "***"  # Hide password for security
-            })
-        sync_data["users"] = users
-        
-        # Get all notes with detailed info
-        cursor.execute("""
-            SELECT id, user_id, title, content, folder_id, is_favorite, is_deleted, updated_at, version, remote_id, dirty
-            FROM notes 
-            ORDER BY updated_at DESC
-        """)
-        notes = []
-        for row in cursor.fetchall():
-            notes.append({
-                "id": row[0],
-                "user_id": row[1],
-                "title": row[2] or "",
-                "content": (row[3] or "")[:100] + "..." if row[3] and len(row[3]) > 100 else (row[3] or ""),
-                "folder_id": row[4],
-                "is_favorite": bool(row[5]),
-                "is_deleted": bool(row[6]),
-                "updated_at": row[7],
-                "version": row[8],
-                "server_id": row[0],  # Show server ID instead of remote_id
-                "client_remote_id": row[9],  # Show what client sent
-                "dirty": bool(row[10])
-            })
-        sync_data["notes"] = notes
-        
-        # Get folders count
-        cursor.execute("SELECT COUNT(*) FROM folders")
-        total_folders = cursor.fetchone()[0]
-        
-        # Update totals
-        sync_data["sync_status"]["total_users"] = len(users)
-        sync_data["sync_status"]["total_notes"] = len(notes)
-        sync_data["sync_status"]["total_folders"] = total_folders
-        sync_data["sync_status"]["pending_sync_operations"] = sum(1 for note in notes if note["dirty"])
-        
-        conn.close()
-        
-        # Save updated data
-        with open(sync_file, 'w') as f:
-            json.dump(sync_data, f, indent=2)
-            
+        get_sync_tracker().record(operation_type, data, users=users, notes=notes, folders=folders)
     except Exception as e:
         print(f"Error updating sync status: {e}")
-        import traceback
-        traceback.print_exc()
+    bus.publish("sync_status", {"op": operation_type, "data": data, "users": users, "notes": notes, "folders": folders})
 
-def db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+def apply_sync_status(message):
+    # Another worker's write or socket connection
+    tracker = get_sync_tracker()
+    if message["op"] == "connection_opened":
+        tracker.connection_opened()
+    elif message["op"] == "connection_closed":
+        tracker.connection_closed()
+    else:
+        tracker.record(message["op"], message["data"], users=message["users"], notes=message["notes"],
+                       folders=message["folders"])
+
+bus.subscribe("sync_status", apply_sync_status)
+
+_pool = None
+_read_pool = None
+_pool_lock = threading.Lock()
+
+def _open_pool(current, read_only):
+    # (Re)create a pool if DB_PATH changed; called with _pool_lock held
+    if current is not None and current.path == DB_PATH:
+        return current
+    if current is not None:
+        current.close()
+    return ConnectionPool(DB_PATH, max_size=DB_POOL_SIZE if read_only else DB_WRITERS, timeout=DB_POOL_TIMEOUT,
+                          busy_timeout_ms=DB_BUSY_TIMEOUT_MS,
+                          on_statement=metrics.on_statement,
+                          on_checkout=metrics.on_pool_checkout,
+                          on_connect=register_functions,
+                          read_only=read_only)
+
+def get_pool():
+    """Return the read-write (writer) connection pool"""
+    global _pool
+    if _pool is None or _pool.path != DB_PATH:
+        with _pool_lock:
+            _pool = _open_pool(_pool, read_only=False)
+    return _pool
+
+def get_read_pool():
+    """Return the read-only connection pool (the database must exist)"""
+    global _read_pool
+    if _read_pool is None or _read_pool.path != DB_PATH:
+        with _pool_lock:
+            _read_pool = _open_pool(_read_pool, read_only=True)
+    return _read_pool
+
+def _track(conn):
+    if has_request_context():
+        g.setdefault("db_conns", []).append((conn, conn.lease))
     return conn
 
+def db():
+    # Pooled read-write WAL connection for writes; conn.close() hands it back.
+    # With one writer connection, never call write() or db() while holding it.
+    return _track(get_pool().acquire())
+
+def read_db():
+    # Pooled read-only connection: autocommit, each statement sees the latest commit
+    return _track(get_read_pool().acquire())
+
+bodies = BodyStore(enabled=BODY_COMPRESSION, min_bytes=BODY_COMPRESS_MIN_BYTES)
+
+_blob_store = None
+
+def get_blob_store():
+    global _blob_store
+    if _blob_store is None or _blob_store.root != BLOB_DIR:
+        _blob_store = BlobStore(BLOB_DIR, max_bytes=BLOB_MAX_BYTES, chunk_max=BLOB_CHUNK_MAX)
+    return _blob_store
+
+# The cache is per process and upserts trust its note metadata for last-writer-wins,
+# so it is off when other workers can write to the same notes
+cache = UserCache(max_entries=0 if bus.shared else CACHE_MAX_ENTRIES, max_notes_per_user=CACHE_NOTES_PER_USER)
+
+# Note metadata is cached from inside write operations, so anything rolled
+# back there must not survive in the cache
+writer = GroupCommitWriter(lambda: get_pool().acquire(), window=GROUP_COMMIT_WINDOW_MS / 1000.0,
+                           max_batch=GROUP_COMMIT_MAX_BATCH, enabled=GROUP_COMMIT, on_abort=cache.clear,
+                           sql_capture=metrics)
+
+def write(op):
+    """Apply op(cursor) through the group-commit writer and return its result"""
+    return writer.submit(op, timeout=DB_POOL_TIMEOUT)
+
+@app.teardown_request
+def release_db(exc=None):
+    # Handlers that bail out early (or raise) must not leak pooled connections.
+    # Connections the handler already closed may be in use by another request
+    # by now; the lease check keeps us from releasing them a second time.
+    for conn, lease in g.pop("db_conns", []):
+        if conn.pool is not None:
+            conn.pool.release(conn, lease)
+        else:
+            conn.close()
+
 def init_db():
+    """Bring the schema up to SCHEMA_VERSION (see schema.py); no DDL runs when it is current"""
+    global FTS_AVAILABLE
     conn = db()
     c = conn.cursor()
-    c.execute("""
-      CREATE TABLE IF NOT EXISTS users(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT NOT NULL,
-        email TEXT UNIQUE NOT NULL,
-        password TEXT NOT NULL,
-        avatar TEXT,
-        created_at TEXT NOT NULL DEFAULT (datetime('now'))
-      )
-    """)
-    c.execute("""
-      CREATE TABLE IF NOT EXISTS notes(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        title TEXT NOT NULL,
-        content TEXT DEFAULT '',
-        folder_id INTEGER,
-        is_favorite INTEGER DEFAULT 0,
-        is_deleted INTEGER DEFAULT 0,
-        created_at TEXT NOT NULL DEFAULT (datetime('now')),
-        updated_at TEXT NOT NULL DEFAULT (datetime('now')),
-        deleted_at TEXT,
-        version INTEGER DEFAULT 1,
-        remote_id TEXT UNIQUE,
-        dirty INTEGER DEFAULT 0,
-        FOREIGN KEY(user_id) REFERENCES users(id),
-        FOREIGN KEY(folder_id) REFERENCES folders(id) ON DELETE SET NULL
-      )
-    """)
-    c.execute("""
-      CREATE TABLE IF NOT EXISTS folders(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        name TEXT NOT NULL,
-        created_at TEXT NOT NULL DEFAULT (datetime('now')),
-        updated_at TEXT,
-        FOREIGN KEY(user_id) REFERENCES users(id)
-      )
-    """)
-    c.execute("""
-      CREATE TABLE IF NOT EXISTS sync_queue(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        action TEXT NOT NULL,
-        table_name TEXT NOT NULL,
-        record_id INTEGER,
-        data TEXT,
-        note_local_id INTEGER,
-        remote_id TEXT,
-        try_count INTEGER DEFAULT 0,
-        last_error TEXT,
-        created_at TEXT NOT NULL DEFAULT (datetime('now')),
-        FOREIGN KEY(user_id) REFERENCES users(id)
-      )
-    """)
-    
-    # Create indexes
-    c.execute("CREATE INDEX IF NOT EXISTS idx_notes_dirty ON notes(dirty)")
-    c.execute("CREATE INDEX IF NOT EXISTS idx_notes_user ON notes(user_id)")
-    c.execute("CREATE INDEX IF NOT EXISTS idx_notes_folder ON notes(folder_id)")
-    c.execute("CREATE INDEX IF NOT EXISTS idx_notes_updated ON notes(updated_at)")
-    c.execute("CREATE INDEX IF NOT EXISTS idx_notes_user_updated ON notes(user_id, updated_at)")
-    c.execute("CREATE INDEX IF NOT EXISTS idx_folders_user ON folders(user_id)")
-    c.execute("CREATE INDEX IF NOT EXISTS idx_folders_user_name ON folders(user_id, name)")
-    c.execute("CREATE INDEX IF NOT EXISTS idx_syncq_user ON sync_queue(user_id, created_at)")
-    
-    # Pre-create guest user id=1
-    c.execute("INSERT OR IGNORE INTO users(id, username, email, password, created_at) VALUES (1, 'guest', 'guest@example.com', '', datetime('now'))")
-    conn.commit()
+    # Incremental vacuum (maintenance job) needs auto_vacuum=INCREMENTAL, which only
+    # takes effect through a VACUUM: instant on a new database, a full rewrite otherwise
+    c.execute("PRAGMA auto_vacuum")
+    if c.fetchone()[0] != 2:
+        c.execute("SELECT 1 FROM sqlite_master LIMIT 1")
+        is_new = c.fetchone() is None
+        if is_new or ENABLE_INCREMENTAL_VACUUM:
+            if not is_new:
+                print("Converting database to auto_vacuum=INCREMENTAL (one-time VACUUM)...")
+            c.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            c.execute("VACUUM")
+
+    if schema_version(conn) < SCHEMA_VERSION:
+        for step in MigrationRunner(conn, MIGRATIONS, batch_size=MIGRATION_BATCH).run():
+            print(f"Applied schema v{step['version']} {step['name']} ({step['rows']} rows backfilled, {step['seconds']}s)")
+    # The FTS migration is skipped on SQLite builds without FTS5
+    FTS_AVAILABLE = FTS_AVAILABLE and table_exists(c, "notes_fts")
+
+    if bodies.enabled:
+        converted = migrate_inline_bodies(conn, bodies)
+        if converted:
+            print(f"Moved {converted} note bodies into compressed storage")
     conn.close()
 
+    # Seed the live sync status counters once the schema exists
+    get_sync_tracker()
+
+@app.before_request
+def start_request_timer():
+    metrics.begin_request()
+
+@app.after_request
+def record_request_metrics(response):
+    # Registered before the other after_request hooks, so it runs last and
+    # the timing includes compression
+    endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    metrics.end_request(request.method, endpoint, response.status_code)
+    return response
+
 @app.before_request
 def ensure_user():
     if request.path.startswith("/api/"):
-        if request.path == "/api/health" or request.path == "/api/users/register" or request.path == "/api/sync-status":
+        if request.path in ("/api/health", "/api/users/register", "/api/sync-status", "/api/metrics"):
             return
         uid = request.headers.get("X-User")
         if not uid or not uid.isdigit():
             return jsonify({"error":{"code":"UNAUTHORIZED","message":"X-User header (numeric) required"}}), 401
 
+read_limiter = RateLimiter(RATE_LIMIT_READ, RATE_LIMIT_READ_BURST)
+write_limiter = RateLimiter(RATE_LIMIT_WRITE, RATE_LIMIT_WRITE_BURST)
+connect_limiter = RateLimiter(RATE_LIMIT_CONNECT, RATE_LIMIT_CONNECT_BURST)
+request_slots = ConcurrencyLimiter(MAX_CONCURRENT_REQUESTS, MAX_QUEUED_REQUESTS, REQUEST_QUEUE_TIMEOUT)
+
+UNLIMITED_PATHS = ("/api/health", "/api/metrics", "/api/sync-status")
+
+@app.before_request
+def admit_request():
+    # Runs after ensure_user, so X-User is either absent (registration) or numeric
+    if not request.path.startswith("/api/") or request.path in UNLIMITED_PATHS:
+        return
+    uid = request.headers.get("X-User")
+    if uid:
+        limiter = read_limiter if request.method in ("GET", "HEAD") else write_limiter
+        wait = limiter.acquire(int(uid))
+        if wait:
+            resp = jsonify({"error": {"code": "RATE_LIMITED", "message": "Too many requests, please slow down"}})
+            resp.status_code = 429
+            resp.headers["Retry-After"] = retry_after_header(wait)
+            return resp
+    if not request_slots.acquire():
+        resp = jsonify({"error": {"code": "SERVER_BUSY", "message": "Server is busy, please retry"}})
+        resp.status_code = 503
+        resp.headers["Retry-After"] = "1"
+        return resp
+    g.request_slot = True
+
+@app.teardown_request
+def release_request_slot(exc=None):
+    # Streamed responses keep their slot until the last chunk is sent
+    if g.pop("request_slot", False):
+        request_slots.release()
+
+@app.after_request
+def compress_api_response(response):
+    # File responses (attachments) go out as-is so the server can use sendfile
+    if request.path.startswith("/api/") and not response.direct_passthrough:
+        compress_response(response, request.accept_encodings, COMPRESS_MIN_BYTES)
+    return response
+
+def latest_change_seq(conn, uid):
+    # A single seek on idx_changes_user_seq
+    return conn.execute("SELECT MAX(seq) FROM changes WHERE user_id=?", (uid,)).fetchone()[0] or 0
+
+def listing_etag(uid, kind, latest=None):
+    """Strong ETag for a user's note/folder listing, from the newest change log seq.
+
+    Every note/folder write appends to `changes`, so MAX(seq) moves whenever the
+    listing could differ. Pass `latest` when it was read with the listing.
+    """
+    if latest is None:
+        conn = read_db()
+        try:
+            latest = latest_change_seq(conn, uid)
+        finally:
+            conn.close()
+    key = f"{kind}:{uid}:{latest}:{request.full_path}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+def etag_matches(etag):
+    # Compressed responses carry "<etag>-<encoding>"; both forms validate
+    return any(tag == etag or tag.startswith(etag + "-") for tag in request.if_none_match.as_set())
+
+def not_modified(etag):
+    resp = app.response_class(status=304)
+    resp.set_etag(etag)
+    return resp
+
+def db_busy_response(message):
+    resp = jsonify({"error": {"code": "DB_BUSY", "message": message}})
+    resp.status_code = 503
+    resp.headers["Retry-After"] = "1"
+    return resp
+
+@app.errorhandler(PoolTimeout)
+def handle_pool_timeout(e):
+    return db_busy_response("Server is busy, please retry")
+
+@app.errorhandler(WriteQueueTimeout)
+def handle_write_timeout(e):
+    return db_busy_response("Server is busy, please retry")
+
+class InvalidArgument(Exception):
+    """A malformed query parameter, answered with 400 INVALID_INPUT"""
+
+@app.errorhandler(InvalidArgument)
+def handle_invalid_argument(e):
+    return jsonify({"error": {"code": "INVALID_INPUT", "message": str(e)}}), 400
+
+def int_arg(name, default=None, minimum=None, maximum=None):
+    """Integer query parameter clamped to [minimum, maximum], or default when absent"""
+    value = request.args.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise InvalidArgument(f"{name} must be an integer")
+    if minimum is not None:
+        number = max(minimum, number)
+    if maximum is not None:
+        number = min(maximum, number)
+    return number
+
+@app.errorhandler(sqlite3.OperationalError)
+def handle_db_locked(e):
+    if "locked" not in str(e) and "busy" not in str(e):
+        raise e
+    return db_busy_response("Database is busy, please retry")
+
 @app.get("/api/health")
 def health():
-    return jsonify({"ok": True, "time": now_iso()})
+    return jsonify({"ok": True, "time": now_iso(), "db_pool": get_pool().stats(), "db_read_pool": get_read_pool().stats(),
+                    "group_commit": writer.stats(), "cache": cache.stats(),
+                    "maintenance": maintenance.stats(), "worker": {"index": WORKER_INDEX, "pid": os.getpid()},
+                    "message_bus": bus.stats(), "slow_queries": metrics.recent_slow_queries(),
+                    "admission": {"read": read_limiter.stats(), "write": write_limiter.stats(),
+                                  "connect": connect_limiter.stats(), "concurrency": request_slots.stats()}})
+
+def pool_series(keys):
+    series = {}
+    for name, pool in (("write", get_pool()), ("read", get_read_pool())):
+        stats = pool.stats()
+        series.update({(name, key): stats[key] for key in keys})
+    return series
+
+metrics.add_gauge("mynote_db_pool_connections", "Connection pool size by state", ("pool", "state"),
+                  lambda: pool_series(("max_size", "size", "idle", "in_use")))
+metrics.add_gauge("mynote_db_pool_events_total", "Connection pool lifetime totals", ("pool", "event"),
+                  lambda: pool_series(("checkouts", "waits", "timeouts", "connections_created")), kind="counter")
+metrics.add_gauge("mynote_cache_hits_total", "Read cache hits", ("kind",),
+                  lambda: {(k,): v for k, v in cache.stats()["hits"].items()}, kind="counter")
+metrics.add_gauge("mynote_cache_misses_total", "Read cache misses", ("kind",),
+                  lambda: {(k,): v for k, v in cache.stats()["misses"].items()}, kind="counter")
+metrics.add_gauge("mynote_cache_entries", "Entries held by the read cache", (),
+                  lambda: {(): cache.stats()["entries"]})
+metrics.add_gauge("mynote_maintenance_runs_total", "Maintenance job runs", ("job",),
+                  lambda: {(name,): job.runs for name, job in maintenance.jobs.items()}, kind="counter")
+metrics.add_gauge("mynote_maintenance_failures_total", "Maintenance job runs that raised", ("job",),
+                  lambda: {(name,): job.failures for name, job in maintenance.jobs.items()}, kind="counter")
+metrics.add_gauge("mynote_bus_messages_total", "Messages published to / received from other workers", ("direction",),
+                  lambda: {(k,): bus.stats().get(k, 0) for k in ("published", "received")}, kind="counter")
+
+def rate_limited_by_user():
+    series = {}
+    for kind, limiter in (("read", read_limiter), ("write", write_limiter), ("connect", connect_limiter)):
+        for user, n in limiter.stats()["top_limited"].items():
+            series[(kind, user)] = n
+    return series
+
+metrics.add_gauge("mynote_rate_limited_total", "Requests refused by the per-user rate limits", ("kind",),
+                  lambda: {(kind,): limiter.limited for kind, limiter in
+                           (("read", read_limiter), ("write", write_limiter), ("connect", connect_limiter))},
+                  kind="counter")
+metrics.add_gauge("mynote_rate_limited_user_total", "Refused requests for the most limited users", ("kind", "user"),
+                  rate_limited_by_user, kind="counter")
+metrics.add_gauge("mynote_request_slots", "Concurrent API requests admitted and waiting", ("state",),
+                  lambda: {(k,): request_slots.stats()[k] for k in ("active", "queued")})
+metrics.add_gauge("mynote_request_slot_rejections_total", "API requests turned away by the concurrency cap", ("reason",),
+                  lambda: {(k,): request_slots.stats()[k] for k in ("rejected", "timeouts")}, kind="counter")
+metrics.add_gauge("mynote_realtime_pending_rooms", "Rooms with buffered note changes", (),
+                  lambda: {(): realtime.stats()["pending_rooms"]})
+
+@app.get("/api/metrics")
+def get_metrics():
+    """Prometheus text exposition of request, SQL, pool and realtime metrics"""
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
 @app.get("/api/sync-status")
 def get_sync_status():
     """Get real-time sync status JSON"""
     try:
-        sync_file = os.path.join(os.path.dirname(__file__), "sync_status.json")
-        if os.path.exists(sync_file):
-            with open(sync_file, 'r') as f:
-                return json.load(f)
-        else:
-            return jsonify({"error": "Sync status file not found"}), 404
+        return jsonify(get_sync_tracker().snapshot())
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+NOTES_PAGE_MAX = 1000
+
+def encode_cursor(updated_ms, note_id):
+    """Opaque continuation token for the (updated_ms, id) keyset"""
+    raw = json.dumps([updated_ms, note_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        updated_ms, note_id = json.loads(raw)
+        if isinstance(updated_ms, str):
+            updated_ms = to_ms(updated_ms)  # cursors issued before updated_ms carried updated_at
+        if not isinstance(updated_ms, int) or not isinstance(note_id, int):
+            return None
+        return updated_ms, note_id
+    except (ValueError, TypeError):
+        return None
+
+NOTE_COLUMNS = f"id as remote_id, title, {content_sql('notes')} AS content, folder_id, is_favorite, is_deleted, updated_at, updated_ms, version"
+NOTE_LAYOUT = RowLayout("remote_id", "title", "content", "folder_id", "is_favorite", "is_deleted", "updated_at", "updated_ms",
+                        "version")
+NOTE_UPDATED_MS, NOTE_ID = NOTE_LAYOUT.index["updated_ms"], NOTE_LAYOUT.index["remote_id"]
+STREAM_FETCH_ROWS = 200
+
+def notes_query(uid, since_ms=None, position=None, limit=None):
+    """SELECT for a user's notes in (updated_ms, id) order, after a cursor position or timestamp"""
+    where, params = ["user_id=?"], [uid]
+    if position:
+        where.append("(updated_ms, id) > (?, ?)")
+        params += [position[0], position[1]]
+    elif since_ms is not None:
+        where.append("updated_ms > ?")
+        params.append(since_ms)
+    sql = f"SELECT {NOTE_COLUMNS} FROM notes WHERE {' AND '.join(where)} ORDER BY updated_ms ASC, id ASC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return sql, params
+
+def wants_ndjson():
+    return request.args.get("stream") in ("1", "true") or \
+        "application/x-ndjson" in request.headers.get("Accept", "")
+
+def stream_notes(sql, params):
+    """NDJSON body: one note per line, then a trailing server_now/next_cursor record"""
+    # Taken before reading so a client bookmarking it re-pulls rows changed mid-stream
+    server_now = now_iso()
+
+    def generate():
+        conn = read_db()
+        try:
+            c = conn.cursor()
+            c.row_factory = None  # plain tuples, encoded through NOTE_LAYOUT
+            c.execute(sql, params)
+            NOTE_LAYOUT.check(c.description)
+            last = None
+            while True:
+                rows = c.fetchmany(STREAM_FETCH_ROWS)
+                if not rows:
+                    break
+                yield NOTE_LAYOUT.encode_ndjson(rows)
+                last = rows[-1]
+            next_cursor = encode_cursor(last[NOTE_UPDATED_MS], last[NOTE_ID]) if last else None
+            yield dumps({"server_now": server_now, "next_cursor": next_cursor}) + b"\n"
+        finally:
+            conn.close()
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
 @app.get("/api/notes")
 def list_notes():
     uid = int(request.headers.get("X-User", "0"))
     since = request.args.get("updated_after")
-    limit = int(request.args.get("limit", "500"))
-    conn = db(); c = conn.cursor()
-    if since:
-        c.execute("""SELECT id as remote_id, title, content, folder_id, is_favorite, is_deleted, updated_at, version
-                     FROM notes WHERE user_id=? AND updated_at > ?
-                     ORDER BY updated_at ASC LIMIT ?""", (uid, since, limit))
+    since_ms = to_ms(since) if since else None
+    if since and since_ms is None:
+        return jsonify({"error": {"code": "INVALID_INPUT", "message": "updated_after must be an ISO 8601 timestamp"}}), 400
+    cursor = request.args.get("cursor")
+    position = None
+    if cursor:
+        position = decode_cursor(cursor)
+        if position is None:
+            return jsonify({"error": {"code": "INVALID_CURSOR", "message": "cursor is malformed"}}), 400
+
+    ndjson = wants_ndjson()
+    if ndjson:
+        # Full pulls stream every matching row unless a limit is given
+        limit = int_arg("limit", minimum=1)
+    else:
+        limit = int_arg("limit", 500, 1, NOTES_PAGE_MAX)
+
+    # JSON and NDJSON are different representations of the same URL (the
+    # Accept header picks one), so they get different ETags and Vary: Accept
+    etag = listing_etag(uid, "notes-ndjson" if ndjson else "notes")
+    if etag_matches(etag):
+        resp = not_modified(etag)
+        resp.vary.add("Accept")
+        return resp
+
+    if ndjson:
+        resp = stream_notes(*notes_query(uid, since_ms, position, limit))
+        resp.set_etag(etag)
+        resp.vary.add("Accept")
+        return resp
+
+    # Keyset pagination over (updated_ms, id): every page is one seek on
+    # idx_notes_user_updated_ms, and rows sharing a timestamp are never skipped.
+    # One extra row is fetched to learn whether another page exists.
+    conn = read_db(); c = conn.cursor()
+    c.row_factory = None
+    c.execute(*notes_query(uid, since_ms, position, limit + 1))
+    NOTE_LAYOUT.check(c.description)
+    # Rows are encoded a batch at a time into the body, never built as dicts all at once
+    body = bytearray(b'{"items":')
+    _, last, has_more = NOTE_LAYOUT.write_array(body, c, limit, STREAM_FETCH_ROWS)
+    conn.close()
+    # The cursor after the last row also serves as a resume point for the next sync
+    next_cursor = encode_cursor(last[NOTE_UPDATED_MS], last[NOTE_ID]) if last else cursor
+    body += json_object_tail({"server_now": now_iso(), "next_cursor": next_cursor, "has_more": has_more})
+    resp = Response(bytes(body), mimetype="application/json")
+    resp.set_etag(etag)
+    resp.vary.add("Accept")
+    return resp
+
+SEARCH_MAX_RESULTS = 200
+
+def fts_match_query(q):
+    """Turn free text into an FTS5 query: every term must match, as a prefix"""
+    terms = [t for t in q.split() if t]
+    return " ".join('"' + t.replace('"', '""') + '"*' for t in terms)
+
+@app.get("/api/notes/search")
+def search_notes():
+    """Full-text search over the user's notes (BM25 ranked, with highlighted snippets)"""
+    uid = int(request.headers.get("X-User", "0"))
+    q = (request.args.get("q") or "").strip()
+    if not q:
+        return jsonify({"error": {"code": "INVALID_INPUT", "message": "q is required"}}), 400
+    limit = int_arg("limit", 50, 1, SEARCH_MAX_RESULTS)
+    offset = int_arg("offset", 0, 0)
+
+    # Same filters as the client's searchNotes()
+    where, params = ["n.user_id = ?"], [uid]
+    if request.args.get("include_deleted") not in ("1", "true"):
+        where.append("n.is_deleted = 0")
+    if request.args.get("favorites_only") in ("1", "true"):
+        where.append("n.is_favorite = 1")
+    folder = request.args.get("folder_id")
+    if folder in ("null", "none"):
+        where.append("n.folder_id IS NULL")
+    elif folder is not None and folder.isdigit():
+        where.append("n.folder_id = ?")
+        params.append(int(folder))
+
+    sort = request.args.get("sort", "rank")
+    order_by = {
+        "updated_desc": "n.updated_ms DESC",
+        "title_asc": "LOWER(n.title) ASC, n.updated_ms DESC",
+        "favorite_first": "n.is_favorite DESC, score ASC",
+    }.get(sort, "score ASC")
+
+    conn = read_db(); c = conn.cursor()
+    if FTS_AVAILABLE:
+        # bm25() is lower-is-better; title matches weigh 10x more than body matches
+        c.execute(f"""SELECT n.id as remote_id, n.title, n.folder_id, n.is_favorite, n.is_deleted, n.updated_at, n.version,
+                             bm25(notes_fts, 10.0, 1.0) AS score,
+                             highlight(notes_fts, 0, '<mark>', '</mark>') AS title_highlight,
+                             snippet(notes_fts, 1, '<mark>', '</mark>', '…', 16) AS snippet
+                      FROM notes_fts JOIN notes n ON n.id = notes_fts.rowid
+                      WHERE notes_fts MATCH ? AND {' AND '.join(where)}
+                      ORDER BY {order_by} LIMIT ? OFFSET ?""",
+                  (fts_match_query(q), *params, limit, offset))
     else:
-        c.execute("""SELECT id as remote_id, title, content, folder_id, is_favorite, is_deleted, updated_at, version
-                     FROM notes WHERE user_id=? ORDER BY updated_at ASC LIMIT ?""", (uid, limit))
+        for t in q.split():
+            where.append(f"(n.title LIKE ? OR {content_sql('n')} LIKE ?)")
+            params += [f"%{t}%", f"%{t}%"]
+        c.execute(f"""SELECT n.id as remote_id, n.title, n.folder_id, n.is_favorite, n.is_deleted, n.updated_at, n.version,
+                             0 AS score, n.title AS title_highlight, substr({content_sql('n')}, 1, 120) AS snippet
+                      FROM notes n WHERE {' AND '.join(where)}
+                      ORDER BY {order_by.replace('score ASC', 'n.updated_ms DESC')} LIMIT ? OFFSET ?""",
+                  (*params, limit, offset))
     rows = [dict(r) for r in c.fetchall()]
     conn.close()
-    return jsonify({ "items": rows, "server_now": now_iso() })
+    return jsonify({"items": rows, "fts": FTS_AVAILABLE})
+
+def note_cache_key(remote_id):
+    # Clients send ids as numbers or numeric strings; the cache is keyed by int
+    try:
+        return int(remote_id)
+    except (TypeError, ValueError):
+        return None
 
 @app.post("/api/notes/upsert")
 def upsert_note():
@@ -268,47 +687,61 @@ def upsert_note():
     folder_id = data.get("folder_id")
     is_fav = 1 if data.get("is_favorite") else 0
     is_del = 1 if data.get("is_deleted") else 0
-    updated_at = data.get("updated_at") or now_iso()
+    stamp = client_timestamp(data.get("updated_at") or now_iso())
+    if stamp is None:
+        return jsonify({"error": {"code": "INVALID_INPUT", "message": "updated_at must be an ISO 8601 timestamp or epoch milliseconds"}}), 400
+    updated_at, updated_ms = stamp
     remote_id = data.get("id")
     version = int(data.get("version") or 1)
 
-    conn = db(); c = conn.cursor()
-    if remote_id:
-        c.execute("SELECT * FROM notes WHERE id=? AND user_id=?", (remote_id, uid))
-        row = c.fetchone()
-        if row:
-            if (row["updated_at"] or "") < updated_at:
-                c.execute("""UPDATE notes SET title=?, content=?, folder_id=?, is_favorite=?, is_deleted=?,
-                             updated_at=?, version=version+1 WHERE id=? AND user_id=?""",
-                          (title, content, folder_id, is_fav, is_del, updated_at, remote_id, uid))
-                conn.commit()
-                c.execute("SELECT version, updated_at FROM notes WHERE id=?", (remote_id,))
-                rr = c.fetchone()
-                conn.close()
-                # ← Push: user's devices receive "updated"
-                socketio.emit('note_updated', {'id': int(remote_id), 'title': title, 'user_id': uid, 'version': rr["version"]}, to=f"user:{uid}")
-                
-                # Update sync status
-                update_sync_status("note_updates", {
-                    "note_id": int(remote_id),
-                    "user_id": uid,
-                    "title": title,
-                    "version": rr["version"]
-                })
-                
-                return jsonify({"id": remote_id, "version": rr["version"], "updated_at": rr["updated_at"]})
-            else:
-                conn.close()
-                return jsonify({"id": remote_id, "version": row["version"], "updated_at": row["updated_at"]})
-        # If this id doesn't exist under current username, fallthrough to create new
-
-    c.execute("""INSERT INTO notes (user_id,title,content,folder_id,is_favorite,is_deleted,updated_at,version)
-                 VALUES (?,?,?,?,?,?,?,?)""",
-              (uid, title, content, folder_id, is_fav, is_del, updated_at, version))
-    new_id = c.lastrowid
-    conn.commit()
-    conn.close()
-    socketio.emit('note_created', {'id': int(new_id), 'title': title, 'user_id': uid}, to=f"user:{uid}")  # ← Send note_created for new notes
+    def apply(c):
+        if remote_id:
+            # Runs on the writer thread, which is the only place note metadata is
+            # cached, so the cached row is exactly what this transaction sees
+            row = cache.get_note(uid, note_cache_key(remote_id))
+            if row is None:
+                c.execute("SELECT id, updated_at, updated_ms, version FROM notes WHERE id=? AND user_id=?", (remote_id, uid))
+                row = c.fetchone()
+                row = dict(row) if row else None
+            if row:
+                if (row["updated_ms"] or 0) < updated_ms:
+                    c.execute("""UPDATE notes SET title=?, content=?, body_hash=?, folder_id=?, is_favorite=?, is_deleted=?,
+                                 updated_at=?, updated_ms=?, version=version+1 WHERE id=? AND user_id=?""",
+                              (title, *bodies.prepare(c, content), folder_id, is_fav, is_del, updated_at, updated_ms,
+                               remote_id, uid))
+                    c.execute("SELECT id, version, updated_at, updated_ms FROM notes WHERE id=?", (remote_id,))
+                    row = dict(c.fetchone())
+                    cache.put_note(uid, row["id"], row)
+                    return "updated", row
+                cache.put_note(uid, row["id"], row)
+                return "stale", row
+            # If this id doesn't exist under current username, fallthrough to create new
+        c.execute("""INSERT INTO notes (user_id,title,content,body_hash,folder_id,is_favorite,is_deleted,updated_at,updated_ms,version)
+                     VALUES (?,?,?,?,?,?,?,?,?,?)""",
+                  (uid, title, *bodies.prepare(c, content), folder_id, is_fav, is_del, updated_at, updated_ms, version))
+        cache.put_note(uid, c.lastrowid, {"id": c.lastrowid, "updated_at": updated_at, "updated_ms": updated_ms,
+                                          "version": version})
+        return "created", c.lastrowid
+
+    outcome, rr = write(apply)
+    if outcome == "updated":
+        # ← Push: user's devices receive "updated" (coalesced into notes_changed)
+        realtime.note_changed(uid, int(remote_id), "updated")
+        
+        # Update sync status
+        update_sync_status("note_updates", {
+            "note_id": int(remote_id),
+            "user_id": uid,
+            "title": title,
+            "version": rr["version"]
+        })
+        
+        return jsonify({"id": remote_id, "version": rr["version"], "updated_at": rr["updated_at"]})
+    if outcome == "stale":
+        return jsonify({"id": remote_id, "version": rr["version"], "updated_at": rr["updated_at"]})
+
+    new_id = rr
+    realtime.note_changed(uid, int(new_id), "created")  # ← Push new notes (coalesced into notes_changed)
     
     # Update sync status
     update_sync_status("note_creations", {
@@ -316,26 +749,354 @@ def upsert_note():
         "user_id": uid,
         "title": title,
         "version": version
-    })
+    }, notes=1)
     
     return jsonify({"id": new_id, "version": version, "updated_at": updated_at})
 
+BATCH_MAX_ITEMS = int(os.environ.get("MYNOTE_BATCH_MAX_ITEMS", "500"))
+SQL_IN_CHUNK = 500  # stay well below SQLite's bound-parameter limit
+
+def parse_note_payload(data):
+    """Normalise one client note payload the same way upsert_note does (None if updated_at is invalid)"""
+    stamp = client_timestamp(data.get("updated_at") or now_iso())
+    if stamp is None:
+        return None
+    remote_id = data.get("id")
+    try:
+        remote_id = int(remote_id) if remote_id else None
+    except (TypeError, ValueError):
+        remote_id = None  # unknown id: created as a new note, like upsert_note
+    return {
+        "id": remote_id,
+        "title": data.get("title",""),
+        "content": data.get("content",""),
+        "folder_id": data.get("folder_id"),
+        "is_favorite": 1 if data.get("is_favorite") else 0,
+        "is_deleted": 1 if data.get("is_deleted") else 0,
+        "updated_at": stamp[0],
+        "updated_ms": stamp[1],
+        "version": int(data.get("version") or 1),
+    }
+
+def read_batch_items(data, key):
+    """Return the list under `key` (or a bare JSON list), or None if invalid"""
+    items = data.get(key) if isinstance(data, dict) else data
+    if not isinstance(items, list) or len(items) > BATCH_MAX_ITEMS:
+        return None
+    return items
+
+@app.post("/api/notes/batch_upsert")
+def batch_upsert_notes():
+    """Create/update many notes in one transaction (same last-writer-wins rule as upsert_note)"""
+    uid = int(request.headers.get("X-User", "0"))
+    items = read_batch_items(request.get_json(force=True), "items")
+    if items is None or not all(isinstance(it, dict) for it in items):
+        return jsonify({"error": {"code": "INVALID_INPUT", "message": f"items must be a list of at most {BATCH_MAX_ITEMS} notes"}}), 400
+    notes = [parse_note_payload(it) for it in items]
+    invalid = [i for i, n in enumerate(notes) if n is None]
+    if invalid:
+        return jsonify({"error": {"code": "INVALID_INPUT", "message": f"items[{invalid[0]}].updated_at must be an ISO 8601 timestamp or epoch milliseconds"}}), 400
+
+    conn = db(); c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")  # read current versions and write under one lock
+
+    # Current state of every referenced note, fetched in a few IN (...) queries
+    ids = sorted({n["id"] for n in notes if n["id"]})
+    # Drop cached metadata while holding the write lock, so the group-commit
+    # writer cannot read (or re-cache) it until this transaction is done
+    cache.forget_notes(uid, [k for k in map(note_cache_key, ids) if k is not None])
+    existing = {}
+    for i in range(0, len(ids), SQL_IN_CHUNK):
+        chunk = ids[i:i + SQL_IN_CHUNK]
+        c.execute(f"SELECT id, updated_at, updated_ms, version FROM notes WHERE user_id=? AND id IN ({','.join('?' * len(chunk))})",
+                  (uid, *chunk))
+        for row in c.fetchall():
+            existing[row["id"]] = {"updated_at": row["updated_at"], "updated_ms": row["updated_ms"] or 0,
+                                   "version": row["version"]}
+
+    results = [None] * len(notes)
+    updates = []
+    created, updated = [], []
+    for i, n in enumerate(notes):
+        cur = existing.get(n["id"])
+        if cur is None:
+            c.execute("""INSERT INTO notes (user_id,title,content,body_hash,folder_id,is_favorite,is_deleted,updated_at,updated_ms,version)
+                         VALUES (?,?,?,?,?,?,?,?,?,?)""",
+                      (uid, n["title"], *bodies.prepare(c, n["content"]), n["folder_id"], n["is_favorite"], n["is_deleted"],
+                       n["updated_at"], n["updated_ms"], n["version"]))
+            created.append(c.lastrowid)
+            results[i] = {"id": c.lastrowid, "version": n["version"], "updated_at": n["updated_at"], "skipped": False}
+        elif cur["updated_ms"] < n["updated_ms"]:
+            updates.append((n["title"], *bodies.prepare(c, n["content"]), n["folder_id"], n["is_favorite"], n["is_deleted"],
+                            n["updated_at"], n["updated_ms"], n["id"], uid))
+            # Later items in the same batch compare against this write
+            cur["updated_at"], cur["updated_ms"] = n["updated_at"], n["updated_ms"]
+            cur["version"] += 1
+            updated.append(n["id"])
+            results[i] = {"id": n["id"], "version": cur["version"], "updated_at": n["updated_at"], "skipped": False}
+        else:
+            results[i] = {"id": n["id"], "version": cur["version"], "updated_at": cur["updated_at"], "skipped": True}
+
+    if updates:
+        c.executemany("""UPDATE notes SET title=?, content=?, body_hash=?, folder_id=?, is_favorite=?, is_deleted=?,
+                         updated_at=?, updated_ms=?, version=version+1 WHERE id=? AND user_id=?""", updates)
+    conn.commit()
+    conn.close()
+
+    if created or updated:
+        realtime.notes_changed(uid, created, "created")
+        realtime.notes_changed(uid, updated, "updated")
+        update_sync_status("note_batch_upserts", {
+            "user_id": uid,
+            "created": len(created),
+            "updated": len(updated),
+            "skipped": len(notes) - len(created) - len(updated)
+        }, notes=len(created))
+
+    return jsonify({"items": results})
+
 @app.delete("/api/notes/<int:rid>")
 def delete_note(rid: int):
     uid = int(request.headers.get("X-User", "0"))
-    conn = db(); c = conn.cursor()
-    c.execute("DELETE FROM notes WHERE id=? AND user_id=?", (rid, uid))
-    conn.commit(); conn.close()
-    socketio.emit('note_deleted', {'id': int(rid), 'user_id': uid}, to=f"user:{uid}")  # ← Delete push
+    def apply(c):
+        c.execute("DELETE FROM notes WHERE id=? AND user_id=?", (rid, uid))
+        cache.forget_notes(uid, [rid])
+        return c.rowcount
+
+    removed = write(apply)
+    if removed:
+        realtime.note_changed(uid, int(rid), "deleted")  # ← Delete push
     
     # Update sync status
     update_sync_status("note_deletions", {
         "note_id": int(rid),
         "user_id": uid
-    })
+    }, notes=-removed)
     
     return jsonify({"ok": True}), 200
 
+@app.post("/api/notes/batch_delete")
+def batch_delete_notes():
+    """Delete many notes in one transaction and report which ids were removed"""
+    uid = int(request.headers.get("X-User", "0"))
+    ids = read_batch_items(request.get_json(force=True), "ids")
+    # JSON integers SQLite can bind; int() would also take true, 1.9 or "7"
+    if ids is None or not all(isinstance(i, int) and not isinstance(i, bool) and -2**63 <= i < 2**63 for i in ids):
+        return jsonify({"error": {"code": "INVALID_INPUT", "message": f"ids must be a list of at most {BATCH_MAX_ITEMS} note ids"}}), 400
+    ids = sorted(set(ids))
+
+    conn = db(); c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
+    cache.forget_notes(uid, ids)  # under the write lock, as in batch_upsert_notes
+    deleted = []
+    for i in range(0, len(ids), SQL_IN_CHUNK):
+        chunk = ids[i:i + SQL_IN_CHUNK]
+        marks = ','.join('?' * len(chunk))
+        c.execute(f"SELECT id FROM notes WHERE user_id=? AND id IN ({marks})", (uid, *chunk))
+        found = [row["id"] for row in c.fetchall()]
+        if found:
+            c.execute(f"DELETE FROM notes WHERE user_id=? AND id IN ({','.join('?' * len(found))})", (uid, *found))
+            deleted.extend(found)
+    conn.commit(); conn.close()
+
+    if deleted:
+        realtime.notes_changed(uid, deleted, "deleted")
+        update_sync_status("note_batch_deletions", {
+            "user_id": uid,
+            "deleted": len(deleted)
+        }, notes=-len(deleted))
+
+    # Ids that were not found are already gone (or never belonged to this user)
+    return jsonify({"deleted": deleted, "not_found": sorted(set(ids) - set(deleted))}), 200
+
+CHANGES_PAGE_MAX = 5000
+CHANGES_COMPACT_INTERVAL = float(os.environ.get("MYNOTE_CHANGES_COMPACT_INTERVAL", "600"))
+CHANGES_COMPACT_BATCH = 5000
+
+@app.get("/api/changes")
+def list_changes():
+    """Change feed: the user's note/folder changes with seq > since_seq, oldest first"""
+    uid = int(request.headers.get("X-User", "0"))
+    since_seq = int_arg("since_seq", 0)
+    if since_seq < 0:
+        return jsonify({"error": {"code": "INVALID_INPUT", "message": "since_seq must be 0 or more"}}), 400
+    limit = int_arg("limit", 1000, 1, CHANGES_PAGE_MAX)
+    conn = read_db(); c = conn.cursor()
+    c.execute("BEGIN")  # the page and the caught-up MAX(seq) come from one snapshot
+    c.execute("""SELECT seq, entity, entity_id AS id, op, version FROM changes
+                 WHERE user_id=? AND seq > ? ORDER BY seq ASC LIMIT ?""", (uid, since_seq, limit + 1))
+    rows = [dict(r) for r in c.fetchall()]
+    if len(rows) <= limit:
+        # Caught up: report the newest seq so an idle client can bookmark it
+        c.execute("SELECT MAX(seq) FROM changes WHERE user_id=?", (uid,))
+        latest = c.fetchone()[0]
+    else:
+        latest = None
+    conn.close()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    last_seq = rows[-1]["seq"] if rows else max(since_seq, latest or 0)
+    return jsonify({"changes": rows, "last_seq": last_seq, "has_more": has_more})
+
+def compact_changes(batch_size=CHANGES_COMPACT_BATCH, budget=None):
+    """Drop change rows superseded by a newer change to the same entity; returns rows removed"""
+    removed = 0
+    while True:
+        conn = db()
+        try:
+            c = conn.cursor()
+            c.execute("""DELETE FROM changes WHERE seq IN (
+                           SELECT c1.seq FROM changes c1
+                           WHERE EXISTS (SELECT 1 FROM changes c2
+                                         WHERE c2.user_id = c1.user_id AND c2.entity = c1.entity
+                                           AND c2.entity_id = c1.entity_id AND c2.seq > c1.seq)
+                           LIMIT ?)""", (batch_size,))
+            deleted = c.rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        removed += deleted
+        # Short transactions so live writers are never blocked for long
+        if deleted < batch_size or (budget is not None and budget.expired()):
+            return removed
+
+# Background maintenance (see maintenance.py). Each job runs every
+# MYNOTE_MAINT_<JOB>_INTERVAL seconds (0 disables it) and stops after
+# MYNOTE_MAINT_<JOB>_BUDGET_MS, falling back to MYNOTE_MAINT_BUDGET_MS.
+MAINT_BUDGET_MS = float(os.environ.get("MYNOTE_MAINT_BUDGET_MS", "200"))
+TOMBSTONE_TTL_DAYS = float(os.environ.get("MYNOTE_TOMBSTONE_TTL_DAYS", "30"))
+SYNC_QUEUE_TTL_DAYS = float(os.environ.get("MYNOTE_SYNC_QUEUE_TTL_DAYS", "7"))
+MAINT_BATCH = int(os.environ.get("MYNOTE_MAINT_BATCH", "500"))
+VACUUM_STEP_PAGES = int(os.environ.get("MYNOTE_VACUUM_STEP_PAGES", "256"))
+ANALYSIS_LIMIT = int(os.environ.get("MYNOTE_ANALYSIS_LIMIT", "1000"))
+
+def maint_setting(job, default_interval):
+    key = f"MYNOTE_MAINT_{job.upper()}"
+    interval = float(os.environ.get(f"{key}_INTERVAL", default_interval))
+    budget_ms = float(os.environ.get(f"{key}_BUDGET_MS", MAINT_BUDGET_MS))
+    return interval, budget_ms / 1000
+
+def purge_tombstones(budget):
+    """Hard-delete soft-deleted notes older than TOMBSTONE_TTL_DAYS, MAINT_BATCH per write"""
+    cutoff_ms = now_ms() - int(TOMBSTONE_TTL_DAYS * 86400000)
+    def apply(c):
+        # deleted_at is not set by every client; the tombstone's updated_ms is when it was deleted.
+        # Same expression as idx_notes_tombstones_ms, so the scan uses it
+        c.execute(f"""SELECT id, user_id FROM notes
+                      WHERE is_deleted = 1 AND {TOMBSTONE_AGE_SQL} < ? LIMIT ?""", (cutoff_ms, MAINT_BATCH))
+        rows = c.fetchall()
+        by_user = {}
+        for row in rows:
+            by_user.setdefault(row["user_id"], []).append(row["id"])
+        for user_id, ids in by_user.items():
+            cache.forget_notes(user_id, ids)
+            for i in range(0, len(ids), SQL_IN_CHUNK):
+                chunk = ids[i:i + SQL_IN_CHUNK]
+                c.execute(f"DELETE FROM notes WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+        return len(rows)
+
+    purged = 0
+    while True:
+        # Through the writer so the deletes are ordered with live note writes and the cache
+        removed = write(apply)
+        purged += removed
+        if removed < MAINT_BATCH or budget.expired():
+            break
+    if purged:
+        update_sync_status("tombstone_purge", {"purged": purged}, notes=-purged)
+    return {"purged": purged}
+
+def trim_sync_queue(budget):
+    """Delete sync_queue rows older than SYNC_QUEUE_TTL_DAYS"""
+    removed = 0
+    conn = db()
+    try:
+        c = conn.cursor()
+        while not budget.expired():
+            # Oldest rows have the lowest ids, so this stops at the first fresh row
+            c.execute("""DELETE FROM sync_queue WHERE id IN (
+                           SELECT id FROM sync_queue WHERE created_at < datetime('now', ?) ORDER BY id LIMIT ?)""",
+                      (f"-{SYNC_QUEUE_TTL_DAYS} days", MAINT_BATCH))
+            deleted = c.rowcount
+            conn.commit()
+            removed += deleted
+            if deleted < MAINT_BATCH:
+                break
+    finally:
+        conn.close()
+    return {"removed": removed}
+
+def incremental_vacuum(budget):
+    """Return free pages to the filesystem, VACUUM_STEP_PAGES per step"""
+    conn = db()
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return {"skipped": "auto_vacuum is not INCREMENTAL (set MYNOTE_ENABLE_INCREMENTAL_VACUUM=1 and restart)"}
+        freed = 0
+        while not budget.expired():
+            free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if free == 0:
+                break
+            with budget.interruptible(conn):
+                try:
+                    conn.execute(f"PRAGMA incremental_vacuum({min(free, VACUUM_STEP_PAGES)})").fetchall()
+                except sqlite3.OperationalError as e:
+                    if not is_interrupt(e):
+                        raise
+                    break
+            freed += free - conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return {"pages_freed": freed, "free_pages": conn.execute("PRAGMA freelist_count").fetchone()[0]}
+    finally:
+        conn.close()
+
+def optimize_db(budget):
+    """Refresh planner statistics: ANALYZE once, then PRAGMA optimize (both sampled via analysis_limit)"""
+    conn = db()
+    try:
+        conn.execute(f"PRAGMA analysis_limit={ANALYSIS_LIMIT}")
+        analyzed = conn.execute("SELECT 1 FROM sqlite_master WHERE name='sqlite_stat1'").fetchone() is not None
+        with budget.interruptible(conn):
+            try:
+                conn.execute("PRAGMA optimize" if analyzed else "ANALYZE").fetchall()
+            except sqlite3.OperationalError as e:
+                if not is_interrupt(e):
+                    raise
+                return {"interrupted": True}
+        conn.commit()
+        return {"ran": "optimize" if analyzed else "analyze"}
+    finally:
+        conn.close()
+
+def purge_note_bodies(budget):
+    conn = db()
+    try:
+        return {"purged": purge_unreferenced_bodies(conn, batch_size=MAINT_BATCH, budget=budget)}
+    finally:
+        conn.close()
+
+def collect_blobs(budget):
+    # Reads on a read-only connection, deletes through write(): holding the
+    # writer connection here would deadlock against a finishing upload
+    conn = read_db()
+    try:
+        blobs_removed, uploads_removed = get_blob_store().collect_garbage(conn, write, grace_seconds=BLOB_GC_GRACE,
+                                                                          budget=budget)
+        return {"blobs": blobs_removed, "uploads": uploads_removed}
+    finally:
+        conn.close()
+
+maintenance = MaintenanceScheduler(default_budget=MAINT_BUDGET_MS / 1000)
+for name, func, default_interval in [
+        ("compact_changes", lambda budget: {"removed": compact_changes(budget=budget)}, CHANGES_COMPACT_INTERVAL),
+        ("purge_tombstones", purge_tombstones, 3600),
+        ("trim_sync_queue", trim_sync_queue, 3600),
+        ("purge_note_bodies", purge_note_bodies, 600),
+        ("collect_blobs", collect_blobs, 600),
+        ("incremental_vacuum", incremental_vacuum, 900),
+        ("optimize", optimize_db, 6 * 3600)]:
+    interval, budget_seconds = maint_setting(name, default_interval)
+    maintenance.add(name, func, interval, budget=budget_seconds)
+
 @app.post("/api/users/register")
 def register_user():
     data = request.get_json(force=True)
@@ -379,23 +1140,42 @@ def register_user():
         "user_id": user_id,
         "username": username,
         "email": email
-    })
+    }, users=1)
     
     return jsonify({"id": user_id, "username": username, "email": email})
 
 # Folder Management API Endpoints
+FOLDER_LAYOUT = RowLayout("id", "name", "created_at", "updated_at")
+
 @app.get("/api/folders")
 def list_folders():
     """Get all folders for the current user"""
     uid = int(request.headers.get("X-User", "0"))
+    conn = read_db()
+    try:
+        c = conn.cursor()
+        c.execute("BEGIN")  # the seq behind the ETag and the rows come from one snapshot
+        latest = latest_change_seq(conn, uid)
+        etag = listing_etag(uid, "folders", latest)
+        if etag_matches(etag):
+            return not_modified(etag)
+
+        # Writers invalidate the cache only after committing, so a cached listing
+        # is served only for the seq it was read at
+        rows = cache.get_folders(uid, latest)
+        if rows is None:
+            generation = cache.folders_generation(uid)
+            c.row_factory = None
+            c.execute("SELECT id, name, created_at, updated_at FROM folders WHERE user_id = ? ORDER BY name", (uid,))
+            FOLDER_LAYOUT.check(c.description)
+            rows = c.fetchall()
+            cache.put_folders(uid, rows, latest, generation)
+    finally:
+        conn.close()
     
-    conn = db()
-    c = conn.cursor()
-    c.execute("SELECT id, name, created_at, updated_at FROM folders WHERE user_id = ? ORDER BY name", (uid,))
-    rows = c.fetchall()
-    conn.close()
-    
-    return jsonify({"items": rows})
+    resp = Response(b'{"items":[' + FOLDER_LAYOUT.encode_array_items(rows) + b"]}", mimetype="application/json")
+    resp.set_etag(etag)
+    return resp
 
 @app.post("/api/folders")
 def create_folder():
@@ -407,29 +1187,30 @@ def create_folder():
     if not name:
         return jsonify({"error": {"code": "INVALID_INPUT", "message": "Folder name is required"}}), 400
     
-    conn = db()
-    c = conn.cursor()
-    
-    # Check if folder name already exists for this user
-    c.execute("SELECT id FROM folders WHERE name = ? AND user_id = ?", (name, uid))
-    if c.fetchone():
-        conn.close()
-        return jsonify({"error": {"code": "FOLDER_EXISTS", "message": "Folder name already exists"}}), 409
-    
-    # Create new folder
     created_at = now_iso()
-    c.execute("INSERT INTO folders (user_id, name, created_at, updated_at) VALUES (?, ?, ?, ?)", 
-              (uid, name, created_at, created_at))
-    folder_id = c.lastrowid
-    conn.commit()
-    conn.close()
+
+    def apply(c):
+        # Check if folder name already exists for this user
+        c.execute("SELECT id FROM folders WHERE name = ? AND user_id = ?", (name, uid))
+        if c.fetchone():
+            return None
+        
+        # Create new folder
+        c.execute("INSERT INTO folders (user_id, name, created_at, updated_at) VALUES (?, ?, ?, ?)", 
+                  (uid, name, created_at, created_at))
+        return c.lastrowid
+
+    folder_id = write(apply)
+    if folder_id is None:
+        return jsonify({"error": {"code": "FOLDER_EXISTS", "message": "Folder name already exists"}}), 409
+    cache.invalidate_folders(uid)
     
     # Update sync status for folder creation
     update_sync_status("folder_creations", {
         "folder_id": folder_id,
         "user_id": uid,
         "name": name
-    })
+    }, folders=1)
     
     # No WebSocket event for folders - notes contain folder_id
     
@@ -445,26 +1226,28 @@ def update_folder(folder_id: int):
     if not name:
         return jsonify({"error": {"code": "INVALID_INPUT", "message": "Folder name is required"}}), 400
     
-    conn = db()
-    c = conn.cursor()
-    
-    # Check if folder exists and belongs to user
-    c.execute("SELECT id FROM folders WHERE id = ? AND user_id = ?", (folder_id, uid))
-    if not c.fetchone():
-        conn.close()
+    def apply(c):
+        # Check if folder exists and belongs to user
+        c.execute("SELECT id FROM folders WHERE id = ? AND user_id = ?", (folder_id, uid))
+        if not c.fetchone():
+            return "not_found"
+        
+        # Check if new name already exists for this user
+        c.execute("SELECT id FROM folders WHERE name = ? AND user_id = ? AND id != ?", (name, uid, folder_id))
+        if c.fetchone():
+            return "exists"
+        
+        # Update folder
+        c.execute("UPDATE folders SET name = ?, updated_at = ? WHERE id = ? AND user_id = ?", 
+                  (name, now_iso(), folder_id, uid))
+        return "updated"
+
+    outcome = write(apply)
+    if outcome == "not_found":
         return jsonify({"error": {"code": "FOLDER_NOT_FOUND", "message": "Folder not found"}}), 404
-    
-    # Check if new name already exists for this user
-    c.execute("SELECT id FROM folders WHERE name = ? AND user_id = ? AND id != ?", (name, uid, folder_id))
-    if c.fetchone():
-        conn.close()
+    if outcome == "exists":
         return jsonify({"error": {"code": "FOLDER_EXISTS", "message": "Folder name already exists"}}), 409
-    
-    # Update folder
-    c.execute("UPDATE folders SET name = ?, updated_at = ? WHERE id = ? AND user_id = ?", 
-              (name, now_iso(), folder_id, uid))
-    conn.commit()
-    conn.close()
+    cache.invalidate_folders(uid)
     
     # Update sync status for folder update
     update_sync_status("folder_updates", {
@@ -482,42 +1265,405 @@ def delete_folder(folder_id: int):
     """Delete a folder"""
     uid = int(request.headers.get("X-User", "0"))
     
-    conn = db()
-    c = conn.cursor()
-    
-    # Check if folder exists and belongs to user
-    c.execute("SELECT id FROM folders WHERE id = ? AND user_id = ?", (folder_id, uid))
-    if not c.fetchone():
-        conn.close()
+    def apply(c):
+        # Check if folder exists and belongs to user
+        c.execute("SELECT id FROM folders WHERE id = ? AND user_id = ?", (folder_id, uid))
+        if not c.fetchone():
+            return False
+        
+        # Move notes to default folder (NULL)
+        c.execute("UPDATE notes SET folder_id = NULL WHERE folder_id = ? AND user_id = ?", (folder_id, uid))
+        
+        # Delete folder
+        c.execute("DELETE FROM folders WHERE id = ? AND user_id = ?", (folder_id, uid))
+        return True
+
+    if not write(apply):
         return jsonify({"error": {"code": "FOLDER_NOT_FOUND", "message": "Folder not found"}}), 404
-    
-    # Move notes to default folder (NULL)
-    c.execute("UPDATE notes SET folder_id = NULL WHERE folder_id = ? AND user_id = ?", (folder_id, uid))
-    
-    # Delete folder
-    c.execute("DELETE FROM folders WHERE id = ? AND user_id = ?", (folder_id, uid))
-    conn.commit()
-    conn.close()
+    cache.invalidate_folders(uid)
     
     # Update sync status for folder deletion
     update_sync_status("folder_deletions", {
         "folder_id": folder_id,
         "user_id": uid
-    })
+    }, folders=-1)
     
     # No WebSocket event for folders - notes contain folder_id
     
     return jsonify({"success": True})
 
+def blob_error(e):
+    resp = jsonify({"error": {"code": e.code, "message": str(e)}, **e.extra})
+    resp.status_code = e.status
+    return resp
+
+@app.errorhandler(BlobError)
+def handle_blob_error(e):
+    return blob_error(e)
+
+def upload_status(upload_id, row):
+    received = get_blob_store().received(upload_id)
+    return {"upload_id": upload_id, "sha256": row["sha256"], "size": row["size"], "received": received,
+            "complete": False, "chunk_max": BLOB_CHUNK_MAX}
+
+def load_upload(upload_id, uid):
+    conn = read_db()
+    try:
+        row = conn.execute("SELECT * FROM blob_uploads WHERE id=? AND user_id=?", (upload_id, uid)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        raise BlobError("UPLOAD_NOT_FOUND", "Upload not found", 404)
+    return row
+
+@app.post("/api/blobs/uploads")
+def start_blob_upload():
+    """Start (or resume) an upload of the blob with the given sha256 and size"""
+    uid = int(request.headers.get("X-User", "0"))
+    data = request.get_json(force=True)
+    blob_hash = str(data.get("sha256", "")).lower()
+    size = data.get("size")
+    content_type = data.get("content_type") or "application/octet-stream"
+    if not HASH_RE.match(blob_hash) or not isinstance(size, int) or size < 0:
+        return jsonify({"error": {"code": "INVALID_INPUT", "message": "sha256 (hex) and size (bytes) are required"}}), 400
+    if size > BLOB_MAX_BYTES:
+        return jsonify({"error": {"code": "BLOB_TOO_LARGE", "message": f"Blobs are limited to {BLOB_MAX_BYTES} bytes"}}), 413
+    upload_id = get_blob_store().new_upload_id()
+
+    def apply(c):
+        # Only the user's own blobs skip the upload, so nobody can probe for other users' files
+        c.execute("SELECT 1 FROM blob_owners WHERE hash=? AND user_id=?", (blob_hash, uid))
+        if c.fetchone():
+            c.execute("UPDATE blobs SET last_used_at=strftime('%Y-%m-%dT%H:%M:%SZ', 'now') WHERE hash=?", (blob_hash,))
+            return None
+        c.execute("SELECT * FROM blob_uploads WHERE user_id=? AND sha256=?", (uid, blob_hash))
+        row = c.fetchone()
+        if row:
+            return dict(row)
+        c.execute("INSERT INTO blob_uploads(id, user_id, sha256, size, content_type) VALUES (?,?,?,?,?)",
+                  (upload_id, uid, blob_hash, size, content_type))
+        return {"id": upload_id, "sha256": blob_hash, "size": size}
+
+    row = write(apply)
+    if row is None:
+        return jsonify({"sha256": blob_hash, "size": size, "complete": True}), 200
+    return jsonify(upload_status(row["id"], row)), 201
+
+@app.get("/api/blobs/uploads/<upload_id>")
+def get_blob_upload(upload_id):
+    """How many bytes of an upload the server has, to resume from"""
+    uid = int(request.headers.get("X-User", "0"))
+    return jsonify(upload_status(upload_id, load_upload(upload_id, uid)))
+
+def parse_content_range(header, size):
+    # "bytes <start>-<end>/<total>"; total must match the declared size
+    m = re.match(r"^bytes (\d+)-(\d+)/(\d+|\*)$", header or "")
+    if not m:
+        return None
+    start, end = int(m.group(1)), int(m.group(2))
+    if end < start or (m.group(3) != "*" and int(m.group(3)) != size):
+        return None
+    return start, end - start + 1
+
+@app.put("/api/blobs/uploads/<upload_id>")
+def put_blob_chunk(upload_id):
+    """Append a chunk (Content-Range: bytes start-end/size); completes the upload on the last byte"""
+    uid = int(request.headers.get("X-User", "0"))
+    row = load_upload(upload_id, uid)
+    store = get_blob_store()
+    length = request.content_length
+    if "Content-Range" in request.headers:
+        parsed = parse_content_range(request.headers["Content-Range"], row["size"])
+        if parsed is None or parsed[1] != length:
+            return jsonify({"error": {"code": "INVALID_RANGE", "message": "Content-Range must be bytes start-end/size and match the body"}}), 400
+        offset = parsed[0]
+    else:
+        offset = store.received(upload_id)  # plain append
+    received = store.write_chunk(upload_id, offset, row["size"], request.stream, length)
+    if received < row["size"]:
+        return jsonify(upload_status(upload_id, row)), 202
+
+    blob_hash = row["sha256"]
+
+    def register(c):
+        c.execute("""INSERT INTO blobs(hash, size, content_type) VALUES (?,?,?)
+                     ON CONFLICT(hash) DO UPDATE SET last_used_at=strftime('%Y-%m-%dT%H:%M:%SZ', 'now')""",
+                  (blob_hash, row["size"], row["content_type"]))
+        c.execute("INSERT OR IGNORE INTO blob_owners(hash, user_id) VALUES (?,?)", (blob_hash, uid))
+        c.execute("DELETE FROM blob_uploads WHERE id=?", (upload_id,))
+
+    store.finish(upload_id, blob_hash, lambda: write(register))
+    return jsonify({"sha256": blob_hash, "size": row["size"], "complete": True}), 201
+
+@app.delete("/api/blobs/uploads/<upload_id>")
+def cancel_blob_upload(upload_id):
+    uid = int(request.headers.get("X-User", "0"))
+    load_upload(upload_id, uid)
+    write(lambda c: c.execute("DELETE FROM blob_uploads WHERE id=? AND user_id=?", (upload_id, uid)))
+    get_blob_store().discard_upload(upload_id)
+    return jsonify({"ok": True})
+
+@app.get("/api/blobs/<blob_hash>")
+def get_blob(blob_hash):
+    """Download a blob the user owns; supports Range and conditional requests"""
+    uid = int(request.headers.get("X-User", "0"))
+    if not HASH_RE.match(blob_hash):
+        return jsonify({"error": {"code": "BLOB_NOT_FOUND", "message": "Blob not found"}}), 404
+    conn = read_db()
+    try:
+        row = conn.execute("""SELECT b.content_type FROM blobs b JOIN blob_owners o ON o.hash = b.hash
+                              WHERE b.hash=? AND o.user_id=?""", (blob_hash, uid)).fetchone()
+    finally:
+        conn.close()
+    path = get_blob_store().path(blob_hash)
+    if row is None or not os.path.exists(path):
+        return jsonify({"error": {"code": "BLOB_NOT_FOUND", "message": "Blob not found"}}), 404
+    # send_file hands the open file to the WSGI server's file_wrapper (sendfile
+    # where supported) and answers Range / If-None-Match itself
+    resp = send_file(path, mimetype=row["content_type"], conditional=True, etag=blob_hash, max_age=31536000)
+    resp.cache_control.public = False
+    resp.cache_control.private = True
+    resp.cache_control.immutable = True
+    return resp
+
+@app.get("/api/notes/<int:rid>/blobs")
+def list_note_blobs(rid: int):
+    uid = int(request.headers.get("X-User", "0"))
+    conn = read_db()
+    try:
+        if conn.execute("SELECT 1 FROM notes WHERE id=? AND user_id=?", (rid, uid)).fetchone() is None:
+            return jsonify({"error": {"code": "NOTE_NOT_FOUND", "message": "Note not found"}}), 404
+        rows = conn.execute("""SELECT b.hash AS sha256, b.size, b.content_type FROM note_blobs nb
+                               JOIN blobs b ON b.hash = nb.blob_hash WHERE nb.note_id=? ORDER BY b.hash""", (rid,)).fetchall()
+    finally:
+        conn.close()
+    return jsonify({"items": [dict(r) for r in rows]})
+
+@app.put("/api/notes/<int:rid>/blobs")
+def set_note_blobs(rid: int):
+    """Replace the set of blobs a note references ({"sha256": [...]})"""
+    uid = int(request.headers.get("X-User", "0"))
+    hashes = (request.get_json(force=True) or {}).get("sha256")
+    if not isinstance(hashes, list) or not all(isinstance(h, str) and HASH_RE.match(h) for h in hashes):
+        return jsonify({"error": {"code": "INVALID_INPUT", "message": "sha256 must be a list of blob hashes"}}), 400
+    wanted = set(hashes)
+
+    def apply(c):
+        c.execute("SELECT 1 FROM notes WHERE id=? AND user_id=?", (rid, uid))
+        if c.fetchone() is None:
+            return "not_found", []
+        owned = set()
+        for h in wanted:
+            c.execute("SELECT 1 FROM blob_owners WHERE hash=? AND user_id=?", (h, uid))
+            if c.fetchone():
+                owned.add(h)
+        if owned != wanted:
+            return "missing", sorted(wanted - owned)
+        c.execute("SELECT blob_hash FROM note_blobs WHERE note_id=?", (rid,))
+        current = {r["blob_hash"] for r in c.fetchall()}
+        c.executemany("DELETE FROM note_blobs WHERE note_id=? AND blob_hash=?", [(rid, h) for h in current - wanted])
+        c.executemany("INSERT INTO note_blobs(note_id, blob_hash) VALUES (?,?)", [(rid, h) for h in wanted - current])
+        return "ok", sorted(wanted)
+
+    outcome, hashes = write(apply)
+    if outcome == "not_found":
+        return jsonify({"error": {"code": "NOTE_NOT_FOUND", "message": "Note not found"}}), 404
+    if outcome == "missing":
+        return jsonify({"error": {"code": "BLOB_NOT_FOUND", "message": "Upload these blobs first"}, "missing": hashes}), 409
+    return jsonify({"note_id": rid, "sha256": hashes})
+
+# Bulk export/import (see bulk_transfer.py): everything streams through a
+# cursor or the request body, so memory does not grow with the account size
+IMPORT_CHUNK = int(os.environ.get("MYNOTE_IMPORT_CHUNK", "500"))
+IMPORT_MAX_LINE_BYTES = int(os.environ.get("MYNOTE_IMPORT_MAX_LINE_BYTES", str(16 * 1024 * 1024)))
+
+EXPORT_NOTE_COLUMNS = (f"id, title, {content_sql('notes')} AS content, folder_id, is_favorite, is_deleted, created_at, "
+                       "updated_at, version, (SELECT group_concat(blob_hash) FROM note_blobs WHERE note_id = notes.id) AS blobs")
+
+@app.get("/api/export")
+def export_account():
+    """Stream the user's folders and notes as NDJSON (default) or a zip of Markdown/HTML files"""
+    uid = int(request.headers.get("X-User", "0"))
+    fmt = request.args.get("format", "ndjson")
+    if fmt not in ("ndjson", "markdown", "html"):
+        return jsonify({"error": {"code": "INVALID_INPUT", "message": "format must be ndjson, markdown or html"}}), 400
+    include_deleted = request.args.get("include_deleted") in ("1", "true")
+    exported_at = now_iso()
+
+    def rows(c, sql, params):
+        c.execute(sql, params)
+        while True:
+            batch = c.fetchmany(STREAM_FETCH_ROWS)
+            if not batch:
+                return
+            yield from batch
+
+    def generate():
+        # One read transaction, so folders and notes come from the same snapshot
+        conn = read_db()
+        try:
+            c = conn.cursor()
+            c.execute("BEGIN")
+            folders = {}
+            notes_sql = f"SELECT {EXPORT_NOTE_COLUMNS} FROM notes WHERE user_id=?{'' if include_deleted else ' AND is_deleted=0'} ORDER BY id"
+            if fmt == "ndjson":
+                yield ndjson_line({"type": "header", "format": EXPORT_FORMAT, "version": EXPORT_VERSION, "exported_at": exported_at})
+                for f in rows(c, "SELECT id, name, created_at, updated_at FROM folders WHERE user_id=? ORDER BY id", (uid,)):
+                    folders[f["id"]] = True
+                    yield ndjson_line({"type": "folder", **dict(f)})
+                count, out = 0, []
+                for n in rows(c, notes_sql, (uid,)):
+                    note = dict(n)
+                    note["blobs"] = note["blobs"].split(",") if note["blobs"] else []
+                    out.append(ndjson_line({"type": "note", **note}))
+                    count += 1
+                    if len(out) >= STREAM_FETCH_ROWS:
+                        yield "".join(out)
+                        out = []
+                out.append(ndjson_line({"type": "end", "folders": len(folders), "notes": count}))
+                yield "".join(out)
+            else:
+                for f in rows(c, "SELECT id, name FROM folders WHERE user_id=?", (uid,)):
+                    folders[f["id"]] = f["name"]
+                archive = ZipStream()
+                render, extension = (note_markdown, "md") if fmt == "markdown" else (note_html, "html")
+                for n in rows(c, notes_sql, (uid,)):
+                    data = archive.add(note_path(n, folders.get(n["folder_id"]), extension),
+                                       render(n).encode("utf-8"), n["updated_at"])
+                    if data:
+                        yield data
+                yield archive.close()
+            conn.rollback()
+        finally:
+            conn.close()
+
+    if fmt == "ndjson":
+        resp = Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+        filename = f"mynote-export-{exported_at[:10]}.ndjson"
+    else:
+        resp = Response(stream_with_context(generate()), mimetype="application/zip")
+        resp.direct_passthrough = True  # already compressed; skip response compression
+        filename = f"mynote-export-{exported_at[:10]}-{fmt}.zip"
+    resp.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return resp
+
+def import_chunk(uid, records, folder_map, counts):
+    """Insert one chunk of import records in a single transaction"""
+    # Folder ids and counts only take effect once the chunk has committed
+    new_folders, added = {}, dict.fromkeys(counts, 0)
+    conn = db()
+    try:
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        # Imported notes are new to this account, so they are stamped with the import
+        # time (taken under the write lock): devices that synced past the export's
+        # timestamps still pull them. created_at keeps the exported value.
+        imported_ms = now_ms()
+        imported_at = ms_to_iso(imported_ms)
+        for line_no, rec in records:
+            if rec["type"] == "folder":
+                name = str(rec.get("name") or "").strip()
+                if not name:
+                    raise ImportFormatError(line_no, "Folder name is required")
+                # Folder names are unique per user: an existing folder of the same name is reused
+                c.execute("SELECT id FROM folders WHERE user_id=? AND name=?", (uid, name))
+                row = c.fetchone()
+                if row is not None:
+                    new_folders[str(rec.get("id"))] = row["id"]
+                    added["folders_merged"] += 1
+                else:
+                    created_at = rec.get("created_at") or now_iso()
+                    c.execute("INSERT INTO folders (user_id, name, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                              (uid, name, created_at, rec.get("updated_at") or created_at))
+                    new_folders[str(rec.get("id"))] = c.lastrowid
+                    added["folders_created"] += 1
+            elif rec["type"] == "note":
+                n = parse_note_payload(rec)
+                if n is None:
+                    raise ImportFormatError(line_no, "updated_at must be an ISO 8601 timestamp or epoch milliseconds")
+                folder_id = None
+                if n["folder_id"] is not None:
+                    key = str(n["folder_id"])
+                    folder_id = new_folders.get(key, folder_map.get(key))
+                    if folder_id is None:
+                        added["unresolved_folder_refs"] += 1  # imported unfiled
+                c.execute("""INSERT INTO notes (user_id,title,content,body_hash,folder_id,is_favorite,is_deleted,created_at,updated_at,updated_ms,version)
+                             VALUES (?,?,?,?,?,?,?,?,?,?,?)""",
+                          (uid, n["title"], *bodies.prepare(c, n["content"]), folder_id, n["is_favorite"], n["is_deleted"],
+                           rec.get("created_at") or n["updated_at"], imported_at, imported_ms, n["version"]))
+                note_id = c.lastrowid
+                added["notes"] += 1
+                for blob_hash in rec.get("blobs") or []:
+                    # Attachments are relinked only if this user already has the blob
+                    c.execute("""INSERT OR IGNORE INTO note_blobs(note_id, blob_hash)
+                                 SELECT ?, hash FROM blob_owners WHERE hash=? AND user_id=?""", (note_id, str(blob_hash), uid))
+                    added["blobs_linked" if c.rowcount else "blobs_missing"] += 1
+        conn.commit()
+    finally:
+        conn.close()  # an uncommitted chunk is rolled back when the connection goes back to the pool
+    folder_map.update(new_folders)
+    for key, value in added.items():
+        counts[key] += value
+
+@app.post("/api/import")
+def import_account():
+    """Import an NDJSON export into the user's account, IMPORT_CHUNK records per transaction"""
+    uid = int(request.headers.get("X-User", "0"))
+    counts = {"folders_created": 0, "folders_merged": 0, "notes": 0, "unresolved_folder_refs": 0,
+              "blobs_linked": 0, "blobs_missing": 0}
+    folder_map = {}  # exported folder id -> folder id in this account
+    chunk = []
+    try:
+        for line_no, rec in read_records(request.stream, IMPORT_MAX_LINE_BYTES):
+            if rec["type"] in ("folder", "note"):
+                chunk.append((line_no, rec))
+            if len(chunk) >= IMPORT_CHUNK:
+                import_chunk(uid, chunk, folder_map, counts)
+                chunk = []
+        if chunk:
+            import_chunk(uid, chunk, folder_map, counts)
+        error = None
+    except ImportFormatError as e:
+        # Chunks committed before the bad line stay imported; the response says how far it got
+        error = {"code": "INVALID_IMPORT", "message": str(e), "line": e.line}
+    finally:
+        if counts["folders_created"]:
+            cache.invalidate_folders(uid)
+        if counts["notes"] or counts["folders_created"]:
+            # One event instead of a notes_changed entry per imported note; devices pull the changes
+            emit_to_room("notes_imported", {"user_id": uid, "notes": counts["notes"],
+                                            "folders": counts["folders_created"], "server_now": now_iso()}, f"user:{uid}")
+            update_sync_status("bulk_import", {"user_id": uid, **counts},
+                               notes=counts["notes"], folders=counts["folders_created"])
+
+    if error is not None:
+        return jsonify({"error": error, "imported": counts}), 400
+    return jsonify({"imported": counts}), 201
+
 # Socket.IO connection: join room by user
 @socketio.on('connect')
 def on_connect():
     uid = request.args.get('user')
     if not uid or not uid.isdigit():
         return False  # Reject connection
+    wait = connect_limiter.acquire(int(uid))
+    if wait:
+        raise ConnectionRefusedError({"code": "RATE_LIMITED", "retry_after": int(retry_after_header(wait))})
     join_room(f"user:{uid}")
+    get_sync_tracker().connection_opened()
+    bus.publish("sync_status", {"op": "connection_opened"})
     emit('hello', {'ok': True, 'server_time': now_iso()})
 
+@socketio.on('disconnect')
+def on_disconnect():
+    get_sync_tracker().connection_closed()
+    bus.publish("sync_status", {"op": "connection_closed"})
+
 if __name__ == "__main__":
     init_db()
-    socketio.run(app, host="0.0.0.0", port=5000, debug=True)  # ← Use socketio.run
\ No newline at end of file
+    bus.start()
+    if WORKER_INDEX == 0:
+        maintenance.start()  # one worker is enough for the whole database
+    port = int(os.environ.get("MYNOTE_PORT", "5000"))
+    debug = os.environ.get("MYNOTE_DEBUG", "1") == "1"
+    socketio.run(app, host="0.0.0.0", port=port, debug=debug, allow_unsafe_werkzeug=True)  # ← Use socketio.run
\ No newline at end of file
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Load test for the sync server: N users x M devices following the client protocol.
+
+Each simulated device joins its user's Socket.IO room and then loops over the
+same calls the app makes while syncing: per-note upserts, pulls with
+updated_after, and deletes. The harness reports throughput and latency
+percentiles per endpoint plus the lag between a write returning and the
+other devices receiving its realtime event, as JSON so runs can be diffed
+between commits.
+
+By default the server is started as a subprocess against a temporary
+database; pass --url to target an already running server instead.
+
+    pip install requests websocket-client
+    python server/bench/load_test.py --users 4 --devices 3 --duration 20 --output run.json
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+import socketio
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * pct / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(samples_ms, elapsed):
+    values = sorted(samples_ms)
+    return {
+        "count": len(values),
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed else None,
+        "mean_ms": round(sum(values) / len(values), 3) if values else None,
+        "p50_ms": round(percentile(values, 50), 3) if values else None,
+        "p95_ms": round(percentile(values, 95), 3) if values else None,
+        "p99_ms": round(percentile(values, 99), 3) if values else None,
+        "max_ms": round(values[-1], 3) if values else None,
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(workdir, port, extra_env=None):
+    env = dict(os.environ)
+    env.update({
+        "MYNOTE_DB_PATH": os.path.join(workdir, "bench.db"),
+        "MYNOTE_SYNC_STATUS_PATH": os.path.join(workdir, "sync_status.json"),
+        "MYNOTE_BLOB_DIR": os.path.join(workdir, "blobs"),
+        "MYNOTE_PORT": str(port),
+        "MYNOTE_DEBUG": "0",
+    })
+    # Simulated devices have no think time; per-user rate limits would dominate the numbers
+    for name in ("MYNOTE_RATE_LIMIT_READ", "MYNOTE_RATE_LIMIT_WRITE", "MYNOTE_RATE_LIMIT_CONNECT"):
+        env.setdefault(name, "0")
+    env.update(extra_env or {})
+    log = open(os.path.join(workdir, "server.log"), "w")
+    proc = subprocess.Popen([sys.executable, os.path.join(SERVER_DIR, "app.py")],
+                            cwd=SERVER_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server exited early, see {log.name}")
+        try:
+            if requests.get(f"{url}/api/health", timeout=1).ok:
+                return proc, url
+        except requests.RequestException:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("Server did not become healthy within 30s")
+
+
+class Recorder:
+    """Thread-safe latency samples per endpoint, write timestamps and event lags"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.write_times = {}  # (uid, note_id) -> monotonic time the write returned
+        self.event_lags = []
+        self.events_received = 0
+        self.last_sample = None
+
+    def sample(self, endpoint, ms, ok):
+        with self.lock:
+            self.last_sample = time.monotonic()
+            self.latencies.setdefault(endpoint, []).append(ms)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def wrote(self, uid, note_id):
+        with self.lock:
+            self.write_times[(uid, note_id)] = time.monotonic()
+
+    def event(self, uid, note_ids):
+        now = time.monotonic()
+        with self.lock:
+            self.events_received += 1
+            for note_id in note_ids:
+                t = self.write_times.get((uid, note_id))
+                if t is not None:
+                    self.event_lags.append(max(0.0, (now - t) * 1000.0))
+
+
+class Device(threading.Thread):
+    """One app install: a socket in the user's room plus a sync loop"""
+
+    def __init__(self, url, uid, recorder, stop_at, think_time, notes_per_device, rng):
+        super().__init__(daemon=True)
+        self.urls = url if isinstance(url, list) else [url]
+        self.uid = uid
+        self.rec = recorder
+        self.stop_at = stop_at
+        self.think_time = think_time
+        self.notes_per_device = notes_per_device
+        self.rng = rng
+        self.http = requests.Session()
+        self.http.headers.update({"X-User": str(uid), "Content-Type": "application/json"})
+        self.sio = socketio.Client(reconnection=False)
+        self.own_notes = []
+        self.bookmark = None
+
+    def connect_socket(self):
+        @self.sio.on("notes_changed")
+        def _changed(data):
+            self.rec.event(self.uid, [ch["id"] for ch in data.get("changes", [])])
+
+        # Devices of one user may land on different workers (see --url)
+        self.sio.connect(f"{self.rng.choice(self.urls)}?user={self.uid}", transports=["websocket"], wait_timeout=10)
+
+    def call(self, endpoint, method, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            resp = self.http.request(method, f"{self.rng.choice(self.urls)}{path}", timeout=30, **kwargs)
+            ok = resp.status_code < 400
+        except requests.RequestException:
+            resp, ok = None, False
+        self.rec.sample(endpoint, (time.perf_counter() - started) * 1000.0, ok)
+        return resp if ok else None
+
+    def upsert(self):
+        now = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime()) + f".{int(time.time() * 1000) % 1000:03d}Z"
+        body = {"title": f"note {self.rng.randrange(1 << 30)}", "content": "<p>" + "lorem ipsum " * self.rng.randint(5, 80) + "</p>",
+                "updated_at": now, "version": 1}
+        if self.own_notes and self.rng.random() < 0.5:
+            body["id"] = self.rng.choice(self.own_notes)
+        resp = self.call("POST /api/notes/upsert", "POST", "/api/notes/upsert", json=body)
+        if resp is not None:
+            note_id = int(resp.json()["id"])
+            self.rec.wrote(self.uid, note_id)
+            if note_id not in self.own_notes:
+                self.own_notes.append(note_id)
+
+    def pull(self):
+        params = {"updated_after": self.bookmark} if self.bookmark else {}
+        resp = self.call("GET /api/notes", "GET", "/api/notes", params=params)
+        if resp is not None:
+            self.bookmark = resp.json().get("server_now", self.bookmark)
+
+    def delete(self):
+        if not self.own_notes:
+            return
+        note_id = self.own_notes.pop(self.rng.randrange(len(self.own_notes)))
+        if self.call("DELETE /api/notes/<id>", "DELETE", f"/api/notes/{note_id}") is not None:
+            self.rec.wrote(self.uid, note_id)
+
+    def run(self):
+        try:
+            self.connect_socket()
+        except Exception as e:
+            self.rec.sample("socket.io connect", 0.0, False)
+            print(f"Device for user {self.uid} failed to connect: {e}", file=sys.stderr)
+        # Seed a few notes, then the steady-state mix: mostly pulls and edits
+        for _ in range(self.notes_per_device):
+            self.upsert()
+        while time.monotonic() < self.stop_at:
+            r = self.rng.random()
+            if r < 0.45:
+                self.pull()
+            elif r < 0.9:
+                self.upsert()
+            else:
+                self.delete()
+            if self.think_time:
+                time.sleep(self.rng.uniform(0, self.think_time))
+        if self.sio.connected:
+            time.sleep(0.5)  # let in-flight events arrive before disconnecting
+            self.sio.disconnect()
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=SERVER_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="mynote-bench-")
+    proc = None
+    try:
+        if args.url:
+            urls = args.url
+        else:
+            proc, url = start_server(workdir, args.port or free_port())
+            urls = [url]
+
+        uids = []
+        for i in range(args.users):
+            resp = requests.post(f"{urls[0]}/api/users/register", timeout=10, json={
+                "username": f"bench{i}", "email": f"bench-{os.getpid()}-{time.time_ns()}-{i}@example.com", "password": "bench"})
+            resp.raise_for_status()
+            uids.append(resp.json()["id"])
+
+        rec = Recorder()
+        rng = random.Random(args.seed)
+        started_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        started = time.monotonic()
+        stop_at = started + args.duration
+        devices = [Device(urls, uid, rec, stop_at, args.think_time, args.notes_per_device, random.Random(rng.random()))
+                   for uid in uids for _ in range(args.devices)]
+        for d in devices:
+            d.start()
+        for d in devices:
+            d.join(args.duration + 60)
+        # Measure up to the last request, not the devices' disconnect grace period
+        elapsed = (rec.last_sample or time.monotonic()) - started
+
+        health = None
+        try:
+            health = requests.get(f"{urls[0]}/api/health", timeout=5).json()
+        except Exception:
+            pass
+
+        endpoints = {}
+        for name, samples in sorted(rec.latencies.items()):
+            endpoints[name] = summarize(samples, elapsed)
+            endpoints[name]["errors"] = rec.errors.get(name, 0)
+        total = sum(len(v) for v in rec.latencies.values())
+        return {
+            "commit": git_commit(),
+            "started_at": started_at,
+            "config": {"users": args.users, "devices_per_user": args.devices, "duration_s": args.duration,
+                       "think_time_s": args.think_time, "notes_per_device": args.notes_per_device,
+                       "seed": args.seed, "servers": urls},
+            "elapsed_s": round(elapsed, 3),
+            "total_requests": total,
+            "throughput_rps": round(total / elapsed, 2),
+            "errors": sum(rec.errors.values()),
+            "endpoints": endpoints,
+            "realtime": dict(summarize(rec.event_lags, elapsed), events_received=rec.events_received),
+            "server_health": health,
+        }
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+        else:
+            print(f"Kept work directory: {workdir}", file=sys.stderr)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--devices", type=int, default=3, help="devices per user")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of steady-state load")
+    parser.add_argument("--think-time", type=float, default=0.0, help="max random pause between calls (s)")
+    parser.add_argument("--notes-per-device", type=int, default=5, help="notes each device creates before the loop")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--port", type=int, help="port for the spawned server (default: random free port)")
+    parser.add_argument("--url", action="append", help="use a running server (repeat for several workers)")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--keep", action="store_true", help="keep the temp database and server log")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"Wrote {args.output}: {report['throughput_rps']} req/s, {report['errors']} errors", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of note listing serialization: rows per second encoded.
+
+Builds a temporary notes table with HTML bodies of realistic size and times
+three ways of turning a 500-row page (and an NDJSON stream of all rows) into
+response bytes:
+
+- ``row_dict_jsonify``: the previous path, ``dict(sqlite3.Row)`` per row
+  passed to Flask's ``jsonify``
+- ``layout_json``: tuple rows + ``RowLayout`` with the stdlib encoder
+- ``layout_orjson``: the same with orjson (skipped when not installed)
+
+    python server/bench/serialization_bench.py --rows 5000 --seconds 2
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import serialization  # noqa: E402
+from flask import Flask, jsonify  # noqa: E402
+
+COLUMNS = "id AS remote_id, title, content, folder_id, is_favorite, is_deleted, updated_at, version"
+LAYOUT = serialization.RowLayout("remote_id", "title", "content", "folder_id", "is_favorite", "is_deleted",
+                                 "updated_at", "version")
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor".split()
+
+
+def build_db(rows, seed):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(":memory:")
+    conn.execute("""CREATE TABLE notes(id INTEGER PRIMARY KEY, title TEXT, content TEXT, folder_id INTEGER,
+                    is_favorite INTEGER, is_deleted INTEGER, updated_at TEXT, version INTEGER)""")
+    data = []
+    for i in range(rows):
+        paragraphs = ["<p>" + " ".join(rng.choice(WORDS) for _ in range(rng.randint(10, 120))) + "</p>"
+                      for _ in range(rng.randint(1, 12))]
+        data.append((i + 1, f"Note {i} — {rng.choice(WORDS)}", "\n".join(paragraphs), rng.choice([None, 1, 2, 3]),
+                     rng.randint(0, 1), 0, f"2026-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}Z", rng.randint(1, 9)))
+    conn.executemany("INSERT INTO notes VALUES (?,?,?,?,?,?,?,?)", data)
+    return conn
+
+
+def page_row_dict_jsonify(conn, app, limit):
+    conn.row_factory = sqlite3.Row
+    rows = [dict(r) for r in conn.execute(f"SELECT {COLUMNS} FROM notes LIMIT ?", (limit,)).fetchall()]
+    with app.app_context():
+        return jsonify({"items": rows, "server_now": "2026-01-01T00:00:00Z", "next_cursor": None,
+                        "has_more": False}).get_data()
+
+
+def page_layout(conn, app, limit):
+    conn.row_factory = None
+    c = conn.execute(f"SELECT {COLUMNS} FROM notes LIMIT ?", (limit + 1,))
+    body = bytearray(b'{"items":')
+    LAYOUT.write_array(body, c, limit)
+    body += serialization.json_object_tail({"server_now": "2026-01-01T00:00:00Z", "next_cursor": None,
+                                            "has_more": False})
+    return bytes(body)
+
+
+def stream_row_dict(conn, app, limit):
+    conn.row_factory = sqlite3.Row
+    c = conn.execute(f"SELECT {COLUMNS} FROM notes")
+    out = []
+    while True:
+        rows = c.fetchmany(200)
+        if not rows:
+            break
+        out.append("".join(json.dumps(dict(r), separators=(",", ":")) + "\n" for r in rows).encode("utf-8"))
+    return b"".join(out)
+
+
+def stream_layout(conn, app, limit):
+    conn.row_factory = None
+    c = conn.execute(f"SELECT {COLUMNS} FROM notes")
+    out = []
+    while True:
+        rows = c.fetchmany(200)
+        if not rows:
+            break
+        out.append(LAYOUT.encode_ndjson(rows))
+    return b"".join(out)
+
+
+def measure(func, conn, app, limit, rows_per_call, seconds):
+    func(conn, app, limit)  # warm up
+    calls, started = 0, time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        func(conn, app, limit)
+        calls += 1
+    elapsed = time.perf_counter() - started
+    return round(calls * rows_per_call / elapsed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000, help="notes in the table (NDJSON streams all of them)")
+    parser.add_argument("--page", type=int, default=500, help="rows per JSON page")
+    parser.add_argument("--seconds", type=float, default=2.0, help="time per measurement")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    conn = build_db(args.rows, args.seed)
+    app = Flask(__name__)
+    average_bytes = conn.execute("SELECT AVG(LENGTH(content)) FROM notes").fetchone()[0]
+    page_rows = min(args.page, args.rows)
+
+    encoders = {"json": None}
+    if serialization.orjson is not None:
+        encoders["orjson"] = serialization.orjson
+    results = {"row_dict_jsonify": {
+        "page_rows_per_s": measure(page_row_dict_jsonify, conn, app, page_rows, page_rows, args.seconds),
+        "ndjson_rows_per_s": measure(stream_row_dict, conn, app, None, args.rows, args.seconds),
+    }}
+    installed = serialization.orjson
+    try:
+        for name, module in encoders.items():
+            serialization.orjson = module
+            # Both paths must produce the same document
+            assert json.loads(page_layout(conn, app, page_rows)) == json.loads(page_row_dict_jsonify(conn, app, page_rows))
+            results[f"layout_{name}"] = {
+                "page_rows_per_s": measure(page_layout, conn, app, page_rows, page_rows, args.seconds),
+                "ndjson_rows_per_s": measure(stream_layout, conn, app, None, args.rows, args.seconds),
+            }
+    finally:
+        serialization.orjson = installed
+
+    baseline = results["row_dict_jsonify"]
+    for name, result in results.items():
+        result["page_speedup"] = round(result["page_rows_per_s"] / baseline["page_rows_per_s"], 2)
+        result["ndjson_speedup"] = round(result["ndjson_rows_per_s"] / baseline["ndjson_rows_per_s"], 2)
+    print(json.dumps({
+        "rows": args.rows,
+        "page_rows": page_rows,
+        "avg_content_bytes": round(average_bytes),
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
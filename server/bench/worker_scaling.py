@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Throughput of the sync server as the number of worker processes grows.
+
+For each worker count, run_workers.py is started against a fresh temporary
+database and SQLite message bus, and load_test.py drives it with devices
+spread over all worker ports (so most realtime events cross processes).
+The report lists throughput, latency, realtime lag and events received per
+worker count, plus the speedup over the first count, as JSON.
+
+    python server/bench/worker_scaling.py --workers 1,2,4 --users 8 --devices 3 --duration 20
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+import load_test
+
+SERVER_DIR = load_test.SERVER_DIR
+
+
+def free_ports(count):
+    """A block of `count` consecutive free ports"""
+    for _ in range(100):
+        base = random.randint(20000, 60000 - count)
+        try:
+            for port in range(base, base + count):
+                with socket.socket() as s:
+                    s.bind(("127.0.0.1", port))
+            return base
+        except OSError:
+            continue
+    raise RuntimeError("No block of free ports found")
+
+
+def start_workers(workdir, workers):
+    base = free_ports(workers)
+    env = dict(os.environ)
+    env.update({
+        "MYNOTE_DB_PATH": os.path.join(workdir, "bench.db"),
+        "MYNOTE_SYNC_STATUS_PATH": os.path.join(workdir, "sync_status.json"),
+        "MYNOTE_BLOB_DIR": os.path.join(workdir, "blobs"),
+    })
+    # Simulated devices have no think time; per-user rate limits would dominate the numbers
+    for name in ("MYNOTE_RATE_LIMIT_READ", "MYNOTE_RATE_LIMIT_WRITE", "MYNOTE_RATE_LIMIT_CONNECT"):
+        env.setdefault(name, "0")
+    log = open(os.path.join(workdir, "workers.log"), "w")
+    proc = subprocess.Popen([sys.executable, os.path.join(SERVER_DIR, "run_workers.py"), "--workers", str(workers),
+                             "--port", str(base), "--bus", f"sqlite:{os.path.join(workdir, 'bus.db')}"],
+                            cwd=SERVER_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    urls = [f"http://127.0.0.1:{base + i}" for i in range(workers)]
+    deadline = time.time() + 60
+    pending = list(urls)
+    while pending and time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Workers exited early, see {log.name}")
+        try:
+            if requests.get(f"{pending[0]}/api/health", timeout=1).ok:
+                pending.pop(0)
+                continue
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    if pending:
+        stop_workers(proc)
+        raise RuntimeError(f"Workers did not become healthy within 60s, see {log.name}")
+    return proc, urls
+
+
+def stop_workers(proc):
+    proc.terminate()
+    try:
+        proc.wait(30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def endpoint_p95(report, name):
+    return (report["endpoints"].get(name) or {}).get("p95_ms")
+
+
+def run(args):
+    rows = []
+    for workers in args.workers:
+        workdir = tempfile.mkdtemp(prefix=f"mynote-scaling-{workers}-")
+        proc = None
+        try:
+            proc, urls = start_workers(workdir, workers)
+            load_args = ["--users", str(args.users), "--devices", str(args.devices), "--duration", str(args.duration),
+                         "--think-time", str(args.think_time), "--seed", str(args.seed)]
+            for url in urls:
+                load_args += ["--url", url]
+            report = load_test.run(load_test.parse_args(load_args))
+        finally:
+            if proc is not None:
+                stop_workers(proc)
+            if not args.keep:
+                shutil.rmtree(workdir, ignore_errors=True)
+        rows.append({
+            "workers": workers,
+            "throughput_rps": report["throughput_rps"],
+            "errors": report["errors"],
+            "upsert_p95_ms": endpoint_p95(report, "POST /api/notes/upsert"),
+            "pull_p95_ms": endpoint_p95(report, "GET /api/notes"),
+            "realtime_p95_ms": report["realtime"]["p95_ms"],
+            "events_received": report["realtime"]["events_received"],
+        })
+        print(f"{workers} workers: {report['throughput_rps']} req/s, {report['errors']} errors", file=sys.stderr)
+
+    baseline = rows[0]["throughput_rps"] if rows else None
+    for row in rows:
+        row["speedup"] = round(row["throughput_rps"] / baseline, 2) if baseline else None
+    return {
+        "commit": load_test.git_commit(),
+        "cpu_count": os.cpu_count(),
+        "config": {"users": args.users, "devices_per_user": args.devices, "duration_s": args.duration,
+                   "think_time_s": args.think_time, "seed": args.seed},
+        "runs": rows,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=lambda v: [int(n) for n in v.split(",")], default=[1, 2, 4],
+                        help="comma-separated worker counts (default 1,2,4)")
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--devices", type=int, default=3, help="devices per user")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of load per worker count")
+    parser.add_argument("--think-time", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--keep", action="store_true", help="keep the temp databases and worker logs")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
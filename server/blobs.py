@@ -0,0 +1,178 @@
+"""
+Content-addressed storage for note attachments.
+
+Blobs are files named by the SHA-256 of their bytes under ``root``
+(``ab/abcdef...``), so identical attachments are stored once. Uploads are
+chunked and resumable: a session records the expected hash and size, chunks
+are appended to ``uploads/<id>.part`` at the offset the client says it is
+sending, and the number of bytes received is simply the size of that file.
+When the last chunk arrives the file is hashed, checked and moved into place.
+
+Which notes use which blobs is tracked in ``note_blobs``; triggers keep
+``blobs.refcount`` up to date and ``collect_garbage`` deletes blobs that no
+note has referenced for ``grace_seconds``.
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+import uuid
+
+HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class BlobError(Exception):
+    """Upload problem to report to the client as `code` with HTTP `status`"""
+
+    def __init__(self, code, message, status=400, **extra):
+        super().__init__(message)
+        self.code = code
+        self.status = status
+        self.extra = extra
+
+
+class BlobStore:
+    """Files on disk plus the bookkeeping for resumable uploads"""
+
+    def __init__(self, root, max_bytes=100 * 1024 * 1024, chunk_max=8 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.chunk_max = chunk_max
+        self.uploads_dir = os.path.join(root, "uploads")
+        os.makedirs(self.uploads_dir, exist_ok=True)
+        # Serializes appends per upload and keeps garbage collection from
+        # unlinking a file that a finishing upload is putting back in place
+        self._lock = threading.Lock()
+        self._upload_locks = {}
+
+    def path(self, blob_hash):
+        return os.path.join(self.root, blob_hash[:2], blob_hash)
+
+    def part_path(self, upload_id):
+        return os.path.join(self.uploads_dir, f"{upload_id}.part")
+
+    def received(self, upload_id):
+        try:
+            return os.path.getsize(self.part_path(upload_id))
+        except FileNotFoundError:
+            return 0
+
+    def new_upload_id(self):
+        return uuid.uuid4().hex
+
+    def _upload_lock(self, upload_id):
+        with self._lock:
+            return self._upload_locks.setdefault(upload_id, threading.Lock())
+
+    def write_chunk(self, upload_id, offset, size, stream, length):
+        """Append `length` bytes from `stream` at `offset`; returns bytes received so far"""
+        if length is None:
+            raise BlobError("LENGTH_REQUIRED", "Content-Length is required", 411)
+        if length > self.chunk_max:
+            raise BlobError("CHUNK_TOO_LARGE", f"Chunks are limited to {self.chunk_max} bytes", 413)
+        with self._upload_lock(upload_id):
+            received = self.received(upload_id)
+            if offset != received:
+                # Client is out of step (e.g. retried a chunk that did land): tell it where to resume
+                raise BlobError("OFFSET_MISMATCH", "Chunk does not start at the received offset", 409,
+                                received=received)
+            if offset + length > size:
+                raise BlobError("TOO_MUCH_DATA", "Chunk goes past the declared size", 416, received=received)
+            written = 0
+            with open(self.part_path(upload_id), "ab") as f:
+                while written < length:
+                    piece = stream.read(min(65536, length - written))
+                    if not piece:
+                        break
+                    f.write(piece)
+                    written += len(piece)
+            if written != length:
+                # Connection dropped mid-chunk: keep what arrived, the client resumes from there
+                raise BlobError("INCOMPLETE_CHUNK", "Chunk ended early", 400, received=offset + written)
+            return offset + written
+
+    def finish(self, upload_id, blob_hash, register):
+        """Verify the completed part file and move it into place.
+
+        `register()` records the blob in the database before the file appears.
+        It must not run under the lock: it goes through the writer, and garbage
+        collection holds the lock only around unlinks, after re-checking that
+        the blob is still unregistered.
+        """
+        part = self.part_path(upload_id)
+        digest = hashlib.sha256()
+        with open(part, "rb") as f:
+            for piece in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(piece)
+        if digest.hexdigest() != blob_hash:
+            os.remove(part)
+            raise BlobError("HASH_MISMATCH", "Uploaded bytes do not match sha256; upload restarted", 422, received=0)
+        final = self.path(blob_hash)
+        os.makedirs(os.path.dirname(final), exist_ok=True)
+        register()
+        with self._lock:
+            if os.path.exists(final):
+                os.remove(part)  # someone else stored the same bytes meanwhile
+            else:
+                os.replace(part, final)
+            self._upload_locks.pop(upload_id, None)
+
+    def discard_upload(self, upload_id):
+        with self._lock:
+            self._upload_locks.pop(upload_id, None)
+        try:
+            os.remove(self.part_path(upload_id))
+        except FileNotFoundError:
+            pass
+
+    def collect_garbage(self, conn, write, grace_seconds=86400, upload_ttl_seconds=86400, budget=None):
+        """Delete unreferenced blobs and abandoned uploads; returns (blobs, uploads) removed.
+
+        `conn` is only read from (it may be read-only); rows are deleted through
+        `write(op)`, which applies op(cursor) in its own transaction. Stops early
+        once `budget.expired()`; what is left is picked up next time.
+        """
+        cutoff = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() - grace_seconds))
+        c = conn.cursor()
+        c.execute("SELECT hash FROM blobs WHERE refcount = 0 AND last_used_at < ?", (cutoff,))
+        candidates = [row[0] for row in c.fetchall()]
+
+        def delete_blob(blob_hash):
+            def op(cur):
+                cur.execute("DELETE FROM blobs WHERE hash = ? AND refcount = 0 AND last_used_at < ?", (blob_hash, cutoff))
+                gone = cur.rowcount
+                if gone:
+                    cur.execute("DELETE FROM blob_owners WHERE hash = ?", (blob_hash,))
+                return gone
+            return op
+
+        blobs_removed = 0
+        for blob_hash in candidates:
+            if budget is not None and budget.expired():
+                return blobs_removed, 0
+            if not write(delete_blob(blob_hash)):
+                continue
+            blobs_removed += 1
+            with self._lock:
+                # An upload of the same bytes may have registered it again since;
+                # that upload puts its file in place under this lock, after us
+                c.execute("SELECT 1 FROM blobs WHERE hash = ?", (blob_hash,))
+                if c.fetchone() is None:
+                    try:
+                        os.remove(self.path(blob_hash))
+                    except FileNotFoundError:
+                        pass
+
+        cutoff = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() - upload_ttl_seconds))
+        c.execute("SELECT id FROM blob_uploads WHERE created_at < ?", (cutoff,))
+        stale = [row[0] for row in c.fetchall()]
+        uploads_removed = 0
+        for upload_id in stale:
+            if budget is not None and budget.expired():
+                break
+            write(lambda cur, upload_id=upload_id: cur.execute("DELETE FROM blob_uploads WHERE id = ?", (upload_id,)))
+            self.discard_upload(upload_id)
+            uploads_removed += 1
+        return blobs_removed, uploads_removed
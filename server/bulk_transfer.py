@@ -0,0 +1,227 @@
+"""
+Formats for bulk account export and import.
+
+Exports are produced record by record so the server never holds an account
+in memory:
+
+- NDJSON: a ``header`` record, every ``folder``, every ``note`` (with the
+  sha256 of its attachments), then an ``end`` record with the counts. The
+  same stream is accepted by the import endpoint.
+- zip: one Markdown (front matter + converted body) or HTML file per note,
+  under a directory per folder. ``ZipStream`` writes entries to an
+  unseekable sink and hands back the compressed bytes after each one.
+
+``read_records`` parses an NDJSON upload line by line with a per-line size
+cap, raising ``ImportFormatError`` with the offending line number.
+"""
+
+import datetime
+import html
+import json
+import re
+import zipfile
+from html.parser import HTMLParser
+
+EXPORT_FORMAT = "mynote-export"
+EXPORT_VERSION = 1
+
+
+class ImportFormatError(Exception):
+    def __init__(self, line, message):
+        super().__init__(message)
+        self.line = line
+
+
+def ndjson_line(record):
+    return json.dumps(record, separators=(",", ":"), ensure_ascii=False) + "\n"
+
+
+def read_records(stream, max_line_bytes):
+    """Yield (line number, record dict) from an NDJSON byte stream"""
+    line_no = 0
+    while True:
+        line = stream.readline(max_line_bytes + 1)
+        if not line:
+            return
+        line_no += 1
+        if len(line) > max_line_bytes:
+            raise ImportFormatError(line_no, f"Line is longer than {max_line_bytes} bytes")
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise ImportFormatError(line_no, f"Invalid JSON: {e}")
+        if not isinstance(record, dict) or not isinstance(record.get("type"), str):
+            raise ImportFormatError(line_no, "Each line must be an object with a 'type'")
+        if record["type"] == "header" and (record.get("format") != EXPORT_FORMAT or record.get("version") != EXPORT_VERSION):
+            raise ImportFormatError(line_no, f"Unsupported export format {record.get('format')!r} v{record.get('version')}")
+        yield line_no, record
+
+
+# Zip export ------------------------------------------------------------------
+
+class _Sink:
+    """Write-only file object collecting what zipfile writes"""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data, self.parts = b"".join(self.parts), []
+        return data
+
+
+class ZipStream:
+    """Builds a zip archive incrementally; drain() returns the bytes written since the last call"""
+
+    def __init__(self):
+        self._sink = _Sink()
+        # An object without tell()/seek() makes zipfile use data descriptors
+        self._zip = zipfile.ZipFile(self._sink, "w", compression=zipfile.ZIP_DEFLATED)
+
+    def add(self, name, data, modified=None):
+        info = zipfile.ZipInfo(name, date_time=zip_timestamp(modified))
+        info.compress_type = zipfile.ZIP_DEFLATED
+        with self._zip.open(info, "w") as f:
+            f.write(data)
+        return self._sink.drain()
+
+    def close(self):
+        self._zip.close()
+        return self._sink.drain()
+
+
+def zip_timestamp(iso):
+    try:
+        moment = datetime.datetime.fromisoformat((iso or "").replace("Z", "+00:00").replace(" ", "T"))
+        if moment.year >= 1980:
+            return moment.timetuple()[:6]
+    except ValueError:
+        pass
+    return (1980, 1, 1, 0, 0, 0)
+
+
+_UNSAFE_NAME = re.compile(r'[\\/:*?"<>|\x00-\x1f]+')
+
+
+def safe_name(name, fallback):
+    name = _UNSAFE_NAME.sub("_", (name or "").strip()).strip(". ")
+    return name[:80] or fallback
+
+
+def note_path(note, folder_name, extension):
+    # The note id keeps names unique without remembering every name written
+    title = safe_name(note["title"], "Untitled")
+    directory = safe_name(folder_name, "Folder") + "/" if folder_name else ""
+    return f"{directory}{title} ({note['id']}).{extension}"
+
+
+def note_markdown(note):
+    front = [
+        "---",
+        f"title: {json.dumps(note['title'] or '', ensure_ascii=False)}",
+        f"created_at: {note['created_at']}",
+        f"updated_at: {note['updated_at']}",
+        f"favorite: {'true' if note['is_favorite'] else 'false'}",
+        "---",
+        "",
+    ]
+    return "\n".join(front) + html_to_markdown(note["content"] or "") + "\n"
+
+
+def note_html(note):
+    title = html.escape(note["title"] or "")
+    return (f'<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>{title}</title></head>\n'
+            f"<body>\n<h1>{title}</h1>\n{note['content'] or ''}\n</body></html>\n")
+
+
+# HTML -> Markdown --------------------------------------------------------------
+
+class _MarkdownWriter(HTMLParser):
+    """Converts the subset of HTML the rich text editor produces"""
+
+    INLINE = {"b": "**", "strong": "**", "i": "*", "em": "*", "strike": "~~", "s": "~~", "del": "~~", "code": "`"}
+    BLOCKS = {"p", "div", "blockquote", "pre", "ul", "ol", "h1", "h2", "h3", "h4", "h5", "h6"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out = []
+        self.lists = []  # stack of ["ul"|"ol", item count]
+        self.link = None
+        self.in_pre = False
+
+    def _block_break(self):
+        if self.out and not "".join(self.out[-2:]).endswith("\n\n"):
+            self.out.append("\n\n" if not "".join(self.out[-1:]).endswith("\n") else "\n")
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag in self.BLOCKS and not self.lists:
+            self._block_break()
+        if tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
+            self.out.append("#" * int(tag[1]) + " ")
+        elif tag == "blockquote":
+            self.out.append("> ")
+        elif tag == "pre":
+            self.in_pre = True
+            self.out.append("```\n")
+        elif tag in ("ul", "ol"):
+            self.lists.append([tag, 0])
+        elif tag == "li" and self.lists:
+            kind = self.lists[-1]
+            kind[1] += 1
+            indent = "  " * (len(self.lists) - 1)
+            self.out.append(("\n" if self.out and not self.out[-1].endswith("\n") else "") +
+                            indent + (f"{kind[1]}. " if kind[0] == "ol" else "- "))
+        elif tag == "br":
+            self.out.append("  \n")
+        elif tag in self.INLINE:
+            self.out.append(self.INLINE[tag])
+        elif tag == "a":
+            self.link = attrs.get("href") or ""
+            self.out.append("[")
+        elif tag == "img":
+            self.out.append(f"![{attrs.get('alt') or ''}]({attrs.get('src') or ''})")
+
+    def handle_endtag(self, tag):
+        if tag in self.INLINE:
+            self.out.append(self.INLINE[tag])
+        elif tag == "a" and self.link is not None:
+            self.out.append(f"]({self.link})")
+            self.link = None
+        elif tag == "pre":
+            self.in_pre = False
+            self.out.append("\n```")
+        elif tag in ("ul", "ol") and self.lists:
+            self.lists.pop()
+        if tag in self.BLOCKS and not self.lists:
+            self._block_break()
+
+    def handle_data(self, data):
+        if not self.in_pre:
+            data = re.sub(r"\s+", " ", data)
+            if self.out and self.out[-1].endswith("\n"):
+                data = data.lstrip()
+        self.out.append(data)
+
+    def markdown(self):
+        text = "".join(self.out)
+        text = re.sub(r"[ \t]+\n", lambda m: "  \n" if m.group(0).startswith("  ") else "\n", text)
+        return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+def html_to_markdown(content):
+    if "<" not in content:
+        return content.strip()
+    writer = _MarkdownWriter()
+    writer.feed(content)
+    writer.close()
+    return writer.markdown()
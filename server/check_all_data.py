@@ -1,142 +1,313 @@
 #!/usr/bin/env python3
-import sqlite3
+"""
+Diagnostics for the sync server database.
+
+Opens the database read-only (safe against the live WAL database), computes
+aggregate statistics in SQL and prints each section as soon as it is ready,
+as text or as one JSON object per line (--json):
+
+- overview: file/page stats, schema version, row counts per table
+- users: notes per user (distribution and heaviest users)
+- notes: size distribution, deleted/dirty/favorite ratios, inline vs compressed
+- integrity: references to missing folders/users, cross-user folder links,
+  blob refcount drift, unreferenced note bodies, compactable change rows
+- indexes: per-index size (when dbstat is available) and planner statistics
+- --check adds PRAGMA quick_check (--full-check: integrity_check) and an FTS row count check
+
+Note aggregates can be computed from a deterministic sample of note ids
+(--sample) and capped to a number of rows (--max-rows); --list streams
+individual rows instead of loading them.
+"""
+
+import argparse
+import json
 import os
+import sqlite3
+import sys
+import time
 
-def check_database(db_path, db_name):
-    print(f"\n=== Checking {db_name} Database ===")
-    if not os.path.exists(db_path):
-        print(f"❌ Database file does not exist: {db_path}")
-        return
-    
+DEFAULT_DB = os.environ.get("MYNOTE_DB_PATH") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "mynote_sync.db")
+
+SIZE_BUCKETS = [256, 1024, 4096, 16384, 65536, 262144, 1048576]
+
+
+def open_readonly(db_path):
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA query_only=1")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+class Options:
+    def __init__(self, sample=1.0, max_rows=None, top=10, full_check=False):
+        self.sample = sample
+        self.max_rows = max_rows
+        self.top = top
+        self.full_check = full_check
+
+    def notes_source(self, columns):
+        """FROM-able subquery over notes honouring --sample and --max-rows"""
+        where = ""
+        if self.sample < 1.0:
+            # Multiplicative hash of the id: stable across runs, spread over id ranges
+            where = f"WHERE (id * 2654435761) % 1000000 < {int(self.sample * 1000000)}"
+        limit = f"LIMIT {int(self.max_rows)}" if self.max_rows else ""
+        return f"(SELECT {columns} FROM notes {where} {limit})"
+
+
+def table_columns(conn, table):
+    return {r["name"] for r in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def tables(conn):
+    return {r["name"] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+
+
+def percentiles(conn, values_sql, params=(), points=(0.5, 0.9, 0.99)):
+    """Percentiles of the single-column (v) query `values_sql`, from one sort in SQL"""
+    total = conn.execute(f"SELECT COUNT(*) FROM ({values_sql})", params).fetchone()[0]
+    if not total:
+        return {"count": 0}
+    offsets = {"min": 0, **{f"p{int(p * 100)}": int(p * (total - 1)) for p in points}, "max": total - 1}
+    marks = ",".join(str(o) for o in sorted(set(offsets.values())))
+    found = dict(conn.execute(f"""SELECT rn, v FROM (SELECT v, ROW_NUMBER() OVER (ORDER BY v) - 1 AS rn FROM ({values_sql}))
+                                  WHERE rn IN ({marks})""", params).fetchall())
+    return {"count": total, **{label: found[offset] for label, offset in offsets.items()}}
+
+
+def ratio(part, whole):
+    return round(part / whole, 4) if whole else None
+
+
+# Sections --------------------------------------------------------------------
+
+def overview(conn, opts):
+    pragma = lambda name: conn.execute(f"PRAGMA {name}").fetchone()[0]
+    page_size, page_count, free = pragma("page_size"), pragma("page_count"), pragma("freelist_count")
+    counts = {}
+    present = tables(conn)
+    for table in ("users", "notes", "folders", "sync_queue", "changes", "note_bodies", "blobs", "note_blobs", "blob_uploads"):
+        if table in present:
+            counts[table] = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    return {
+        "schema_version": pragma("user_version"),
+        "journal_mode": pragma("journal_mode"),
+        "auto_vacuum": {0: "none", 1: "full", 2: "incremental"}.get(pragma("auto_vacuum")),
+        "page_size": page_size,
+        "size_bytes": page_size * page_count,
+        "free_bytes": page_size * free,
+        "free_ratio": ratio(free, page_count),
+        "rows": counts,
+    }
+
+
+def users(conn, opts):
+    per_user = "SELECT COUNT(*) AS v FROM notes GROUP BY user_id"
+    heaviest = conn.execute("""SELECT n.user_id, COUNT(*) AS notes, SUM(n.is_deleted) AS deleted, u.id IS NULL AS missing_user
+                               FROM notes n LEFT JOIN users u ON u.id = n.user_id
+                               GROUP BY n.user_id ORDER BY notes DESC LIMIT ?""", (opts.top,))
+    return {
+        "users": conn.execute("SELECT COUNT(*) FROM users").fetchone()[0],
+        "users_with_notes": conn.execute("SELECT COUNT(DISTINCT user_id) FROM notes").fetchone()[0],
+        "notes_per_user": percentiles(conn, per_user),
+        "top_users": [dict(r) for r in heaviest],
+    }
+
+
+def notes(conn, opts):
+    compressed = "body_hash" in table_columns(conn, "notes") and "note_bodies" in tables(conn)
+    size = ("COALESCE(length(CAST(n.content AS BLOB)), (SELECT b.size FROM note_bodies b WHERE b.hash = n.body_hash), 0)"
+            if compressed else "COALESCE(length(CAST(n.content AS BLOB)), 0)")
+    columns = "id, user_id, content, is_deleted, dirty, is_favorite, folder_id" + (", body_hash" if compressed else "")
+    source = opts.notes_source(columns)
+    row = conn.execute(f"""SELECT COUNT(*) AS total, SUM(is_deleted) AS deleted, SUM(dirty != 0) AS dirty,
+                                  SUM(is_favorite) AS favorites, SUM(folder_id IS NULL) AS unfiled,
+                                  {'SUM(body_hash IS NOT NULL)' if compressed else '0'} AS compressed,
+                                  SUM({size}) AS bytes
+                           FROM {source} n""").fetchone()
+    total = row["total"]
+    buckets = " ".join(f"WHEN s < {b} THEN {b}" for b in SIZE_BUCKETS)
+    histogram = conn.execute(f"""SELECT CASE {buckets} ELSE NULL END AS under, COUNT(*) AS notes
+                                 FROM (SELECT {size} AS s FROM {source} n) GROUP BY under ORDER BY under IS NULL, under""")
+    return {
+        "scanned": total,
+        "sample": opts.sample,
+        "max_rows": opts.max_rows,
+        "deleted_ratio": ratio(row["deleted"] or 0, total),
+        "dirty_ratio": ratio(row["dirty"] or 0, total),
+        "favorite_ratio": ratio(row["favorites"] or 0, total),
+        "unfiled_ratio": ratio(row["unfiled"] or 0, total),
+        "compressed_ratio": ratio(row["compressed"] or 0, total),
+        "content_bytes": row["bytes"] or 0,
+        "size_bytes": percentiles(conn, f"SELECT {size} AS v FROM {source} n"),
+        "size_histogram": [{"under_bytes": r["under"], "notes": r["notes"]} for r in histogram],
+    }
+
+
+def integrity(conn, opts):
+    present = tables(conn)
+    def check(sql, params=()):
+        count = conn.execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
+        examples = [r[0] for r in conn.execute(f"{sql} LIMIT ?", (*params, opts.top))] if count else []
+        return {"count": count, "examples": examples}
+    report = {
+        "notes_missing_folder": check("""SELECT n.id FROM notes n LEFT JOIN folders f ON f.id = n.folder_id
+                                         WHERE n.folder_id IS NOT NULL AND f.id IS NULL"""),
+        "notes_in_other_users_folder": check("""SELECT n.id FROM notes n JOIN folders f ON f.id = n.folder_id
+                                                WHERE f.user_id != n.user_id"""),
+        "notes_missing_user": check("SELECT n.id FROM notes n LEFT JOIN users u ON u.id = n.user_id WHERE u.id IS NULL"),
+        "folders_missing_user": check("SELECT f.id FROM folders f LEFT JOIN users u ON u.id = f.user_id WHERE u.id IS NULL"),
+    }
+    if "note_bodies" in present:
+        report["unreferenced_note_bodies"] = check("""SELECT b.hash FROM note_bodies b
+                                                      WHERE NOT EXISTS (SELECT 1 FROM notes n WHERE n.body_hash = b.hash)""")
+        report["notes_missing_body"] = check("""SELECT n.id FROM notes n WHERE n.body_hash IS NOT NULL
+                                                AND NOT EXISTS (SELECT 1 FROM note_bodies b WHERE b.hash = n.body_hash)""")
+    if "blobs" in present:
+        report["blob_refcount_drift"] = check("""SELECT b.hash FROM blobs b
+                                                 WHERE b.refcount != (SELECT COUNT(*) FROM note_blobs nb WHERE nb.blob_hash = b.hash)""")
+    if "changes" in present:
+        report["compactable_changes"] = check("""SELECT c1.seq FROM changes c1 WHERE EXISTS (
+                                                   SELECT 1 FROM changes c2 WHERE c2.user_id = c1.user_id AND c2.entity = c1.entity
+                                                     AND c2.entity_id = c1.entity_id AND c2.seq > c1.seq)""")
+    if "sync_queue" in present:
+        report["sync_queue_oldest"] = conn.execute("SELECT MIN(created_at) FROM sync_queue").fetchone()[0]
+    return report
+
+
+def indexes(conn, opts):
+    sizes = {}
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # Check table structure
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        tables = cursor.fetchall()
-        print(f"📋 Table list: {[table[0] for table in tables]}")
-        
-        # Check users table
-        if ('users',) in tables:
-            print(f"\n👥 === User Data ===")
-            cursor.execute("PRAGMA table_info(users)")
-            columns = cursor.fetchall()
-            print(f"📊 users table structure: {[col[1] for col in columns]}")
-            
-            cursor.execute("SELECT COUNT(*) FROM users")
-            user_count = cursor.fetchone()[0]
-            print(f"👥 User count: {user_count}")
-            
-            if user_count > 0:
-                # Check available columns first
-                cursor.execute("PRAGMA table_info(users)")
-                user_columns = [col[1] for col in cursor.fetchall()]
-                
-                # Build query based on actual column names
-                if 'created_at' in user_columns:
-                    cursor.execute("SELECT id, username, email, created_at FROM users ORDER BY id")
-                    users = cursor.fetchall()
-                    print("👤 User list:")
-                    for user in users:
-                        print(f"   ID: {user[0]}, Username: {user[1]}, Email: {user[2]}, Created: {user[3]}")
-                else:
-                    cursor.execute("SELECT id, username, email FROM users ORDER BY id")
-                    users = cursor.fetchall()
-                    print("👤 User list:")
-                    for user in users:
-                        print(f"   ID: {user[0]}, Username: {user[1]}, Email: {user[2]}")
-            else:
-                print("ℹ️ No user data")
-        else:
-            print("❌ users table not found")
-        
-        # Check notes table
-        if ('notes',) in tables:
-            print(f"\n📝 === Notes Data ===")
-            cursor.execute("PRAGMA table_info(notes)")
-            columns = cursor.fetchall()
-            print(f"📊 notes table structure: {[col[1] for col in columns]}")
-            
-            cursor.execute("SELECT COUNT(*) FROM notes")
-            note_count = cursor.fetchone()[0]
-            print(f"📝 Note count: {note_count}")
-            
-            if note_count > 0:
-                cursor.execute("SELECT id, user_id, title, content, updated_at, is_deleted, is_favorite FROM notes ORDER BY id")
-                notes = cursor.fetchall()
-                print("📄 Notes list:")
-                for note in notes:
-                    content_preview = note[3][:50] + "..." if len(note[3]) > 50 else note[3]
-                    deleted_status = "Deleted" if note[5] else "Active"
-                    favorite_status = "⭐" if note[6] else ""
-                    print(f"   ID: {note[0]}, User ID: {note[1]}, Title: {note[2]}")
-                    print(f"       Content: {content_preview}")
-                    print(f"       Status: {deleted_status} {favorite_status}, Updated: {note[4]}")
-                    print()
-            else:
-                print("ℹ️ No notes data")
+        for r in conn.execute("SELECT name, SUM(pgsize) AS bytes FROM dbstat GROUP BY name"):
+            sizes[r["name"]] = r["bytes"]
+    except sqlite3.OperationalError:
+        pass  # SQLite built without dbstat
+    stats = {}
+    if "sqlite_stat1" in tables(conn):
+        for r in conn.execute("SELECT tbl, idx, stat FROM sqlite_stat1"):
+            stats[r["idx"] or r["tbl"]] = r["stat"]
+    result = []
+    for r in conn.execute("""SELECT name, tbl_name, sql IS NULL AS automatic FROM sqlite_master
+                             WHERE type='index' ORDER BY tbl_name, name"""):
+        entry = {"index": r["name"], "table": r["tbl_name"], "automatic": bool(r["automatic"]),
+                 "bytes": sizes.get(r["name"])}
+        stat = stats.get(r["name"])
+        if stat:
+            # "rows avg-rows-per-key..." as written by ANALYZE
+            parts = stat.split()
+            entry["analyzed_rows"] = int(parts[0])
+            entry["rows_per_key"] = [int(p) for p in parts[1:] if p.isdigit()]
+        result.append(entry)
+    return {
+        "analyzed": bool(stats),
+        "table_bytes": {name: size for name, size in sizes.items()
+                        if name in tables(conn)} if sizes else None,
+        "indexes": result,
+    }
+
+
+def checks(conn, opts):
+    report = {"quick_check": [r[0] for r in conn.execute("PRAGMA quick_check(20)")]}
+    if opts.full_check:
+        report["integrity_check"] = [r[0] for r in conn.execute("PRAGMA integrity_check(20)")]
+    if "notes_fts_docsize" in tables(conn):
+        # The FTS 'integrity-check' command is a write; comparing row counts is not
+        indexed = conn.execute("SELECT COUNT(*) FROM notes_fts_docsize").fetchone()[0]
+        total = conn.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+        report["fts"] = "ok" if indexed == total else f"{indexed} indexed rows for {total} notes"
+    return report
+
+
+SECTIONS = [("overview", "📋", overview), ("users", "👥", users), ("notes", "📝", notes),
+            ("integrity", "🔗", integrity), ("indexes", "📇", indexes)]
+
+LISTS = {
+    "users": "SELECT id, username, email, created_at FROM users ORDER BY id",
+    "notes": """SELECT id, user_id, title, folder_id, is_deleted, is_favorite, dirty, updated_at, version
+                FROM notes ORDER BY id""",
+    "folders": "SELECT id, user_id, name, created_at, updated_at FROM folders ORDER BY id",
+}
+
+
+# Output ----------------------------------------------------------------------
+
+def print_text(name, icon, data, indent=""):
+    if name:
+        print(f"\n{icon} === {name} ===")
+    for key, value in data.items():
+        if isinstance(value, dict):
+            print(f"{indent}{key}:")
+            print_text(None, None, value, indent + "   ")
+        elif isinstance(value, list) and value and isinstance(value[0], dict):
+            print(f"{indent}{key}:")
+            for item in value:
+                print(f"{indent}   " + ", ".join(f"{k}={v}" for k, v in item.items()))
         else:
-            print("❌ notes table not found")
-        
-        # Check folders table
-        if ('folders',) in tables:
-            print(f"\n📁 === Folders Data ===")
-            cursor.execute("SELECT COUNT(*) FROM folders")
-            folder_count = cursor.fetchone()[0]
-            print(f"📁 Folder count: {folder_count}")
-            
-            if folder_count > 0:
-                cursor.execute("SELECT id, name, user_id, created_at FROM folders ORDER BY id")
-                folders = cursor.fetchall()
-                print("📂 Folders list:")
-                for folder in folders:
-                    print(f"   ID: {folder[0]}, Name: {folder[1]}, User ID: {folder[2]}, Created: {folder[3]}")
-            else:
-                print("ℹ️ No folders data")
-        
-        # Check sync queue table
-        if ('sync_queue',) in tables:
-            print(f"\n🔄 === Sync Queue Data ===")
-            cursor.execute("SELECT COUNT(*) FROM sync_queue")
-            sync_count = cursor.fetchone()[0]
-            print(f"🔄 Sync queue count: {sync_count}")
-            
-            if sync_count > 0:
-                cursor.execute("SELECT id, user_id, action, note_id, created_at FROM sync_queue ORDER BY id")
-                sync_items = cursor.fetchall()
-                print("📋 Sync queue list:")
-                for item in sync_items:
-                    print(f"   ID: {item[0]}, User ID: {item[1]}, Action: {item[2]}, Note ID: {item[3]}, Created: {item[4]}")
-            else:
-                print("ℹ️ No sync queue data")
-        
+            print(f"{indent}{key}: {value}")
+
+
+def emit(as_json, name, icon, data):
+    if as_json:
+        print(json.dumps({"section": name, **data}, default=str))
+    else:
+        print_text(name, icon, data)
+    sys.stdout.flush()
+
+
+def run(db_path, opts, as_json=False, only=None, run_checks=False, list_table=None):
+    if not os.path.exists(db_path):
+        emit(as_json, "error", "❌", {"message": f"Database file does not exist: {db_path}"})
+        return False
+    conn = open_readonly(db_path)
+    try:
+        if list_table:
+            # Stream rows straight from the cursor; never hold the table in memory
+            sql = LISTS[list_table] + (f" LIMIT {int(opts.max_rows)}" if opts.max_rows else "")
+            for r in conn.execute(sql):
+                print(json.dumps(dict(r), default=str) if as_json else "   " + ", ".join(f"{k}: {r[k]}" for k in r.keys()))
+            return True
+        present = tables(conn)
+        sections = [s for s in SECTIONS if not only or s[0] in only]
+        if run_checks:
+            sections.append(("checks", "🩺", checks))
+        for name, icon, func in sections:
+            if name in ("users", "notes", "integrity") and not {"users", "notes", "folders"} <= present:
+                emit(as_json, name, icon, {"skipped": "users/notes/folders tables missing"})
+                continue
+            started = time.perf_counter()
+            data = func(conn, opts)
+            data["ms"] = round((time.perf_counter() - started) * 1000, 1)
+            emit(as_json, name, icon, data)
+        return True
+    finally:
         conn.close()
-        print(f"\n✅ {db_name} database check completed")
-        
-    except Exception as e:
-        print(f"❌ Error checking {db_name} database: {e}")
+
 
 def main():
-    print("🔍 Database Comprehensive Check Tool")
-    print("=" * 50)
-    
-    # Check backend database
-    backend_db = 'mynote_sync.db'
-    check_database(backend_db, 'Backend Database')
-    
-    # Check root directory database (if exists)
-    root_db = '../mynote_sync.db'
-    if os.path.exists(root_db):
-        check_database(root_db, 'Root Directory Database')
-    else:
-        print(f"\nℹ️ Root directory database does not exist: {root_db}")
-    
-    print(f"\n💡 Note: Frontend app uses local SQLite database 'mynote.db'")
-    print(f"   Backend server uses database 'server/mynote_sync.db'")
-    print(f"   Both databases sync data through API")
-    
-    print("\n🎉 Check completed!")
+    parser = argparse.ArgumentParser(description="Read-only diagnostics for the sync server database")
+    parser.add_argument("db_path", nargs="?", default=DEFAULT_DB, help=f"database file (default {DEFAULT_DB})")
+    parser.add_argument("--json", action="store_true", help="one JSON object per section (NDJSON)")
+    parser.add_argument("--section", action="append", choices=[s[0] for s in SECTIONS],
+                        help="only run these sections (repeatable)")
+    parser.add_argument("--sample", type=float, default=1.0, help="fraction of notes used for note statistics (0-1]")
+    parser.add_argument("--max-rows", type=int, default=None, help="cap on notes scanned for note statistics / rows listed")
+    parser.add_argument("--top", type=int, default=10, help="length of top-N lists and example id lists")
+    parser.add_argument("--check", action="store_true", help="also run PRAGMA quick_check and check the FTS row count")
+    parser.add_argument("--full-check", action="store_true", help="with --check, also run PRAGMA integrity_check (slow)")
+    parser.add_argument("--list", choices=sorted(LISTS), help="stream the rows of one table instead of statistics")
+    args = parser.parse_args()
+    if not 0 < args.sample <= 1:
+        parser.error("--sample must be in (0, 1]")
+
+    opts = Options(sample=args.sample, max_rows=args.max_rows, top=args.top, full_check=args.full_check)
+    if not args.json and not args.list:
+        print("🔍 Database Diagnostics")
+        print(f"   {args.db_path} (read-only)")
+    ok = run(args.db_path, opts, as_json=args.json, only=args.section, run_checks=args.check or args.full_check,
+             list_table=args.list)
+    sys.exit(0 if ok else 1)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,101 @@
+"""
+Response compression negotiated through Accept-Encoding.
+
+gzip is always available; zstd and brotli are used when the optional
+``zstandard`` / ``brotli`` packages are installed. Small bodies are sent as-is
+because compressing them costs more CPU than it saves on the wire.
+"""
+
+import gzip
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = ("application/json", "application/x-ndjson", "text/plain", "text/html", "text/markdown")
+
+
+def available_encodings():
+    """Encodings this process can produce, most preferred first"""
+    encodings = []
+    if zstandard is not None:
+        encodings.append("zstd")
+    if brotli is not None:
+        encodings.append("br")
+    encodings.append("gzip")
+    return encodings
+
+
+def negotiate(accept_encodings):
+    """Pick an encoding from werkzeug's parsed Accept-Encoding, or None for identity"""
+    choice = accept_encodings.best_match(available_encodings())
+    if choice and accept_encodings.quality(choice) > 0:
+        return choice
+    return None
+
+
+def compress(data, encoding, level=5):
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    if encoding == "br":
+        return brotli.compress(data, quality=4)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def compress_stream(chunks, encoding, level=5):
+    """Compress an iterable of str/bytes chunks, flushing after each one"""
+    if encoding == "zstd":
+        compressor = zstandard.ZstdCompressor(level=3).compressobj()
+        feed = lambda chunk: compressor.compress(chunk) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        finish = compressor.flush
+    elif encoding == "br":
+        compressor = brotli.Compressor(quality=4)
+        feed = lambda chunk: compressor.process(chunk) + compressor.flush()
+        finish = compressor.finish
+    else:
+        # wbits=31 writes a gzip header/trailer around the deflate stream
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        feed = lambda chunk: compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        finish = compressor.flush
+    # Flushing per chunk lets each one reach the client promptly instead of sitting in the window
+    for chunk in chunks:
+        out = feed(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+        if out:
+            yield out
+    tail = finish()
+    if tail:
+        yield tail
+
+
+def compress_response(response, accept_encodings, min_size=1024):
+    """Compress a Flask response in place when the client accepts it and it is worth it"""
+    if response.status_code not in (200, 201) or "Content-Encoding" in response.headers:
+        return response
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate(accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        response.set_data(compress(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    # Keep the strong ETag distinct per encoding, as HTTP requires for strong validators
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f"{etag}-{encoding}")
+    return response
@@ -0,0 +1,272 @@
+"""
+Pooled SQLite connections for the sync server.
+
+Connections are opened once, switched to WAL journaling and tuned with
+pragmas, then handed out to request handlers and returned to the pool when
+the handler calls ``conn.close()``. The pool is bounded: when every
+connection is checked out, callers wait up to ``timeout`` seconds before a
+``PoolTimeout`` is raised.
+
+Optional ``on_statement(sql, params, seconds)`` and ``on_checkout(wait_seconds)``
+callbacks let the app time every statement and pool checkout (see metrics.py);
+``on_connect(conn)`` runs once per new connection, e.g. to register SQL functions.
+
+With ``read_only=True`` connections are opened through a ``mode=ro`` URI with
+``PRAGMA query_only`` and in autocommit mode, so every statement reads the
+latest committed WAL snapshot without ever taking a write lock; run
+``BEGIN`` explicitly to read several statements from one snapshot.
+"""
+
+import pathlib
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    """Raised when no pooled connection became free within the timeout"""
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor reporting each execute() to the pool's on_statement callback.
+
+    Only the first step of a SELECT runs inside execute(); time spent fetching
+    further rows is not included.
+    """
+
+    def _observer(self):
+        pool = getattr(self.connection, "pool", None)
+        return pool.on_statement if pool is not None else None
+
+    def execute(self, sql, params=()):
+        observer = self._observer()
+        if observer is None:
+            return super().execute(sql, params)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            observer(sql, params, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_params):
+        observer = self._observer()
+        if observer is None:
+            return super().executemany(sql, seq_of_params)
+        seq_of_params = list(seq_of_params)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_params)
+        finally:
+            observer(sql, seq_of_params[0] if seq_of_params else None, time.perf_counter() - started)
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() gives it back to its pool"""
+
+    pool = None
+    checked_out = False
+    lease = 0  # changes on every checkout, see ConnectionPool.release()
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # Connection.execute() builds its cursor in C without calling cursor(),
+    # so route the shortcuts through TimedCursor explicitly
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+        else:
+            self.pool.release(self)
+
+    def close_for_real(self):
+        self.pool = None
+        super().close()
+
+
+class ConnectionPool:
+    """Bounded pool of WAL-mode SQLite connections to a single database file"""
+
+    def __init__(self, path, max_size=8, timeout=10.0, busy_timeout_ms=5000,
+                 synchronous="NORMAL", cache_size_kib=16384, mmap_size=268435456,
+                 on_statement=None, on_checkout=None, on_connect=None, read_only=False):
+        self.path = path
+        self.read_only = read_only
+        self.max_size = max_size
+        self.timeout = timeout
+        self.busy_timeout_ms = busy_timeout_ms
+        self.synchronous = synchronous
+        self.cache_size_kib = cache_size_kib
+        self.mmap_size = mmap_size
+        self.on_statement = on_statement
+        self.on_checkout = on_checkout
+        self.on_connect = on_connect
+
+        self._cond = threading.Condition()
+        self._idle = []  # LIFO so the most recently used (warmest) connection is reused first
+        self._all = set()
+        self._closed = False
+
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+        self._timeouts = 0
+        self._created = 0
+
+    def _connect(self):
+        if self.read_only:
+            # The database (and its WAL mode) must already exist
+            conn = sqlite3.connect(
+                pathlib.Path(self.path).absolute().as_uri() + "?mode=ro",
+                uri=True,
+                timeout=self.busy_timeout_ms / 1000.0,
+                check_same_thread=False,
+                factory=PooledConnection,
+                isolation_level=None,
+            )
+            conn.execute("PRAGMA query_only=1")
+        else:
+            conn = sqlite3.connect(
+                self.path,
+                timeout=self.busy_timeout_ms / 1000.0,
+                check_same_thread=False,  # the pool guarantees one thread at a time
+                factory=PooledConnection,
+                # Take the write lock when the implicit transaction starts instead of
+                # upgrading a read snapshot later, which WAL reports as an instant
+                # SQLITE_BUSY without honouring busy_timeout.
+                isolation_level="IMMEDIATE",
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        # Negative cache_size is in KiB rather than pages
+        conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kib)}")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        if self.on_connect is not None:
+            self.on_connect(conn)
+        conn.pool = self
+        return conn
+
+    def acquire(self, timeout=None):
+        """Check a connection out of the pool, opening a new one if allowed"""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        waited = False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise sqlite3.ProgrammingError("Connection pool is closed")
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if len(self._all) < self.max_size:
+                    conn = None
+                    # Reserve the slot now, open the connection outside the lock
+                    placeholder = object()
+                    self._all.add(placeholder)
+                    break
+                remaining = timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(f"No database connection available after {timeout:.1f}s")
+                waited = True
+                self._cond.wait(remaining)
+
+            elapsed = time.monotonic() - started
+            self._checkouts += 1
+            lease = self._checkouts
+            if waited:
+                self._waits += 1
+                self._wait_seconds += elapsed
+                self._max_wait_seconds = max(self._max_wait_seconds, elapsed)
+        if self.on_checkout is not None:
+            self.on_checkout(elapsed)
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._all.discard(placeholder)
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._all.discard(placeholder)
+                self._all.add(conn)
+                self._created += 1
+        conn.lease = lease
+        conn.checked_out = True
+        return conn
+
+    def release(self, conn, lease=None):
+        """Return a connection to the pool, rolling back anything left open.
+
+        Pass the ``lease`` seen at checkout when releasing on someone's behalf
+        later on: if the connection was released and handed to another caller
+        in the meantime, it is left alone.
+        """
+        if not conn.checked_out or (lease is not None and lease != conn.lease):
+            return  # already released
+        conn.checked_out = False
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # Broken connection: drop it so a fresh one is opened next time
+            with self._cond:
+                self._all.discard(conn)
+                self._cond.notify()
+            conn.close_for_real()
+            return
+        with self._cond:
+            if self._closed or conn not in self._all:
+                self._all.discard(conn)
+                conn.close_for_real()
+                return
+            self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """Close idle connections; checked-out ones are closed when released"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            for conn in idle:
+                self._all.discard(conn)
+            self._cond.notify_all()
+        for conn in idle:
+            conn.close_for_real()
+
+    def stats(self):
+        with self._cond:
+            size = len(self._all)
+            idle = len(self._idle)
+            return {
+                "max_size": self.max_size,
+                "size": size,
+                "idle": idle,
+                "in_use": size - idle,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "wait_seconds_total": round(self._wait_seconds, 6),
+                "wait_seconds_max": round(self._max_wait_seconds, 6),
+                "timeouts": self._timeouts,
+                "connections_created": self._created,
+            }
@@ -0,0 +1,136 @@
+"""
+Background maintenance jobs for the sync server.
+
+A ``MaintenanceScheduler`` runs registered jobs on one daemon thread, each
+on its own interval. Every run gets a ``Budget``: batched jobs check
+``budget.expired()`` between batches and pick up where they left off on the
+next run, and single long statements (ANALYZE, incremental_vacuum) are cut
+off by a SQLite progress handler via ``budget.interruptible(conn)``.
+"""
+
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Budget:
+    """Time allowance for one job run"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.deadline = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.deadline - time.monotonic())
+
+    def expired(self):
+        return time.monotonic() >= self.deadline
+
+    @contextmanager
+    def interruptible(self, conn, every_n_ops=1000):
+        """Abort the running statement on `conn` once the budget is used up.
+
+        The statement then fails with sqlite3.OperationalError("interrupted")
+        and its changes are rolled back.
+        """
+        conn.set_progress_handler(lambda: 1 if self.expired() else 0, every_n_ops)
+        try:
+            yield
+        finally:
+            conn.set_progress_handler(None, every_n_ops)
+
+
+def is_interrupt(error):
+    return isinstance(error, sqlite3.OperationalError) and "interrupted" in str(error)
+
+
+class Job:
+    def __init__(self, name, func, interval, budget_seconds, initial_delay):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.budget_seconds = budget_seconds
+        self.next_run = time.monotonic() + initial_delay
+        self.runs = 0
+        self.failures = 0
+        self.last_started_at = None
+        self.last_duration = None
+        self.last_result = None
+        self.last_error = None
+
+    def status(self):
+        return {
+            "interval_s": self.interval,
+            "budget_ms": round(self.budget_seconds * 1000),
+            "runs": self.runs,
+            "failures": self.failures,
+            "last_started_at": self.last_started_at,
+            "last_duration_ms": round(self.last_duration * 1000, 1) if self.last_duration is not None else None,
+            "last_result": self.last_result,
+            "last_error": self.last_error,
+            "next_run_in_s": round(max(0.0, self.next_run - time.monotonic()), 1),
+        }
+
+
+class MaintenanceScheduler:
+    """Runs jobs one at a time on a background thread, each with its own interval and time budget"""
+
+    def __init__(self, default_budget=0.2):
+        self.default_budget = default_budget
+        self.jobs = {}
+        self._lock = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def add(self, name, func, interval, budget=None, initial_delay=None):
+        """Register func(budget) -> result; an interval <= 0 disables the job"""
+        if interval <= 0:
+            return
+        budget = self.default_budget if budget is None else budget
+        # Stagger first runs so a restart does not start every job at once
+        delay = initial_delay if initial_delay is not None else min(interval, 30.0 + 5.0 * len(self.jobs))
+        self.jobs[name] = Job(name, func, interval, budget, delay)
+
+    def run_job(self, name):
+        """Run one job now (also used by tools and tests); returns its result"""
+        job = self.jobs[name]
+        job.last_started_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        started = time.monotonic()
+        try:
+            job.last_result = job.func(Budget(job.budget_seconds))
+            job.last_error = None
+        except Exception as e:
+            job.failures += 1
+            job.last_error = str(e)
+            print(f"Maintenance job {name} failed: {e}")
+        finally:
+            job.runs += 1
+            job.last_duration = time.monotonic() - started
+            job.next_run = time.monotonic() + job.interval
+        return job.last_result
+
+    def start(self):
+        if self._thread is None and self.jobs:
+            self._thread = threading.Thread(target=self._run, name="maintenance", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            self._lock.notify()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._stopped:
+                    return
+                job = min(self.jobs.values(), key=lambda j: j.next_run)
+                wait = job.next_run - time.monotonic()
+                if wait > 0:
+                    self._lock.wait(wait)
+                    continue
+            self.run_job(job.name)
+
+    def stats(self):
+        return {name: job.status() for name, job in self.jobs.items()}
@@ -0,0 +1,210 @@
+"""
+Publish/subscribe between server worker processes.
+
+Each worker keeps its own Socket.IO clients, so an event emitted by the
+worker that handled a write only reaches the devices connected to that
+worker. Workers therefore also ``publish(channel, message)`` the event on a
+bus, and every *other* worker delivers it to its own subscribers; the
+publishing process applies the effect locally itself.
+
+- ``LocalBus``: a single process, publishing is a no-op.
+- ``SQLiteBus``: a shared SQLite file used as a broker. One background
+  thread per process writes the outgoing messages in batches and polls
+  ``PRAGMA data_version`` (changes only when another process committed) to
+  read new ones. Messages older than ``retention`` seconds are deleted.
+
+``create_bus(spec)`` picks the backend from ``MYNOTE_MESSAGE_BUS``. Another
+broker (e.g. Redis) can be plugged in with an object offering the same
+``publish``, ``subscribe``, ``start``, ``stop`` and ``stats`` methods.
+Messages must be JSON-serializable.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+
+class LocalBus:
+    """Single-process bus: there is nobody else to deliver to"""
+
+    shared = False
+
+    def __init__(self):
+        self.published = 0
+
+    def subscribe(self, channel, callback):
+        pass
+
+    def publish(self, channel, message):
+        self.published += 1
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def stats(self):
+        return {"backend": "local", "published": self.published}
+
+
+class SQLiteBus:
+    """Broker in a shared SQLite file, polled by one thread per process"""
+
+    shared = True
+
+    def __init__(self, path, poll_interval=0.01, retention=60.0, batch_size=500):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.batch_size = batch_size
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+        self._subscribers = {}  # channel -> [callback]
+        self._outbox = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+        self._last_seq = 0
+        self._last_prune = 0.0
+
+        self.published = 0
+        self.received = 0
+        self.delivery_errors = 0
+        self.poll_errors = 0
+
+    def subscribe(self, channel, callback):
+        """Call callback(message) for each message another process publishes on channel"""
+        self._subscribers.setdefault(channel, []).append(callback)
+
+    def publish(self, channel, message):
+        payload = json.dumps(message, separators=(",", ":"))
+        with self._cond:
+            self._outbox.append((channel, payload))
+            self.published += 1
+            self._cond.notify()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, isolation_level=None)
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # losing the last messages on power loss is fine
+        conn.execute("""
+          CREATE TABLE IF NOT EXISTS bus_messages(
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            origin TEXT NOT NULL,
+            channel TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created REAL NOT NULL
+          )
+        """)
+        return conn
+
+    def start(self):
+        if self._thread is not None:
+            return
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(ready,), name="message-bus", daemon=True)
+        self._thread.start()
+        ready.wait(10)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(5)
+            self._thread = None
+
+    def _run(self, ready):
+        conn = self._connect()
+        # Only messages published from now on are delivered
+        self._last_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM bus_messages").fetchone()[0]
+        ready.set()
+        data_version = None
+        try:
+            while True:
+                with self._cond:
+                    if not self._outbox and not self._stopped:
+                        self._cond.wait(self.poll_interval)
+                    outbox, self._outbox = self._outbox, []
+                    stopped = self._stopped
+                try:
+                    if outbox:
+                        self._write(conn, outbox)
+                    current = conn.execute("PRAGMA data_version").fetchone()[0]
+                    if current != data_version:
+                        data_version = current
+                        self._read(conn)
+                    if time.monotonic() - self._last_prune >= self.retention / 2:
+                        self._last_prune = time.monotonic()
+                        conn.execute("DELETE FROM bus_messages WHERE created < ?", (time.time() - self.retention,))
+                except sqlite3.Error as e:
+                    self.poll_errors += 1
+                    print(f"Message bus error: {e}")
+                    if outbox:
+                        with self._cond:
+                            self._outbox[:0] = outbox  # retry on the next round
+                    time.sleep(self.poll_interval)
+                if stopped:
+                    return
+        finally:
+            conn.close()
+
+    def _write(self, conn, outbox):
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT INTO bus_messages(origin, channel, payload, created) VALUES (?,?,?,?)",
+                             [(self.origin, channel, payload, now) for channel, payload in outbox])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _read(self, conn):
+        while True:
+            rows = conn.execute("SELECT seq, origin, channel, payload FROM bus_messages WHERE seq > ? ORDER BY seq LIMIT ?",
+                                (self._last_seq, self.batch_size)).fetchall()
+            for seq, origin, channel, payload in rows:
+                self._last_seq = seq
+                if origin == self.origin:
+                    continue
+                self.received += 1
+                for callback in self._subscribers.get(channel, ()):
+                    try:
+                        callback(json.loads(payload))
+                    except Exception as e:
+                        self.delivery_errors += 1
+                        print(f"Error delivering {channel} message: {e}")
+            if len(rows) < self.batch_size:
+                return
+
+    def stats(self):
+        with self._cond:
+            queued = len(self._outbox)
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "published": self.published,
+            "received": self.received,
+            "queued": queued,
+            "delivery_errors": self.delivery_errors,
+            "poll_errors": self.poll_errors,
+        }
+
+
+def create_bus(spec):
+    """'local' (default) or 'sqlite:<path>'"""
+    spec = (spec or "local").strip()
+    if spec == "local":
+        return LocalBus()
+    if spec.startswith("sqlite:"):
+        path = spec[len("sqlite:"):]
+        if not path:
+            raise ValueError("sqlite message bus needs a path, e.g. sqlite:/var/lib/mynote/bus.db")
+        return SQLiteBus(path)
+    raise ValueError(f"Unknown message bus {spec!r}")
@@ -0,0 +1,236 @@
+"""
+In-process metrics for the sync server, rendered in Prometheus text format.
+
+Only what /api/metrics needs is implemented: counters and histograms with
+optional labels, a per-thread accumulator for SQL work done by the current
+request, and a slow-query log that records statement text and the *shapes*
+of bound parameters (types and lengths, never values).
+"""
+
+import bisect
+import collections
+import threading
+import time
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _fmt(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = collections.defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for values, total in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, values)} {_fmt(total)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labelvalues -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 2)
+            series[i] += 1  # i == len(buckets) is the +Inf bucket
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = sorted((k, list(v)) for k, v in self._series.items())
+        for values, series in snapshot:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), series):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, values, ('le', _fmt(float(bound))))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, values)} {_fmt(round(series[-2], 6))}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, values)} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    """Value computed at scrape time from a callback returning {labelvalues: value}.
+
+    ``kind="counter"`` exposes totals that some other component already keeps.
+    """
+
+    def __init__(self, name, help_text, labelnames, collect, kind="gauge"):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+        self.kind = kind
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, values)} {_fmt(value)}")
+        return lines
+
+
+def param_shapes(params):
+    """Describe bound parameters without their values, e.g. ['int', 'str[12]', 'None']"""
+    if params is None:
+        return []
+    if isinstance(params, dict):
+        return {k: param_shapes([v])[0] for k, v in params.items()}
+    shapes = []
+    for p in params:
+        if p is None:
+            shapes.append("None")
+        elif isinstance(p, (str, bytes)):
+            shapes.append(f"{type(p).__name__}[{len(p)}]")
+        else:
+            shapes.append(type(p).__name__)
+    return shapes
+
+
+class Metrics:
+    """All server metrics plus the hooks the app and the connection pool call"""
+
+    def __init__(self, slow_query_ms=100.0, slow_log_size=50, top_rooms=20):
+        self.slow_query_seconds = slow_query_ms / 1000.0
+        self.top_rooms = top_rooms
+        self.slow_queries = collections.deque(maxlen=slow_log_size)
+        self._slow_lock = threading.Lock()
+        self._request = threading.local()
+        self._rooms = collections.Counter()
+        self._rooms_lock = threading.Lock()
+        self.collectors = []
+
+        self.http_duration = Histogram("mynote_http_request_duration_seconds",
+                                       "Request latency by endpoint", ("method", "endpoint", "status"))
+        self.sql_duration = Histogram("mynote_sql_statement_duration_seconds",
+                                      "Time spent executing single SQL statements", ("kind",))
+        self.sql_per_request = Histogram("mynote_sql_statements_per_request",
+                                         "SQL statements executed per request", ("endpoint",), COUNT_BUCKETS)
+        self.sql_time_per_request = Histogram("mynote_sql_seconds_per_request",
+                                              "Time spent in SQL per request", ("endpoint",))
+        self.pool_wait = Histogram("mynote_db_pool_wait_seconds",
+                                   "Time waited to check a connection out of the pool")
+        self.slow_total = Counter("mynote_sql_slow_statements_total",
+                                  "Statements slower than the slow-query threshold", ("kind",))
+        self.emits = Counter("mynote_socketio_emits_total", "Socket.IO events emitted", ("event",))
+        self.collectors += [self.http_duration, self.sql_duration, self.sql_per_request,
+                            self.sql_time_per_request, self.pool_wait, self.slow_total, self.emits,
+                            Gauge("mynote_socketio_room_events_total",
+                                  "Events emitted to the busiest rooms", ("room",), self._room_counts, "counter")]
+
+    # Request lifecycle ---------------------------------------------------
+
+    def begin_request(self):
+        self._request.started = time.perf_counter()
+        self.begin_capture()
+
+    def end_request(self, method, endpoint, status):
+        started = getattr(self._request, "started", None)
+        if started is None:
+            return
+        self._request.started = None
+        statements, sql_seconds = self.end_capture()
+        self.http_duration.observe(time.perf_counter() - started, method, endpoint, str(status))
+        self.sql_per_request.observe(statements, endpoint)
+        self.sql_time_per_request.observe(sql_seconds, endpoint)
+
+    # SQL done on behalf of a request by another thread (the group-commit
+    # writer) is captured there and added to the submitting request
+
+    def begin_capture(self):
+        self._request.capturing = True
+        self._request.statements = 0
+        self._request.sql_seconds = 0.0
+
+    def end_capture(self):
+        """Stop counting on this thread; returns (statements, seconds) since begin_capture()"""
+        self._request.capturing = False
+        return self._request.statements, self._request.sql_seconds
+
+    def add_request_sql(self, work):
+        if getattr(self._request, "capturing", False):
+            self._request.statements += work[0]
+            self._request.sql_seconds += work[1]
+
+    # Hooks ----------------------------------------------------------------
+
+    def on_statement(self, sql, params, seconds):
+        kind = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else "?"
+        self.sql_duration.observe(seconds, kind)
+        if getattr(self._request, "capturing", False):
+            self._request.statements += 1
+            self._request.sql_seconds += seconds
+        if seconds >= self.slow_query_seconds:
+            self.slow_total.inc(kind)
+            entry = {"sql": " ".join(sql.split()), "params": param_shapes(params),
+                     "ms": round(seconds * 1000.0, 3), "at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+            with self._slow_lock:
+                self.slow_queries.appendleft(entry)
+            print(f"[slow-sql] {entry['ms']}ms {entry['sql']} params={entry['params']}")
+
+    def recent_slow_queries(self):
+        """The slow-query log, newest first"""
+        with self._slow_lock:
+            return list(self.slow_queries)
+
+    def on_pool_checkout(self, wait_seconds):
+        self.pool_wait.observe(wait_seconds)
+
+    def on_emit(self, event, room):
+        self.emits.inc(event)
+        if room:
+            with self._rooms_lock:
+                self._rooms[room] += 1
+
+    def _room_counts(self):
+        with self._rooms_lock:
+            return {(room,): n for room, n in self._rooms.most_common(self.top_rooms)}
+
+    def add_gauge(self, name, help_text, labelnames, collect, kind="gauge"):
+        self.collectors.append(Gauge(name, help_text, labelnames, collect, kind))
+
+    def render(self):
+        lines = []
+        for collector in self.collectors:
+            lines.extend(collector.render())
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,195 @@
+"""
+Versioned schema migrations keyed on ``PRAGMA user_version``.
+
+Each ``Migration`` has a version (1, 2, 3, ... in order), a ``ddl(c)``
+step and optionally a ``backfill(c, position, limit)`` step:
+
+- ``ddl`` changes the schema and returns where the backfill should start,
+  or None when there is nothing to backfill.
+- ``backfill`` processes at most ``limit`` rows after ``position`` and
+  returns ``(rows, next_position)``; ``next_position`` is None once done.
+  Positions must be JSON-serializable (e.g. the last id processed).
+- ``count(c, position)``, if given, estimates the rows still to backfill.
+
+The DDL runs in one transaction together with a row in ``schema_migrations``
+recording the start position. Each backfill batch commits its rows and the
+new position together, so an interrupted migration resumes from the last
+committed batch. ``user_version`` moves to the migration's version in the
+same transaction as its last step.
+"""
+
+import json
+import time
+
+
+class Migration:
+    def __init__(self, version, name, ddl, backfill=None, count=None):
+        self.version = version
+        self.name = name
+        self.ddl = ddl
+        self.backfill = backfill
+        self.count = count
+
+
+class MigrationError(Exception):
+    """A migration step failed; work committed by earlier batches is kept"""
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def print_progress(migration, rows_done, remaining):
+    left = f", ~{remaining} left" if remaining is not None else ""
+    print(f"[migrate] v{migration.version} {migration.name}: {rows_done} rows{left}")
+
+
+class MigrationRunner:
+    """Brings a database up to the newest migration in `migrations`"""
+
+    def __init__(self, conn, migrations, batch_size=1000, on_progress=print_progress, progress_interval=2.0):
+        versions = [m.version for m in migrations]
+        if versions != list(range(1, len(migrations) + 1)):
+            raise ValueError(f"Migration versions must be 1..N in order, got {versions}")
+        self.conn = conn
+        self.migrations = migrations
+        self.batch_size = batch_size
+        self.on_progress = on_progress or (lambda *args: None)
+        self.progress_interval = progress_interval
+
+    @property
+    def latest(self):
+        return len(self.migrations)
+
+    def pending(self):
+        return self.migrations[schema_version(self.conn):]
+
+    def _ensure_progress_table(self, c):
+        c.execute("""
+          CREATE TABLE IF NOT EXISTS schema_migrations(
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            position TEXT,
+            rows_done INTEGER NOT NULL DEFAULT 0,
+            started_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%SZ', 'now')),
+            finished_at TEXT
+          )
+        """)
+
+    def _progress(self, c, version):
+        c.execute("SELECT position, rows_done FROM schema_migrations WHERE version=? AND finished_at IS NULL", (version,))
+        return c.fetchone()
+
+    def _finish(self, c, migration):
+        c.execute("""UPDATE schema_migrations SET position=NULL,
+                     finished_at=strftime('%Y-%m-%dT%H:%M:%SZ', 'now') WHERE version=?""", (migration.version,))
+        c.execute(f"PRAGMA user_version = {int(migration.version)}")
+
+    def status(self):
+        """Applied and pending migrations, with backfill progress for unfinished ones"""
+        c = self.conn.cursor()
+        current = schema_version(self.conn)
+        c.execute("SELECT 1 FROM sqlite_master WHERE name='schema_migrations'")
+        has_table = c.fetchone() is not None
+        report = []
+        for m in self.migrations:
+            row = self._progress(c, m.version) if has_table else None
+            report.append({
+                "version": m.version,
+                "name": m.name,
+                "applied": m.version <= current,
+                "in_progress": row is not None,
+                "rows_done": row[1] if row is not None else None,
+            })
+        return report
+
+    def run(self, dry_run=False):
+        """Apply pending migrations; returns one report dict per migration touched.
+
+        With dry_run=True every pending DDL step is executed inside a single
+        transaction that is rolled back, and backfills are only counted.
+        """
+        if dry_run:
+            return self._dry_run()
+        reports = []
+        for migration in self.pending():
+            started = time.monotonic()
+            try:
+                rows = self._apply(migration)
+            except Exception as e:
+                if self.conn.in_transaction:
+                    self.conn.rollback()
+                raise MigrationError(f"v{migration.version} {migration.name} failed: {e}") from e
+            reports.append({"version": migration.version, "name": migration.name, "rows": rows,
+                            "seconds": round(time.monotonic() - started, 3)})
+        return reports
+
+    def _apply(self, migration):
+        c = self.conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        if schema_version(self.conn) >= migration.version:
+            # Another process (e.g. a second worker starting up) got here first
+            self.conn.rollback()
+            return 0
+        self._ensure_progress_table(c)
+        row = self._progress(c, migration.version)
+        if row is None:
+            position = migration.ddl(c)
+            rows_done = 0
+            c.execute("INSERT OR REPLACE INTO schema_migrations(version, name, position) VALUES (?,?,?)",
+                      (migration.version, migration.name, json.dumps(position)))
+        else:
+            # Resuming: the DDL committed earlier, carry on from the saved position
+            position, rows_done = json.loads(row[0]), row[1]
+        if migration.backfill is None or position is None:
+            self._finish(c, migration)
+            self.conn.commit()
+            return rows_done
+        self.conn.commit()
+
+        last_report = time.monotonic()
+        while position is not None:
+            c.execute("BEGIN IMMEDIATE")
+            # Re-read the position so two processes never backfill the same batch
+            row = self._progress(c, migration.version)
+            if row is None:
+                self.conn.rollback()
+                return rows_done
+            position, rows_done = json.loads(row[0]), row[1]
+            rows, position = migration.backfill(c, position, self.batch_size)
+            rows_done += rows
+            c.execute("UPDATE schema_migrations SET position=?, rows_done=? WHERE version=?",
+                      (json.dumps(position), rows_done, migration.version))
+            if position is None:
+                self._finish(c, migration)
+            self.conn.commit()
+            if (position is None and rows_done) or time.monotonic() - last_report >= self.progress_interval:
+                if position is None:
+                    remaining = 0
+                else:
+                    remaining = migration.count(c, position) if migration.count else None
+                self.on_progress(migration, rows_done, remaining)
+                last_report = time.monotonic()
+        return rows_done
+
+    def _dry_run(self):
+        c = self.conn.cursor()
+        reports = []
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            self._ensure_progress_table(c)
+            for migration in self.pending():
+                row = self._progress(c, migration.version)
+                if row is None:
+                    position = migration.ddl(c)
+                    rows_done = 0
+                else:
+                    position, rows_done = json.loads(row[0]), row[1]
+                backfill = None
+                if migration.backfill is not None and position is not None:
+                    backfill = migration.count(c, position) if migration.count else "unknown"
+                reports.append({"version": migration.version, "name": migration.name,
+                                "resuming": row is not None, "rows_done": rows_done, "rows_to_backfill": backfill})
+        finally:
+            self.conn.rollback()
+        return reports
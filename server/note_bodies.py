@@ -0,0 +1,115 @@
+"""
+Compressed, deduplicated storage for large note bodies.
+
+When enabled, a note whose content is at least ``min_bytes`` long is written
+with ``notes.content = NULL`` and ``notes.body_hash`` pointing at a row of
+``note_bodies`` (SHA-256 of the UTF-8 text -> compressed bytes). Identical
+bodies are stored once. Smaller notes keep their content inline.
+
+Reads resolve the text in SQL with ``content_sql()``, which only inflates
+bodies for rows that are actually returned. The ``inflate(codec, data)``
+function it relies on is registered on every pooled connection by
+``register_functions``; tools that open the database directly must register
+it as well before reading resolved content or writing notes.
+"""
+
+import hashlib
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def inflate(codec, data):
+    if data is None:
+        return None
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    return zlib.decompress(data).decode("utf-8")
+
+
+def deflate(text):
+    raw = text.encode("utf-8")
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=6).compress(raw)
+    return "zlib", zlib.compress(raw, 6)
+
+
+def register_functions(conn):
+    conn.create_function("inflate", 2, inflate, deterministic=True)
+
+
+def content_sql(alias):
+    """SQL expression giving the note text for rows of `alias` (a table alias, or new/old in triggers)"""
+    return (f"COALESCE({alias}.content, (SELECT inflate(b.codec, b.data) FROM note_bodies b "
+            f"WHERE b.hash = {alias}.body_hash))")
+
+
+class BodyStore:
+    """Decides where note content goes on write"""
+
+    def __init__(self, enabled=False, min_bytes=1024):
+        self.enabled = enabled
+        self.min_bytes = min_bytes
+
+    def prepare(self, c, content):
+        """Return (content, body_hash) column values for `content`, storing the body if needed"""
+        if not self.enabled or content is None or len(content) < self.min_bytes // 4:
+            return content, None  # cheap pre-check: even 4-byte characters cannot reach min_bytes
+        raw = content.encode("utf-8")
+        if len(raw) < self.min_bytes:
+            return content, None
+        body_hash = hashlib.sha256(raw).hexdigest()
+        c.execute("SELECT 1 FROM note_bodies WHERE hash=?", (body_hash,))
+        if c.fetchone() is None:
+            codec, data = deflate(content)
+            c.execute("INSERT INTO note_bodies(hash, codec, data, size) VALUES (?,?,?,?)",
+                      (body_hash, codec, data, len(raw)))
+        return None, body_hash
+
+
+def migrate_inline_bodies(conn, store, batch_size=200):
+    """Move existing inline content at or above the threshold into note_bodies.
+
+    Works in short transactions of `batch_size` notes so writers are not
+    blocked; returns the number of notes converted.
+    """
+    converted = 0
+    last_id = 0
+    while True:
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        c.execute("""SELECT id, content FROM notes
+                     WHERE id > ? AND body_hash IS NULL AND length(CAST(content AS BLOB)) >= ?
+                     ORDER BY id LIMIT ?""", (last_id, store.min_bytes, batch_size))
+        rows = c.fetchall()
+        for row in rows:
+            content, body_hash = store.prepare(c, row["content"])
+            if body_hash is not None:
+                c.execute("UPDATE notes SET content=NULL, body_hash=? WHERE id=?", (body_hash, row["id"]))
+                converted += 1
+        conn.commit()
+        if len(rows) < batch_size:
+            return converted
+        last_id = rows[-1]["id"]
+
+
+def purge_unreferenced_bodies(conn, batch_size=500, budget=None):
+    """Delete bodies no note points at any more, `batch_size` per transaction; returns rows removed.
+
+    Stops early once `budget.expired()`; the next call carries on.
+    """
+    removed = 0
+    while True:
+        c = conn.cursor()
+        c.execute("""DELETE FROM note_bodies WHERE hash IN (
+                       SELECT hash FROM note_bodies
+                       WHERE NOT EXISTS (SELECT 1 FROM notes WHERE notes.body_hash = note_bodies.hash)
+                       LIMIT ?)""", (batch_size,))
+        deleted = c.rowcount
+        conn.commit()
+        removed += deleted
+        if deleted < batch_size or (budget is not None and budget.expired()):
+            return removed
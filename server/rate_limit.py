@@ -0,0 +1,152 @@
+"""
+Admission control for the API: per-user token buckets and a global
+concurrency cap.
+
+``RateLimiter`` keeps one token bucket per key (the ``X-User`` id). A bucket
+holds up to ``burst`` tokens and refills at ``rate`` tokens per second; each
+request takes one token, and a request finding the bucket empty is told how
+many seconds until the next token (for ``Retry-After``). A bucket is just
+``[tokens, last_refill]``, and buckets that have refilled completely are
+dropped once more than ``max_keys`` exist, since a missing bucket is a full
+one.
+
+``ConcurrencyLimiter`` admits at most ``max_active`` requests at a time. Up
+to ``max_queued`` more wait for a free slot for at most ``queue_timeout``
+seconds; anything beyond that is rejected right away.
+"""
+
+import collections
+import math
+import threading
+import time
+
+
+class RateLimiter:
+    """Token bucket per key; rate <= 0 disables the limit"""
+
+    def __init__(self, rate, burst, max_keys=100000, top_keys=20, clock=time.monotonic):
+        self.rate = rate
+        self.burst = max(1.0, float(burst))
+        self.enabled = rate > 0
+        self.max_keys = max_keys
+        self.top_keys = top_keys
+        self._clock = clock
+        self._buckets = {}  # key -> [tokens, last refill]
+        self._lock = threading.Lock()
+
+        self.allowed = 0
+        self.limited = 0
+        self._limited_by_key = collections.Counter()
+
+    def acquire(self, key):
+        """Take a token for key; returns 0 when allowed, else seconds until one is available"""
+        if not self.enabled:
+            return 0
+        now = self._clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._prune(now)
+                bucket = self._buckets[key] = [self.burst, now]
+            else:
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                self.allowed += 1
+                return 0
+            self.limited += 1
+            self._limited_by_key[key] += 1
+            if len(self._limited_by_key) > self.max_keys:
+                self._limited_by_key = collections.Counter(dict(self._limited_by_key.most_common(self.top_keys)))
+            return (1 - bucket[0]) / self.rate
+
+    def _prune(self, now):
+        full_after = self.burst / self.rate
+        for key in [k for k, (_, last) in self._buckets.items() if now - last >= full_after]:
+            del self._buckets[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "rate_per_second": self.rate,
+                "burst": self.burst,
+                "tracked_keys": len(self._buckets),
+                "allowed": self.allowed,
+                "limited": self.limited,
+                "top_limited": {str(k): n for k, n in self._limited_by_key.most_common(self.top_keys)},
+            }
+
+
+class ConcurrencyLimiter:
+    """At most max_active holders, a bounded queue of waiters; max_active <= 0 disables it"""
+
+    def __init__(self, max_active, max_queued=0, queue_timeout=5.0):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.enabled = max_active > 0
+        self._cond = threading.Condition()
+        self.active = 0
+        self.queued = 0
+
+        self.admitted = 0
+        self.waited = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def acquire(self):
+        """True once a slot is held; False if the queue is full or the wait timed out"""
+        if not self.enabled:
+            return True
+        with self._cond:
+            if self.active < self.max_active:
+                self.active += 1
+                self.admitted += 1
+                return True
+            if self.queued >= self.max_queued:
+                self.rejected += 1
+                return False
+            self.queued += 1
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while self.active >= self.max_active:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        return False
+                    self._cond.wait(remaining)
+                self.active += 1
+                self.admitted += 1
+                self.waited += 1
+                return True
+            finally:
+                self.queued -= 1
+
+    def release(self):
+        if not self.enabled:
+            return
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "enabled": self.enabled,
+                "max_active": self.max_active,
+                "max_queued": self.max_queued,
+                "active": self.active,
+                "queued": self.queued,
+                "admitted": self.admitted,
+                "waited": self.waited,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+            }
+
+
+def retry_after_header(seconds):
+    """Retry-After takes whole seconds; never tell a client to retry immediately"""
+    return str(max(1, math.ceil(seconds)))
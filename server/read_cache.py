@@ -0,0 +1,158 @@
+"""
+Per-user in-memory cache for folder listings and note metadata.
+
+Users are kept in LRU order; each cached folder listing or note metadata
+entry counts towards ``max_entries`` and the least recently used users are
+evicted as a whole once the budget is exceeded. Writers invalidate through
+``invalidate_folders`` / ``forget_notes``.
+
+A folder listing read from the database is only stored if no invalidation
+happened for that user since the read started (``folders_generation``), so
+a slow reader cannot put back a listing that a concurrent write made stale.
+Listings are stored with the change log seq they were read at and only
+served for that seq: writers invalidate after their commit, and in between
+the listing's ETag has already moved on.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class _UserEntry:
+    __slots__ = ("folders", "folders_seq", "notes", "generation")
+
+    def __init__(self):
+        self.folders = None
+        self.folders_seq = None
+        self.notes = OrderedDict()  # note id -> metadata dict
+        self.generation = 0
+
+    def size(self):
+        return len(self.notes) + (1 + len(self.folders) if self.folders is not None else 0)
+
+
+class UserCache:
+    """Bounded LRU of per-user folder listings and note metadata"""
+
+    def __init__(self, max_entries=50000, max_notes_per_user=1000):
+        self.max_entries = max_entries
+        self.max_notes_per_user = max_notes_per_user
+        self.enabled = max_entries > 0
+        self._users = OrderedDict()  # uid -> _UserEntry, least recently used first
+        self._generations = {}  # uid -> invalidation count, survives eviction
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self.hits = {"folders": 0, "note_meta": 0}
+        self.misses = {"folders": 0, "note_meta": 0}
+        self.evictions = 0
+
+    def _entry(self, uid, create=False):
+        entry = self._users.get(uid)
+        if entry is not None:
+            self._users.move_to_end(uid)
+        elif create:
+            entry = self._users[uid] = _UserEntry()
+        return entry
+
+    def _resize(self, entry, before):
+        self._size += entry.size() - before
+        while self._size > self.max_entries and len(self._users) > 1:
+            _, evicted = self._users.popitem(last=False)
+            self._size -= evicted.size()
+            self.evictions += 1
+
+    # Folder listings -------------------------------------------------------
+
+    def folders_generation(self, uid):
+        with self._lock:
+            return self._generations.get(uid, 0)
+
+    def get_folders(self, uid, seq):
+        """The cached listing, if it was read at change log position `seq`"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entry(uid)
+            if entry is None or entry.folders is None or entry.folders_seq != seq:
+                self.misses["folders"] += 1
+                return None
+            self.hits["folders"] += 1
+            return entry.folders
+
+    def put_folders(self, uid, rows, seq, generation):
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._generations.get(uid, 0) != generation:
+                return  # a write landed while these rows were being read
+            entry = self._entry(uid, create=True)
+            before = entry.size()
+            entry.folders = rows
+            entry.folders_seq = seq
+            self._resize(entry, before)
+
+    def invalidate_folders(self, uid):
+        with self._lock:
+            self._generations[uid] = self._generations.get(uid, 0) + 1
+            entry = self._users.get(uid)
+            if entry is not None and entry.folders is not None:
+                before = entry.size()
+                entry.folders = None
+                self._resize(entry, before)
+
+    # Note metadata ----------------------------------------------------------
+
+    def get_note(self, uid, note_id):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entry(uid)
+            meta = entry.notes.get(note_id) if entry is not None else None
+            if meta is None:
+                self.misses["note_meta"] += 1
+                return None
+            entry.notes.move_to_end(note_id)
+            self.hits["note_meta"] += 1
+            return meta
+
+    def put_note(self, uid, note_id, meta):
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self._entry(uid, create=True)
+            before = entry.size()
+            entry.notes[note_id] = meta
+            entry.notes.move_to_end(note_id)
+            while len(entry.notes) > self.max_notes_per_user:
+                entry.notes.popitem(last=False)
+            self._resize(entry, before)
+
+    def forget_notes(self, uid, note_ids):
+        with self._lock:
+            entry = self._users.get(uid)
+            if entry is None:
+                return
+            before = entry.size()
+            for note_id in note_ids:
+                entry.notes.pop(note_id, None)
+            self._resize(entry, before)
+
+    def clear(self):
+        with self._lock:
+            for uid in self._users:
+                self._generations[uid] = self._generations.get(uid, 0) + 1
+            self._users.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "users": len(self._users),
+                "entries": self._size,
+                "max_entries": self.max_entries,
+                "hits": dict(self.hits),
+                "misses": dict(self.misses),
+                "evictions": self.evictions,
+            }
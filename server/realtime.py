@@ -0,0 +1,122 @@
+"""
+Coalescing of realtime note events per Socket.IO room.
+
+Write handlers report which notes changed; instead of one emit per write, the
+batcher waits ``window`` seconds per ``user:{uid}`` room and then sends a
+single ``notes_changed`` event. When the changed notes fit in
+``max_payload_bytes`` the event carries their current rows, so receiving
+devices can apply them without pulling.
+"""
+
+import heapq
+import json
+import threading
+import time
+
+
+class EventBatcher:
+    """Buffers note changes per user and emits one notes_changed event per window"""
+
+    def __init__(self, emit, load_notes, window=0.15, max_payload_bytes=65536, now=None):
+        # emit(event, payload, room) sends to a Socket.IO room;
+        # load_notes(uid, ids) returns {id: row dict} for the notes that still exist
+        self._emit = emit
+        self._load_notes = load_notes
+        self.window = window
+        self.max_payload_bytes = max_payload_bytes
+        self._now = now or (lambda: None)
+
+        self._lock = threading.Condition()
+        self._pending = {}    # uid -> {note_id: op}
+        self._deadlines = []  # heap of (flush_at, uid)
+        self._thread = None
+        self._stopped = False
+
+        self.events_emitted = 0
+        self.changes_buffered = 0
+
+    def note_changed(self, uid, note_id, op):
+        self.notes_changed(uid, [note_id], op)
+
+    def notes_changed(self, uid, note_ids, op):
+        """Buffer `op` ('created', 'updated' or 'deleted') for each note id"""
+        if not note_ids:
+            return
+        with self._lock:
+            pending = self._pending.get(uid)
+            if pending is None:
+                pending = self._pending[uid] = {}
+                heapq.heappush(self._deadlines, (time.monotonic() + self.window, uid))
+                self._lock.notify()
+            for note_id in note_ids:
+                previous = pending.get(int(note_id))
+                # A note created inside the window is still "created" for the receivers
+                if previous == "created" and op == "updated":
+                    continue
+                pending[int(note_id)] = op
+            self.changes_buffered += len(note_ids)
+        self._ensure_thread()
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="realtime-batcher", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._stopped and (not self._deadlines or self._deadlines[0][0] > time.monotonic()):
+                    timeout = self._deadlines[0][0] - time.monotonic() if self._deadlines else None
+                    self._lock.wait(timeout)
+                if self._stopped and not self._deadlines:
+                    return
+                _, uid = heapq.heappop(self._deadlines)
+                changes = self._pending.pop(uid, {})
+            try:
+                self._flush(uid, changes)
+            except Exception as e:
+                print(f"Error emitting realtime batch for user {uid}: {e}")
+
+    def _flush(self, uid, changes):
+        if not changes:
+            return
+        payload = {
+            "user_id": uid,
+            "changes": [{"id": note_id, "op": op} for note_id, op in changes.items()],
+            "server_now": self._now(),
+        }
+        live_ids = [note_id for note_id, op in changes.items() if op != "deleted"]
+        notes = self._load_notes(uid, live_ids) if live_ids else {}
+        rows = [notes[note_id] for note_id in live_ids if note_id in notes]
+        # Rows are read after commit, so they are the latest state even if the
+        # note changed again within the window
+        if len(json.dumps(rows, separators=(",", ":"))) <= self.max_payload_bytes:
+            payload["notes"] = rows
+            payload["bodies_included"] = True
+        else:
+            payload["bodies_included"] = False
+        self._emit("notes_changed", payload, f"user:{uid}")
+        self.events_emitted += 1
+
+    def flush_all(self):
+        """Emit everything buffered right away (used on shutdown and in tools)"""
+        with self._lock:
+            pending, self._pending, self._deadlines = self._pending, {}, []
+        for uid, changes in pending.items():
+            self._flush(uid, changes)
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            self._lock.notify()
+        self.flush_all()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending_rooms": len(self._pending),
+                "changes_buffered": self.changes_buffered,
+                "events_emitted": self.events_emitted,
+            }
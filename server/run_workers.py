@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Run the sync server as several worker processes sharing one database.
+
+Worker i listens on port --port + i and is started with MYNOTE_WORKER_INDEX=i.
+All workers publish realtime events and sync status updates on a shared
+message bus (MYNOTE_MESSAGE_BUS, default a SQLite broker next to the
+database), so a device receives note events whichever worker handled the
+write. Worker 0 is started first and applies any schema migrations; it also
+runs the maintenance jobs and writes sync_status.json.
+
+Put a reverse proxy in front of the ports (see README). Socket.IO long-polling
+needs sticky sessions; websocket-only clients do not.
+
+    python server/run_workers.py --workers 4 --port 5000
+"""
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def worker_env(index, port, bus):
+    env = dict(os.environ)
+    env.update({
+        "MYNOTE_WORKER_INDEX": str(index),
+        "MYNOTE_PORT": str(port),
+        "MYNOTE_MESSAGE_BUS": bus,
+        "MYNOTE_DEBUG": "0",  # the debug reloader would fork yet another process
+    })
+    return env
+
+
+def wait_healthy(proc, port, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            return False
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/api/health", timeout=1) as resp:
+                if resp.status == 200:
+                    return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+class Supervisor:
+    """Starts the workers and restarts any that exit until stopped"""
+
+    def __init__(self, workers, base_port, bus, startup_timeout=120):
+        self.workers = workers
+        self.base_port = base_port
+        self.bus = bus
+        self.startup_timeout = startup_timeout
+        self.procs = {}
+        self.stopping = False
+
+    def spawn(self, index):
+        port = self.base_port + index
+        proc = subprocess.Popen([sys.executable, os.path.join(SERVER_DIR, "app.py")],
+                                cwd=SERVER_DIR, env=worker_env(index, port, self.bus))
+        self.procs[index] = proc
+        return proc
+
+    def start(self):
+        # Worker 0 migrates the schema before anyone else opens the database
+        if not wait_healthy(self.spawn(0), self.base_port, self.startup_timeout):
+            self.stop()
+            raise RuntimeError("Worker 0 did not start, see its output above")
+        for index in range(1, self.workers):
+            self.spawn(index)
+        for index in range(1, self.workers):
+            if not wait_healthy(self.procs[index], self.base_port + index, self.startup_timeout):
+                print(f"⚠️  Worker {index} is not healthy yet")
+        ports = ", ".join(str(self.base_port + i) for i in range(self.workers))
+        print(f"✅ {self.workers} workers listening on ports {ports} (bus: {self.bus})")
+
+    def watch(self):
+        while not self.stopping:
+            for index, proc in list(self.procs.items()):
+                if proc.poll() is not None and not self.stopping:
+                    print(f"⚠️  Worker {index} exited with {proc.returncode}, restarting")
+                    time.sleep(1)
+                    self.spawn(index)
+            time.sleep(1)
+
+    def stop(self, *_):
+        self.stopping = True
+        for proc in self.procs.values():
+            if proc.poll() is None:
+                proc.terminate()
+        for proc in self.procs.values():
+            try:
+                proc.wait(10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+def default_bus():
+    db_path = os.environ.get("MYNOTE_DB_PATH") or os.path.join(SERVER_DIR, "mynote_sync.db")
+    return os.environ.get("MYNOTE_MESSAGE_BUS") or f"sqlite:{os.path.splitext(db_path)[0]}_bus.db"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run several sync server workers")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("MYNOTE_WORKERS", os.cpu_count() or 1)))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("MYNOTE_PORT", "5000")),
+                        help="port of worker 0; worker i uses port + i")
+    parser.add_argument("--bus", default=default_bus(), help="message bus, e.g. sqlite:/path/bus.db")
+    args = parser.parse_args(argv)
+    if args.workers > 1 and args.bus == "local":
+        parser.error("several workers need a shared message bus, e.g. --bus sqlite:/path/bus.db")
+
+    supervisor = Supervisor(args.workers, args.port, args.bus)
+    signal.signal(signal.SIGTERM, supervisor.stop)
+    try:
+        supervisor.start()
+        supervisor.watch()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        supervisor.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,416 @@
+"""
+Sync server schema as ordered migrations (see migrations.py).
+
+Databases created before versioning have ``user_version = 0`` whatever
+shape they are in, so every step here is written to be safe on a database
+that already has some or all of its effects: tables and indexes use
+IF NOT EXISTS, columns are checked before ALTER, triggers go through
+``ensure_trigger`` and backfills only start when their DDL actually created
+something new. New steps get the next version number and are appended.
+"""
+
+import sqlite3
+
+from migrations import Migration
+from note_bodies import content_sql
+from timestamps import ms_sql
+
+
+def fts5_available():
+    try:
+        sqlite3.connect(":memory:").execute("CREATE VIRTUAL TABLE t USING fts5(x)")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+# Server-side search uses FTS5 when this SQLite build has it, LIKE scans otherwise
+FTS_AVAILABLE = fts5_available()
+
+USERS_TABLE = """
+  CREATE TABLE IF NOT EXISTS {name}(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    email TEXT UNIQUE NOT NULL,
+    password TEXT NOT NULL,
+    avatar TEXT,
+    created_at TEXT NOT NULL DEFAULT (datetime('now'))
+  )
+"""
+
+
+def ensure_trigger(c, name, body):
+    """Create trigger `name` from `body` (everything after the name), replacing an outdated definition"""
+    sql = f"CREATE TRIGGER {name} {body.strip()}"
+    c.execute("SELECT sql FROM sqlite_master WHERE type='trigger' AND name=?", (name,))
+    row = c.fetchone()
+    if row is not None and " ".join(row[0].split()) == " ".join(sql.split()):
+        return
+    c.execute(f"DROP TRIGGER IF EXISTS {name}")
+    c.execute(sql)
+
+
+def table_exists(c, name):
+    c.execute("SELECT 1 FROM sqlite_master WHERE name=?", (name,))
+    return c.fetchone() is not None
+
+
+def count_after_id(table):
+    def count(c, position):
+        c.execute(f"SELECT COUNT(*) FROM {table} WHERE id > ?", (position,))
+        return c.fetchone()[0]
+    return count
+
+
+# v1 --------------------------------------------------------------------------
+
+def base_tables(c):
+    c.execute(USERS_TABLE.format(name="users"))
+    c.execute("""
+      CREATE TABLE IF NOT EXISTS notes(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        title TEXT NOT NULL,
+        content TEXT DEFAULT '',
+        folder_id INTEGER,
+        is_favorite INTEGER DEFAULT 0,
+        is_deleted INTEGER DEFAULT 0,
+        created_at TEXT NOT NULL DEFAULT (datetime('now')),
+        updated_at TEXT NOT NULL DEFAULT (datetime('now')),
+        deleted_at TEXT,
+        version INTEGER DEFAULT 1,
+        remote_id TEXT UNIQUE,
+        dirty INTEGER DEFAULT 0,
+        FOREIGN KEY(user_id) REFERENCES users(id),
+        FOREIGN KEY(folder_id) REFERENCES folders(id) ON DELETE SET NULL
+      )
+    """)
+    c.execute("""
+      CREATE TABLE IF NOT EXISTS folders(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        created_at TEXT NOT NULL DEFAULT (datetime('now')),
+        updated_at TEXT,
+        FOREIGN KEY(user_id) REFERENCES users(id)
+      )
+    """)
+    c.execute("""
+      CREATE TABLE IF NOT EXISTS sync_queue(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        action TEXT NOT NULL,
+        table_name TEXT NOT NULL,
+        record_id INTEGER,
+        data TEXT,
+        note_local_id INTEGER,
+        remote_id TEXT,
+        try_count INTEGER DEFAULT 0,
+        last_error TEXT,
+        created_at TEXT NOT NULL DEFAULT (datetime('now')),
+        FOREIGN KEY(user_id) REFERENCES users(id)
+      )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_notes_dirty ON notes(dirty)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_notes_user ON notes(user_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_notes_folder ON notes(folder_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_notes_updated ON notes(updated_at)")
+    # Keyset pagination index for list_notes; supersedes idx_notes_user_updated
+    c.execute("CREATE INDEX IF NOT EXISTS idx_notes_user_updated_id ON notes(user_id, updated_at, id)")
+    c.execute("DROP INDEX IF EXISTS idx_notes_user_updated")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_folders_user ON folders(user_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_folders_user_name ON folders(user_id, name)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_syncq_user ON sync_queue(user_id, created_at)")
+    # Pre-create guest user id=1
+    c.execute("INSERT OR IGNORE INTO users(id, username, email, password, created_at) VALUES (1, 'guest', 'guest@example.com', '', datetime('now'))")
+
+
+# v2 --------------------------------------------------------------------------
+# Early databases had UNIQUE usernames and non-unique emails. The table is
+# rebuilt as users_new, copied over in id batches and swapped in at the end.
+
+def users_need_rebuild(c):
+    c.execute("PRAGMA index_list(users)")
+    unique_columns = set()
+    for index in c.fetchall():
+        if index["unique"]:
+            c.execute(f"PRAGMA index_info({index['name']})")
+            unique_columns.add(tuple(r["name"] for r in c.fetchall()))
+    return ("username",) in unique_columns or ("email",) not in unique_columns
+
+
+def users_rebuild(c):
+    if not users_need_rebuild(c):
+        return None
+    c.execute("DROP TABLE IF EXISTS users_new")
+    c.execute(USERS_TABLE.format(name="users_new"))
+    return 0
+
+
+def users_copy(c, last_id, limit):
+    c.execute("""INSERT INTO users_new(id, username, email, password, avatar, created_at)
+                 SELECT id, COALESCE(username, ''), email, COALESCE(password, ''), avatar,
+                        COALESCE(created_at, datetime('now'))
+                 FROM users WHERE id > ? ORDER BY id LIMIT ?""", (last_id, limit))
+    copied = c.rowcount
+    if copied < limit:
+        c.execute("DROP TABLE users")
+        c.execute("ALTER TABLE users_new RENAME TO users")
+        return copied, None
+    c.execute("SELECT MAX(id) FROM users_new")
+    return copied, c.fetchone()[0]
+
+
+# v3 --------------------------------------------------------------------------
+# Large note bodies, compressed and stored once per distinct text (note_bodies.py).
+# notes.body_hash is set (and notes.content NULL) for notes stored this way.
+
+def note_bodies(c):
+    c.execute("""
+      CREATE TABLE IF NOT EXISTS note_bodies(
+        hash TEXT PRIMARY KEY,
+        codec TEXT NOT NULL,
+        data BLOB NOT NULL,
+        size INTEGER NOT NULL
+      )
+    """)
+    c.execute("PRAGMA table_info(notes)")
+    if "body_hash" not in {r["name"] for r in c.fetchall()}:
+        c.execute("ALTER TABLE notes ADD COLUMN body_hash TEXT")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_notes_body_hash ON notes(body_hash) WHERE body_hash IS NOT NULL")
+
+
+# v4 --------------------------------------------------------------------------
+# Append-only change log: one row per note/folder insert, update and delete.
+# seq is strictly increasing in commit order (SQLite has a single writer),
+# so it is also monotonic per user and clients can resume from since_seq.
+
+def change_log(c):
+    changes_exists = table_exists(c, "changes")
+    c.execute("""
+      CREATE TABLE IF NOT EXISTS changes(
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        entity TEXT NOT NULL,
+        entity_id INTEGER NOT NULL,
+        op TEXT NOT NULL,
+        version INTEGER,
+        changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+      )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_changes_user_seq ON changes(user_id, seq)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_changes_entity ON changes(user_id, entity, entity_id, seq)")
+    # Moving a body into note_bodies rewrites content/body_hash without a new
+    # version; that is a storage detail, not a change clients need to see
+    for entity, table, version, when in (("note", "notes", "new.version", "WHEN new.body_hash IS old.body_hash OR new.version IS NOT old.version "),
+                                         ("folder", "folders", "NULL", "")):
+        ensure_trigger(c, f"{table}_changes_ai", f"""AFTER INSERT ON {table} BEGIN
+            INSERT INTO changes(user_id, entity, entity_id, op, version) VALUES (new.user_id, '{entity}', new.id, 'insert', {version});
+          END""")
+        ensure_trigger(c, f"{table}_changes_au", f"""AFTER UPDATE ON {table} {when}BEGIN
+            INSERT INTO changes(user_id, entity, entity_id, op, version) VALUES (new.user_id, '{entity}', new.id, 'update', {version});
+          END""")
+        ensure_trigger(c, f"{table}_changes_ad", f"""AFTER DELETE ON {table} BEGIN
+            INSERT INTO changes(user_id, entity, entity_id, op, version) VALUES (old.user_id, '{entity}', old.id, 'delete', NULL);
+          END""")
+    # Existing rows become the initial history so since_seq=0 returns the full
+    # state: folders by id, then notes in (updated_at, id) order
+    return None if changes_exists else {"folders": 0}
+
+
+def change_log_seed(c, position, limit):
+    if "folders" in position:
+        c.execute("""INSERT INTO changes(user_id, entity, entity_id, op)
+                     SELECT user_id, 'folder', id, 'insert' FROM folders WHERE id > ? ORDER BY id LIMIT ?""",
+                  (position["folders"], limit))
+        seeded = c.rowcount
+        if seeded < limit:
+            return seeded, {"notes": ["", 0]}
+        c.execute("SELECT MAX(entity_id) FROM changes WHERE entity='folder'")
+        return seeded, {"folders": c.fetchone()[0]}
+    updated_at, last_id = position["notes"]
+    c.execute("""SELECT id, user_id, version, updated_at FROM notes
+                 WHERE (updated_at, id) > (?, ?) ORDER BY updated_at, id LIMIT ?""", (updated_at, last_id, limit))
+    rows = c.fetchall()
+    c.executemany("INSERT INTO changes(user_id, entity, entity_id, op, version) VALUES (?, 'note', ?, 'insert', ?)",
+                  [(r["user_id"], r["id"], r["version"]) for r in rows])
+    if len(rows) < limit:
+        return len(rows), None
+    return len(rows), {"notes": [rows[-1]["updated_at"], rows[-1]["id"]]}
+
+
+def change_log_count(c, position):
+    if "folders" in position:
+        c.execute("SELECT (SELECT COUNT(*) FROM folders WHERE id > ?) + (SELECT COUNT(*) FROM notes)",
+                  (position["folders"],))
+    else:
+        c.execute("SELECT COUNT(*) FROM notes WHERE (updated_at, id) > (?, ?)", tuple(position["notes"]))
+    return c.fetchone()[0]
+
+
+# v5 --------------------------------------------------------------------------
+# Attachment blobs: content-addressed files (blobs.py), who uploaded them,
+# and which notes use them. refcount counts note_blobs rows.
+
+def blob_tables(c):
+    c.execute("""
+      CREATE TABLE IF NOT EXISTS blobs(
+        hash TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        content_type TEXT,
+        refcount INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%SZ', 'now')),
+        last_used_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%SZ', 'now'))
+      )
+    """)
+    c.execute("""
+      CREATE TABLE IF NOT EXISTS blob_owners(
+        hash TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        PRIMARY KEY(hash, user_id)
+      ) WITHOUT ROWID
+    """)
+    c.execute("""
+      CREATE TABLE IF NOT EXISTS note_blobs(
+        note_id INTEGER NOT NULL,
+        blob_hash TEXT NOT NULL,
+        PRIMARY KEY(note_id, blob_hash)
+      ) WITHOUT ROWID
+    """)
+    c.execute("""
+      CREATE TABLE IF NOT EXISTS blob_uploads(
+        id TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        sha256 TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        content_type TEXT,
+        created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%SZ', 'now'))
+      )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_note_blobs_hash ON note_blobs(blob_hash)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_blobs_gc ON blobs(refcount, last_used_at)")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_blob_uploads_user_hash ON blob_uploads(user_id, sha256)")
+    ensure_trigger(c, "note_blobs_ai", """AFTER INSERT ON note_blobs BEGIN
+        UPDATE blobs SET refcount = refcount + 1 WHERE hash = new.blob_hash;
+      END""")
+    ensure_trigger(c, "note_blobs_ad", """AFTER DELETE ON note_blobs BEGIN
+        UPDATE blobs SET refcount = refcount - 1,
+                         last_used_at = strftime('%Y-%m-%dT%H:%M:%SZ', 'now') WHERE hash = old.blob_hash;
+      END""")
+    ensure_trigger(c, "notes_blobs_ad", """AFTER DELETE ON notes BEGIN
+        DELETE FROM note_blobs WHERE note_id = old.id;
+      END""")
+
+
+# v6 --------------------------------------------------------------------------
+# Full-text index over note title/content, kept in sync by triggers. Its
+# external content is a view resolving compressed bodies, so snippet() and
+# highlight() see the same text the API returns. Without FTS5 this step does
+# nothing and search keeps using LIKE for this database.
+
+def full_text_index(c):
+    if not FTS_AVAILABLE:
+        return None
+    c.execute("SELECT sql FROM sqlite_master WHERE name='notes_fts'")
+    row = c.fetchone()
+    fts_exists = row is not None and "note_texts" in row[0]
+    if row is not None and not fts_exists:
+        c.execute("DROP TABLE notes_fts")  # indexed straight from notes; rebuilt by the backfill
+    c.execute(f"""
+      CREATE VIEW IF NOT EXISTS note_texts AS
+      SELECT n.id AS id, n.title AS title, {content_sql('n')} AS content FROM notes n
+    """)
+    c.execute("""
+      CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+        title, content, content='note_texts', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+      )
+    """)
+    ensure_trigger(c, "notes_fts_ai", f"""AFTER INSERT ON notes BEGIN
+        INSERT INTO notes_fts(rowid, title, content) VALUES (new.id, new.title, {content_sql('new')});
+      END""")
+    ensure_trigger(c, "notes_fts_ad", f"""AFTER DELETE ON notes BEGIN
+        INSERT INTO notes_fts(notes_fts, rowid, title, content) VALUES ('delete', old.id, old.title, {content_sql('old')});
+      END""")
+    ensure_trigger(c, "notes_fts_au", f"""AFTER UPDATE OF title, content, body_hash ON notes BEGIN
+        INSERT INTO notes_fts(notes_fts, rowid, title, content) VALUES ('delete', old.id, old.title, {content_sql('old')});
+        INSERT INTO notes_fts(rowid, title, content) VALUES (new.id, new.title, {content_sql('new')});
+      END""")
+    # Index notes written before the FTS table existed
+    return None if fts_exists else 0
+
+
+def full_text_fill(c, last_id, limit):
+    c.execute("""INSERT INTO notes_fts(rowid, title, content)
+                 SELECT id, title, content FROM note_texts WHERE id > ? ORDER BY id LIMIT ?""", (last_id, limit))
+    indexed = c.rowcount
+    if indexed < limit:
+        return indexed, None
+    c.execute("SELECT id FROM notes WHERE id > ? ORDER BY id LIMIT 1 OFFSET ?", (last_id, limit - 1))
+    return indexed, c.fetchone()[0]
+
+
+# v7 --------------------------------------------------------------------------
+
+def tombstone_index(c):
+    # Tombstones by age, for the purge_tombstones maintenance job
+    c.execute("CREATE INDEX IF NOT EXISTS idx_notes_tombstones ON notes(COALESCE(deleted_at, updated_at)) WHERE is_deleted = 1")
+
+
+# v8 --------------------------------------------------------------------------
+# notes.updated_ms: updated_at as integer UTC epoch milliseconds (timestamps.py),
+# the key for sync range scans, cursors and last-writer-wins checks.
+
+def note_updated_ms(c):
+    c.execute("PRAGMA table_info(notes)")
+    added = "updated_ms" not in {r["name"] for r in c.fetchall()}
+    if added:
+        c.execute("ALTER TABLE notes ADD COLUMN updated_ms INTEGER")
+    # Keyset pagination index for list_notes; supersedes idx_notes_user_updated_id
+    c.execute("CREATE INDEX IF NOT EXISTS idx_notes_user_updated_ms ON notes(user_id, updated_ms, id)")
+    c.execute("DROP INDEX IF EXISTS idx_notes_user_updated_id")
+    # Filling in updated_ms is a storage detail like a body move: no change row
+    ensure_trigger(c, "notes_changes_au", """AFTER UPDATE ON notes
+        WHEN (new.body_hash IS old.body_hash AND new.updated_ms IS old.updated_ms) OR new.version IS NOT old.version BEGIN
+            INSERT INTO changes(user_id, entity, entity_id, op, version) VALUES (new.user_id, 'note', new.id, 'update', new.version);
+          END""")
+    return 0 if added else None
+
+
+def updated_ms_fill(c, last_id, limit):
+    # Timestamps SQLite cannot parse sort first rather than never matching a range
+    fill = f"UPDATE notes SET updated_ms = COALESCE({ms_sql('updated_at')}, 0) WHERE id > ?"
+    c.execute("SELECT id FROM notes WHERE id > ? ORDER BY id LIMIT 1 OFFSET ?", (last_id, limit - 1))
+    row = c.fetchone()
+    if row is None:
+        c.execute(fill, (last_id,))
+        return c.rowcount, None
+    c.execute(fill + " AND id <= ?", (last_id, row[0]))
+    return c.rowcount, row[0]
+
+
+# v9 --------------------------------------------------------------------------
+
+# Tombstone age in epoch ms: deleted_at when a client set one SQLite can parse, else updated_ms
+TOMBSTONE_AGE_SQL = f"COALESCE({ms_sql('deleted_at')}, updated_ms)"
+
+
+def tombstone_ms_index(c):
+    # Replaces the v7 index, whose text timestamps do not compare in time order
+    c.execute("DROP INDEX IF EXISTS idx_notes_tombstones")
+    c.execute(f"CREATE INDEX IF NOT EXISTS idx_notes_tombstones_ms ON notes({TOMBSTONE_AGE_SQL}) WHERE is_deleted = 1")
+
+
+MIGRATIONS = [
+    Migration(1, "base_tables", base_tables),
+    Migration(2, "users_unique_email", users_rebuild, users_copy, count_after_id("users")),
+    Migration(3, "note_bodies", note_bodies),
+    Migration(4, "change_log", change_log, change_log_seed, change_log_count),
+    Migration(5, "blob_tables", blob_tables),
+    Migration(6, "full_text_index", full_text_index, full_text_fill, count_after_id("notes")),
+    Migration(7, "tombstone_index", tombstone_index),
+    Migration(8, "note_updated_ms", note_updated_ms, updated_ms_fill, count_after_id("notes")),
+    Migration(9, "tombstone_ms_index", tombstone_ms_index),
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
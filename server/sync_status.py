@@ -0,0 +1,141 @@
+"""
+Live sync status model behind /api/sync-status and sync_status.json.
+
+Write handlers report each operation together with how it changed the row
+counts, so nothing ever has to rescan the users/notes/folders tables. A
+background thread persists the model to disk at most once per
+``flush_interval`` seconds, writing to a temp file and renaming it over the
+old one so readers never see a half-written file. With ``path=None`` the
+model is kept in memory only.
+"""
+
+import collections
+import copy
+import datetime
+import json
+import os
+import threading
+
+
+def _now_iso():
+    return datetime.datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
+
+
+class SyncStatusTracker:
+    """In-memory counters plus a ring buffer of recent operations"""
+
+    def __init__(self, path, flush_interval=2.0, max_recent=10):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+        self._status = {
+            "last_updated": _now_iso(),
+            "status": "active",
+            "total_users": 0,
+            "total_notes": 0,
+            "total_folders": 0,
+            "pending_sync_operations": 0,
+            "websocket_connections": 0,
+            "last_sync_operation": None,
+        }
+        self._recent = collections.deque(maxlen=max_recent)
+        # Number of operations recorded since the last successful flush
+        self._dirty = 0
+
+    def load_counts(self, conn):
+        """Seed the counters from the database (one COUNT per table, at startup)"""
+        c = conn.cursor()
+        counts = {}
+        for key, sql in (("total_users", "SELECT COUNT(*) FROM users"),
+                         ("total_notes", "SELECT COUNT(*) FROM notes"),
+                         ("total_folders", "SELECT COUNT(*) FROM folders"),
+                         ("pending_sync_operations", "SELECT COUNT(*) FROM notes WHERE dirty=1")):
+            c.execute(sql)
+            counts[key] = c.fetchone()[0]
+        with self._lock:
+            self._status.update(counts)
+            self._dirty += 1
+
+    def record(self, operation_type, data=None, users=0, notes=0, folders=0, dirty_notes=0):
+        """Apply one write operation's deltas and remember it as a recent operation"""
+        now = _now_iso()
+        with self._lock:
+            s = self._status
+            s["total_users"] += users
+            s["total_notes"] += notes
+            s["total_folders"] += folders
+            s["pending_sync_operations"] += dirty_notes
+            s["last_updated"] = now
+            s["last_sync_operation"] = operation_type
+            self._recent.appendleft({"type": operation_type, "timestamp": now, "data": data})
+            self._dirty += 1
+        self._wakeup.set()
+
+    def connection_opened(self):
+        with self._lock:
+            self._status["websocket_connections"] += 1
+            self._dirty += 1
+        self._wakeup.set()
+
+    def connection_closed(self):
+        with self._lock:
+            self._status["websocket_connections"] = max(0, self._status["websocket_connections"] - 1)
+            self._dirty += 1
+        self._wakeup.set()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "sync_status": dict(self._status),
+                "recent_operations": copy.deepcopy(list(self._recent)),
+                "unflushed_operations": self._dirty,
+            }
+
+    def flush(self):
+        """Persist the model if anything changed since the last flush"""
+        with self._lock:
+            if not self._dirty or self.path is None:
+                return False
+            pending = self._dirty
+            payload = {
+                "sync_status": dict(self._status),
+                "recent_operations": copy.deepcopy(list(self._recent)),
+            }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(payload, f, indent=2)
+        os.replace(tmp_path, self.path)
+        with self._lock:
+            self._dirty -= pending
+        return True
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error writing sync status: {e}")
+            # Bound the write rate: coalesce everything recorded in the next interval
+            self._stopped.wait(self.flush_interval)
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Error writing sync status: {e}")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sync-status-flusher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
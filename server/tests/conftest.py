@@ -0,0 +1,48 @@
+"""
+Shared fixtures for the server tests.
+
+app.py reads its settings when it is imported, so the environment is set
+first: rate limits are off, realtime batches only go out when a test
+flushes them, and nothing is written next to the real database. Each test
+then gets its own database file and blob directory.
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+_scratch = tempfile.mkdtemp(prefix="mynote-tests-")
+os.environ["MYNOTE_DB_PATH"] = os.path.join(_scratch, "mynote_sync.db")
+os.environ["MYNOTE_SYNC_STATUS_PATH"] = os.path.join(_scratch, "sync_status.json")
+os.environ["MYNOTE_BLOB_DIR"] = os.path.join(_scratch, "blobs")
+os.environ["MYNOTE_REALTIME_BATCH_WINDOW"] = "3600"
+for _kind in ("READ", "WRITE", "CONNECT"):
+    os.environ[f"MYNOTE_RATE_LIMIT_{_kind}"] = "0"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as server  # noqa: E402
+
+
+@pytest.fixture
+def app_module(tmp_path, monkeypatch):
+    """app.py pointed at a fresh, migrated database"""
+    monkeypatch.setattr(server, "DB_PATH", str(tmp_path / "mynote_sync.db"))
+    monkeypatch.setattr(server, "BLOB_DIR", str(tmp_path / "blobs"))
+    server.cache.clear()
+    server.init_db()
+    yield server
+    server.realtime.flush_all()  # against this test's database, before it goes away
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def user():
+    """Headers for user 1"""
+    return {"X-User": "1"}
@@ -0,0 +1,54 @@
+import pytest
+
+
+def create(client, user, n):
+    items = [{"title": f"n{i}", "updated_at": 1000 + i} for i in range(n)]
+    return [r["id"] for r in client.post("/api/notes/batch_upsert", json={"items": items}, headers=user).get_json()["items"]]
+
+
+def test_batch_upsert_creates_updates_and_skips(client, user):
+    a, b = create(client, user, 2)
+    resp = client.post("/api/notes/batch_upsert", json={"items": [
+        {"id": a, "title": "newer", "updated_at": 5000},
+        {"id": b, "title": "older", "updated_at": 10},
+        {"title": "fresh", "updated_at": 6000},
+        {"id": a, "title": "newest", "updated_at": 7000},  # compares against the earlier item
+    ]}, headers=user).get_json()["items"]
+    assert [r["skipped"] for r in resp] == [False, True, False, False]
+    assert resp[3]["version"] == 3
+    titles = {n["remote_id"]: n["title"] for n in client.get("/api/notes", headers=user).get_json()["items"]}
+    assert titles[a] == "newest" and titles[b] == "n1"
+
+
+@pytest.mark.parametrize("body", [{"items": "x"}, {"items": [1]}, {"items": [{"updated_at": "soon"}]}])
+def test_batch_upsert_rejects_bad_input(client, user, body):
+    resp = client.post("/api/notes/batch_upsert", json=body, headers=user)
+    assert resp.status_code == 400
+    assert resp.get_json()["error"]["code"] == "INVALID_INPUT"
+
+
+def test_batch_upsert_limit(client, user, app_module):
+    items = [{"title": "x"}] * (app_module.BATCH_MAX_ITEMS + 1)
+    assert client.post("/api/notes/batch_upsert", json={"items": items}, headers=user).status_code == 400
+
+
+def test_batch_delete_reports_deleted_and_not_found(client, user):
+    a, b = create(client, user, 2)
+    other = create(client, {"X-User": "2"}, 1)[0]
+    resp = client.post("/api/notes/batch_delete", json={"ids": [b, a, 999999, other]}, headers=user)
+    assert resp.status_code == 200
+    assert resp.get_json() == {"deleted": sorted([a, b]), "not_found": sorted([999999, other])}
+    assert client.get("/api/notes", headers=user).get_json()["items"] == []
+    assert len(client.get("/api/notes", headers={"X-User": "2"}).get_json()["items"]) == 1
+
+
+@pytest.mark.parametrize("ids", [[True], [1.9], ["7"], [None], [2**63], "1,2", [[1]]])
+def test_batch_delete_rejects_non_integer_ids(client, user, ids):
+    resp = client.post("/api/notes/batch_delete", json={"ids": ids}, headers=user)
+    assert resp.status_code == 400
+    assert resp.get_json()["error"]["code"] == "INVALID_INPUT"
+
+
+def test_batch_delete_accepts_a_bare_list(client, user):
+    (a,) = create(client, user, 1)
+    assert client.post("/api/notes/batch_delete", json=[a], headers=user).get_json()["deleted"] == [a]
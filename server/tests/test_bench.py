@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("socketio")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench"))
+
+import load_test  # noqa: E402
+
+
+def test_percentile_interpolates():
+    values = [10.0, 20.0, 30.0, 40.0]
+    assert load_test.percentile(values, 0) == 10.0
+    assert load_test.percentile(values, 50) == 25.0
+    assert load_test.percentile(values, 100) == 40.0
+    assert load_test.percentile([], 50) is None
+
+
+def test_summarize():
+    report = load_test.summarize([3.0, 1.0, 2.0], elapsed=2.0)
+    assert report["count"] == 3 and report["throughput_rps"] == 1.5
+    assert (report["p50_ms"], report["max_ms"]) == (2.0, 3.0)
+    assert load_test.summarize([], 1.0)["p95_ms"] is None
+
+
+def test_recorder_measures_event_lag_for_known_writes():
+    rec = load_test.Recorder()
+    rec.sample("GET /api/notes", 5.0, ok=False)
+    rec.wrote(1, 10)
+    rec.event(1, [10, 11])
+    assert rec.errors == {"GET /api/notes": 1}
+    assert rec.events_received == 1 and len(rec.event_lags) == 1
+
+
+def test_args_defaults():
+    args = load_test.parse_args(["--users", "2"])
+    assert (args.users, args.devices, args.url) == (2, 3, None)
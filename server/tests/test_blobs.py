@@ -0,0 +1,91 @@
+import hashlib
+import os
+
+DATA = os.urandom(3000)
+SHA = hashlib.sha256(DATA).hexdigest()
+
+
+def start(client, user, data=DATA):
+    return client.post("/api/blobs/uploads", json={"sha256": hashlib.sha256(data).hexdigest(), "size": len(data),
+                                                   "content_type": "image/png"}, headers=user)
+
+
+def chunk(client, user, upload_id, start_at, piece, size=len(DATA)):
+    return client.put(f"/api/blobs/uploads/{upload_id}", data=piece, headers={
+        **user, "Content-Range": f"bytes {start_at}-{start_at + len(piece) - 1}/{size}"})
+
+
+def upload(client, user, data=DATA):
+    upload_id = start(client, user, data).get_json()["upload_id"]
+    assert chunk(client, user, upload_id, 0, data, len(data)).status_code == 201
+
+
+def test_chunked_upload_resumes_and_serves(client, user, app_module):
+    resp = start(client, user)
+    assert resp.status_code == 201
+    upload_id = resp.get_json()["upload_id"]
+    assert chunk(client, user, upload_id, 0, DATA[:1000]).status_code == 202
+    # Resuming asks the server how much it has
+    assert client.get(f"/api/blobs/uploads/{upload_id}", headers=user).get_json()["received"] == 1000
+    retry = chunk(client, user, upload_id, 0, DATA[:1000])
+    assert retry.status_code == 409 and retry.get_json()["received"] == 1000
+    assert chunk(client, user, upload_id, 1000, DATA[1000:]).get_json()["complete"] is True
+
+    blob = client.get(f"/api/blobs/{SHA}", headers=user)
+    assert blob.data == DATA and blob.mimetype == "image/png"
+    assert os.path.exists(os.path.join(app_module.BLOB_DIR, SHA[:2], SHA))
+
+
+def test_range_and_conditional_download(client, user):
+    upload(client, user)
+    part = client.get(f"/api/blobs/{SHA}", headers={**user, "Range": "bytes=10-19"})
+    assert part.status_code == 206 and part.data == DATA[10:20]
+    etag = client.get(f"/api/blobs/{SHA}", headers=user).headers["ETag"]
+    assert client.get(f"/api/blobs/{SHA}", headers={**user, "If-None-Match": etag}).status_code == 304
+
+
+def test_existing_blob_skips_upload_only_for_its_owner(client, user):
+    upload(client, user)
+    assert start(client, user).get_json() == {"sha256": SHA, "size": len(DATA), "complete": True}
+    other = {"X-User": "2"}
+    assert client.get(f"/api/blobs/{SHA}", headers=other).status_code == 404
+    assert start(client, other).status_code == 201  # must prove it has the bytes
+
+
+def test_hash_mismatch_restarts_upload(client, user):
+    upload_id = start(client, user).get_json()["upload_id"]
+    resp = chunk(client, user, upload_id, 0, b"x" * len(DATA))
+    assert resp.status_code == 422 and resp.get_json()["error"]["code"] == "HASH_MISMATCH"
+    assert client.get(f"/api/blobs/uploads/{upload_id}", headers=user).get_json()["received"] == 0
+
+
+def test_note_blob_links(client, user):
+    upload(client, user)
+    nid = client.post("/api/notes/upsert", json={"title": "pic"}, headers=user).get_json()["id"]
+    missing = "0" * 64
+    resp = client.put(f"/api/notes/{nid}/blobs", json={"sha256": [SHA, missing]}, headers=user)
+    assert resp.status_code == 409 and resp.get_json()["missing"] == [missing]
+    assert client.put(f"/api/notes/{nid}/blobs", json={"sha256": [SHA]}, headers=user).status_code == 200
+    assert [b["sha256"] for b in client.get(f"/api/notes/{nid}/blobs", headers=user).get_json()["items"]] == [SHA]
+
+
+def test_garbage_collection_removes_unreferenced_blobs(client, user, app_module, monkeypatch):
+    upload(client, user)
+    nid = client.post("/api/notes/upsert", json={"title": "pic"}, headers=user).get_json()["id"]
+    client.put(f"/api/notes/{nid}/blobs", json={"sha256": [SHA]}, headers=user)
+    monkeypatch.setattr(app_module, "BLOB_GC_GRACE", -5)
+    assert app_module.maintenance.run_job("collect_blobs")["blobs"] == 0  # still referenced
+    client.delete(f"/api/notes/{nid}", headers=user)
+    assert app_module.maintenance.run_job("collect_blobs")["blobs"] == 1
+    assert client.get(f"/api/blobs/{SHA}", headers=user).status_code == 404
+    assert not os.path.exists(os.path.join(app_module.BLOB_DIR, SHA[:2], SHA))
+
+
+def test_invalid_requests(client, user):
+    assert client.post("/api/blobs/uploads", json={"sha256": "nope", "size": 1}, headers=user).status_code == 400
+    upload_id = start(client, user).get_json()["upload_id"]
+    bad_range = client.put(f"/api/blobs/uploads/{upload_id}", data=b"abc",
+                           headers={**user, "Content-Range": "bytes 0-9/3000"})
+    assert bad_range.status_code == 400
+    assert client.get("/api/blobs/uploads/unknown", headers=user).status_code == 404
+    assert client.get("/api/blobs/uploads/" + upload_id, headers={"X-User": "2"}).status_code == 404
@@ -0,0 +1,95 @@
+import io
+import json
+import zipfile
+
+from bulk_transfer import html_to_markdown
+
+OTHER = {"X-User": "2"}
+
+
+def seed(client, user):
+    folder = client.post("/api/folders", json={"name": "Work"}, headers=user).get_json()["id"]
+    client.post("/api/notes/upsert", json={"title": "plan", "content": "<p>Hello <b>world</b></p>", "folder_id": folder,
+                                           "updated_at": "2020-05-01T10:00:00Z"}, headers=user)
+    client.post("/api/notes/upsert", json={"title": "loose", "content": "x", "updated_at": "2020-05-02T10:00:00Z"},
+                headers=user)
+
+
+def export_lines(client, user):
+    resp = client.get("/api/export", headers=user)
+    assert resp.status_code == 200
+    return [json.loads(line) for line in resp.data.decode("utf-8").splitlines()]
+
+
+def test_ndjson_export_records(client, user):
+    seed(client, user)
+    records = export_lines(client, user)
+    assert [r["type"] for r in records] == ["header", "folder", "note", "note", "end"]
+    assert records[-1] == {"type": "end", "folders": 1, "notes": 2}
+    assert records[2]["folder_id"] == records[1]["id"]
+
+
+def test_import_round_trip_into_another_account(client, user):
+    seed(client, user)
+    body = client.get("/api/export", headers=user).data
+    resp = client.post("/api/import", data=body, headers=OTHER)
+    assert resp.status_code == 201
+    assert resp.get_json()["imported"]["notes"] == 2
+    assert resp.get_json()["imported"]["folders_created"] == 1
+    notes = {n["title"]: n for n in client.get("/api/notes", headers=OTHER).get_json()["items"]}
+    folders = client.get("/api/folders", headers=OTHER).get_json()["items"]
+    assert notes["plan"]["folder_id"] == folders[0]["id"]
+    assert notes["plan"]["content"] == "<p>Hello <b>world</b></p>"
+
+
+def test_imported_notes_reach_devices_synced_past_their_timestamps(client, user):
+    seed(client, user)
+    body = client.get("/api/export", headers=user).data
+    # A device of user 2 that last synced after the exported notes were written
+    since = client.get("/api/notes", headers=OTHER).get_json()["server_now"]
+    assert since > "2020-05-02"
+    client.post("/api/import", data=body, headers=OTHER)
+    pulled = client.get(f"/api/notes?updated_after={since}", headers=OTHER).get_json()["items"]
+    assert sorted(n["title"] for n in pulled) == ["loose", "plan"]
+
+
+def test_import_into_same_account_merges_folders(client, user):
+    seed(client, user)
+    body = client.get("/api/export", headers=user).data
+    imported = client.post("/api/import", data=body, headers=user).get_json()["imported"]
+    assert imported["folders_merged"] == 1 and imported["folders_created"] == 0
+    assert len(client.get("/api/folders", headers=user).get_json()["items"]) == 1
+
+
+def test_malformed_line_reports_line_and_progress(client, user):
+    body = (json.dumps({"type": "note", "title": "ok", "updated_at": "2020-01-01T00:00:00Z"}) + "\n"
+            + "{not json\n").encode()
+    resp = client.post("/api/import", data=body, headers=user)
+    assert resp.status_code == 400
+    data = resp.get_json()
+    assert data["error"]["code"] == "INVALID_IMPORT"
+    assert data["error"]["line"] == 2
+
+
+def test_import_emits_one_event(client, user, app_module, monkeypatch):
+    events = []
+    monkeypatch.setattr(app_module, "emit_to_room", lambda event, payload, room: events.append((event, payload, room)))
+    seed(client, user)
+    body = client.get("/api/export", headers=user).data
+    client.post("/api/import", data=body, headers=OTHER)
+    assert [(e, p["notes"], r) for e, p, r in events] == [("notes_imported", 2, "user:2")]
+
+
+def test_markdown_zip_export(client, user):
+    seed(client, user)
+    resp = client.get("/api/export?format=markdown", headers=user)
+    assert resp.mimetype == "application/zip"
+    archive = zipfile.ZipFile(io.BytesIO(resp.data))
+    names = sorted(archive.namelist())
+    assert len(names) == 2 and names[0].startswith("Work/plan (")
+    text = archive.read(names[0]).decode("utf-8")
+    assert 'title: "plan"' in text and "Hello **world**" in text
+
+
+def test_html_to_markdown():
+    assert html_to_markdown("<h2>T</h2><ul><li>a</li><li>b</li></ul>").strip() == "## T\n\n- a\n- b"
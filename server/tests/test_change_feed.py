@@ -0,0 +1,59 @@
+import pytest
+
+
+def feed(client, user, query=""):
+    resp = client.get(f"/api/changes?{query}", headers=user)
+    assert resp.status_code == 200
+    return resp.get_json()
+
+
+def test_every_write_is_logged_in_order(client, user):
+    nid = client.post("/api/notes/upsert", json={"title": "a", "updated_at": 1000}, headers=user).get_json()["id"]
+    client.post("/api/notes/upsert", json={"id": nid, "title": "b", "updated_at": 2000}, headers=user)
+    fid = client.post("/api/folders", json={"name": "F"}, headers=user).get_json()["id"]
+    client.delete(f"/api/notes/{nid}", headers=user)
+    body = feed(client, user)
+    assert [(c["entity"], c["id"], c["op"], c["version"]) for c in body["changes"]] == [
+        ("note", nid, "insert", 1), ("note", nid, "update", 2), ("folder", fid, "insert", None), ("note", nid, "delete", None)]
+    seqs = [c["seq"] for c in body["changes"]]
+    assert seqs == sorted(seqs) and body["last_seq"] == seqs[-1] and body["has_more"] is False
+
+
+def test_stale_upsert_logs_nothing(client, user):
+    nid = client.post("/api/notes/upsert", json={"title": "a", "updated_at": 2000}, headers=user).get_json()["id"]
+    client.post("/api/notes/upsert", json={"id": nid, "title": "old", "updated_at": 1000}, headers=user)
+    assert len(feed(client, user)["changes"]) == 1
+
+
+def test_paging_with_since_seq(client, user):
+    for n in range(5):
+        client.post("/api/notes/upsert", json={"title": str(n)}, headers=user)
+    first = feed(client, user, "limit=3")
+    assert len(first["changes"]) == 3 and first["has_more"] is True
+    rest = feed(client, user, f"since_seq={first['last_seq']}&limit=3")
+    assert len(rest["changes"]) == 2 and rest["has_more"] is False
+
+
+def test_idle_feed_reports_latest_seq(client, user):
+    client.post("/api/notes/upsert", json={"title": "mine"}, headers=user)
+    other = {"X-User": "2"}
+    client.post("/api/notes/upsert", json={"title": "theirs"}, headers=other)
+    latest = feed(client, user)["last_seq"]
+    body = feed(client, user, f"since_seq={latest}")
+    assert body == {"changes": [], "last_seq": latest, "has_more": False}
+    assert [c["op"] for c in feed(client, other)["changes"]] == ["insert"]
+
+
+@pytest.mark.parametrize("query", ["since_seq=-1", "since_seq=x", "limit=1.5"])
+def test_invalid_parameters(client, user, query):
+    resp = client.get(f"/api/changes?{query}", headers=user)
+    assert resp.status_code == 400
+    assert resp.get_json()["error"]["code"] == "INVALID_INPUT"
+
+
+def test_purged_tombstones_show_up_as_deletes(client, user, app_module):
+    nid = client.post("/api/notes/upsert", json={"title": "t", "is_deleted": True, "updated_at": 1000},
+                      headers=user).get_json()["id"]
+    latest = feed(client, user)["last_seq"]
+    app_module.maintenance.run_job("purge_tombstones")
+    assert [(c["id"], c["op"]) for c in feed(client, user, f"since_seq={latest}")["changes"]] == [(nid, "delete")]
@@ -0,0 +1,80 @@
+import json
+import sqlite3
+
+import pytest
+
+import check_all_data as diag
+
+
+@pytest.fixture
+def db_path(client, user, app_module):
+    for i in range(5):
+        client.post("/api/notes/upsert", json={"title": f"note {i}", "content": "x" * (i * 300)}, headers=user)
+    client.post("/api/notes/upsert", json={"title": "other", "content": "y"}, headers={"X-User": "2"})
+    return app_module.DB_PATH
+
+
+def run_json(capsys, path, **kwargs):
+    assert diag.run(path, kwargs.pop("opts", diag.Options()), as_json=True, **kwargs)
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def test_sections_as_ndjson(db_path, capsys):
+    out = {s["section"]: s for s in run_json(capsys, db_path, run_checks=True)}
+    assert list(out) == ["overview", "users", "notes", "integrity", "indexes", "checks"]
+    assert out["overview"]["rows"]["notes"] == 6
+    assert out["overview"]["journal_mode"] == "wal"
+    assert out["users"]["users_with_notes"] == 2
+    assert out["users"]["top_users"][0]["notes"] == 5
+    assert out["notes"]["scanned"] == 6
+    assert out["notes"]["size_bytes"]["max"] == 1200
+    assert sum(b["notes"] for b in out["notes"]["size_histogram"]) == 6
+    # Only user 1 has a users row; user 2's note is reported, nothing else is
+    problems = {k: v for k, v in out["integrity"].items() if isinstance(v, dict) and v["count"]}
+    assert problems == {"notes_missing_user": {"count": 1, "examples": [6]}}
+    assert out["checks"]["quick_check"] == ["ok"] and out["checks"]["fts"] == "ok"
+
+
+def test_integrity_reports_broken_references(db_path, capsys):
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA foreign_keys=OFF")
+    conn.execute("UPDATE notes SET folder_id = 999 WHERE id = 1")
+    conn.commit()
+    conn.close()
+    integrity, = run_json(capsys, db_path, only=["integrity"])
+    assert integrity["notes_missing_folder"] == {"count": 1, "examples": [1]}
+
+
+def test_max_rows_and_sample_limit_note_scan(db_path, capsys):
+    notes, = run_json(capsys, db_path, only=["notes"], opts=diag.Options(max_rows=2))
+    assert notes["scanned"] == 2
+    notes, = run_json(capsys, db_path, only=["notes"], opts=diag.Options(sample=0.000001))
+    assert notes["scanned"] < 6
+
+
+def test_list_streams_rows(db_path, capsys):
+    rows = run_json(capsys, db_path, list_table="notes", opts=diag.Options(max_rows=3))
+    assert [r["id"] for r in rows] == [1, 2, 3]
+
+
+def test_opens_read_only(db_path):
+    conn = diag.open_readonly(db_path)
+    try:
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM notes")
+    finally:
+        conn.close()
+
+
+def test_missing_database(tmp_path, capsys):
+    assert not diag.run(str(tmp_path / "missing.db"), diag.Options(), as_json=True)
+    assert json.loads(capsys.readouterr().out)["section"] == "error"
+
+
+def test_percentiles(tmp_path):
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t(v INTEGER)")
+    conn.executemany("INSERT INTO t VALUES (?)", [(i,) for i in range(1, 101)])
+    assert diag.percentiles(conn, "SELECT v FROM t") == {
+        "count": 100, "min": 1, "p50": 50, "p90": 90, "p99": 99, "max": 100}
+    assert diag.percentiles(conn, "SELECT v FROM t WHERE v > 1000") == {"count": 0}
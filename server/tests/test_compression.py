@@ -0,0 +1,25 @@
+import gzip
+import zlib
+
+from werkzeug.http import parse_accept_header
+
+from compression import compress_stream, negotiate
+
+
+def accept(header):
+    return parse_accept_header(header)
+
+
+def test_negotiate():
+    assert negotiate(accept("gzip, deflate")) == "gzip"
+    assert negotiate(accept("gzip;q=0")) is None
+    assert negotiate(accept("")) is None
+    assert negotiate(accept("identity")) is None
+
+
+def test_stream_chunks_are_decodable_as_they_arrive():
+    chunks = list(compress_stream(["line 1\n", b"line 2\n"], "gzip"))
+    decoder = zlib.decompressobj(31)
+    # Each flushed chunk decodes on its own, before the stream has ended
+    assert decoder.decompress(chunks[0]) == b"line 1\n"
+    assert gzip.decompress(b"".join(chunks)) == b"line 1\nline 2\n"
@@ -0,0 +1,99 @@
+import sqlite3
+import threading
+
+import pytest
+
+from db_pool import ConnectionPool, PoolTimeout
+
+
+@pytest.fixture
+def pool(tmp_path):
+    p = ConnectionPool(str(tmp_path / "pool.db"), max_size=2, timeout=0.2)
+    yield p
+    p.close()
+
+
+def test_connections_are_wal_and_reused(pool):
+    conn = pool.acquire()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    conn.close()  # back to the pool, not closed
+    assert pool.acquire() is conn
+    assert pool.stats()["connections_created"] == 1
+
+
+def test_acquire_times_out_when_exhausted(pool):
+    held = [pool.acquire(), pool.acquire()]
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    assert pool.stats()["timeouts"] == 1
+    for conn in held:
+        conn.close()
+
+
+def test_waiter_gets_released_connection(pool):
+    first, second = pool.acquire(), pool.acquire()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire(timeout=5)))
+    waiter.start()
+    first.close()
+    waiter.join(5)
+    assert got == [first]
+    assert pool.stats()["waits"] == 1
+    got[0].close()
+    second.close()
+
+
+def test_release_rolls_back_open_transaction(pool):
+    conn = pool.acquire()
+    conn.execute("CREATE TABLE t (x)")
+    conn.commit()
+    conn.execute("INSERT INTO t VALUES (1)")
+    conn.close()
+    conn = pool.acquire()
+    assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+    conn.close()
+
+
+def test_stale_lease_does_not_release_new_holder(pool):
+    conn = pool.acquire()
+    lease = conn.lease
+    conn.close()
+    again = pool.acquire()
+    assert again is conn
+    pool.release(conn, lease)  # e.g. teardown for the earlier request
+    assert conn.checked_out
+    assert pool.stats()["in_use"] == 1
+    again.close()
+
+
+def test_read_only_pool_cannot_write(tmp_path):
+    path = str(tmp_path / "ro.db")
+    writer = ConnectionPool(path, max_size=1)
+    with writer.connection() as conn:
+        conn.execute("CREATE TABLE t (x)")
+        conn.execute("INSERT INTO t VALUES (1)")
+        conn.commit()
+    readers = ConnectionPool(path, max_size=2, read_only=True)
+    with readers.connection() as conn:
+        assert conn.execute("SELECT x FROM t").fetchone()[0] == 1
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("INSERT INTO t VALUES (2)")
+    readers.close()
+    writer.close()
+
+
+def test_statement_callback_sees_execute(tmp_path):
+    seen = []
+    p = ConnectionPool(str(tmp_path / "cb.db"), max_size=1,
+                       on_statement=lambda sql, params, seconds: seen.append(sql))
+    with p.connection() as conn:
+        conn.execute("SELECT 1")
+    p.close()
+    assert "SELECT 1" in seen
+
+
+def test_request_connections_return_to_pool(client, app_module, user):
+    client.post("/api/notes/upsert", json={"title": "a", "content": "b"}, headers=user)
+    assert client.get("/api/notes", headers=user).status_code == 200
+    assert app_module.get_pool().stats()["in_use"] == 0
+    assert app_module.get_read_pool().stats()["in_use"] == 0
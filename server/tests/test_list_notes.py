@@ -0,0 +1,137 @@
+import base64
+import gzip
+import json
+
+import pytest
+
+
+def add_notes(client, user, stamps):
+    items = [{"title": f"n{i}", "updated_at": stamp} for i, stamp in enumerate(stamps)]
+    resp = client.post("/api/notes/batch_upsert", json={"items": items}, headers=user)
+    return [r["id"] for r in resp.get_json()["items"]]
+
+
+def pages(client, user, query, limit):
+    """Follow next_cursor through every page; returns the list of pages (ids)"""
+    out, path = [], f"/api/notes?{query}limit={limit}"
+    while True:
+        body = client.get(path, headers=user).get_json()
+        out.append([n["remote_id"] for n in body["items"]])
+        if not body["has_more"]:
+            return out
+        path = f"/api/notes?cursor={body['next_cursor']}&limit={limit}"
+
+
+def test_cursor_pages_cover_every_row_once(client, user):
+    # Ties on the timestamp must neither repeat nor skip rows across pages
+    ids = add_notes(client, user, [1000, 2000, 2000, 2000, 2000, 3000, 1500])
+    result = pages(client, user, "", 2)
+    assert [len(p) for p in result] == [2, 2, 2, 1]
+    flat = [i for p in result for i in p]
+    assert flat == [ids[0], ids[6], ids[1], ids[2], ids[3], ids[4], ids[5]]
+
+
+def test_updated_after_is_exclusive_and_paged(client, user):
+    ids = add_notes(client, user, [1000, 2000, 3000, 4000])
+    assert pages(client, user, "updated_after=1970-01-01T00:00:02Z&", 2) == [[ids[2], ids[3]]]
+
+
+def test_last_page_cursor_resumes_later(client, user):
+    add_notes(client, user, [1000])
+    body = client.get("/api/notes", headers=user).get_json()
+    assert body["has_more"] is False and body["next_cursor"]
+    (later,) = add_notes(client, user, [5000])
+    again = client.get(f"/api/notes?cursor={body['next_cursor']}", headers=user).get_json()
+    assert [n["remote_id"] for n in again["items"]] == [later]
+
+
+def test_empty_page_keeps_the_cursor(client, user):
+    add_notes(client, user, [1000])
+    cursor = client.get("/api/notes", headers=user).get_json()["next_cursor"]
+    body = client.get(f"/api/notes?cursor={cursor}", headers=user).get_json()
+    assert body["items"] == [] and body["next_cursor"] == cursor
+
+
+def test_legacy_cursor_with_iso_timestamp(client, user):
+    ids = add_notes(client, user, [1000, 2000])
+    raw = json.dumps(["1970-01-01T00:00:01Z", ids[0]]).encode()
+    token = base64.urlsafe_b64encode(raw).decode().rstrip("=")
+    body = client.get(f"/api/notes?cursor={token}", headers=user).get_json()
+    assert [n["remote_id"] for n in body["items"]] == [ids[1]]
+
+
+@pytest.mark.parametrize("cursor", ["%%%", "bm90IGpzb24", base64.urlsafe_b64encode(b'["a","b"]').decode()])
+def test_malformed_cursor(client, user, cursor):
+    resp = client.get(f"/api/notes?cursor={cursor}", headers=user)
+    assert resp.status_code == 400
+    assert resp.get_json()["error"]["code"] == "INVALID_CURSOR"
+
+
+@pytest.mark.parametrize("limit, expected", [("0", 1), ("-5", 1), ("5000", 3)])
+def test_limit_is_clamped(client, user, limit, expected):
+    add_notes(client, user, [1000, 2000, 3000])
+    assert len(client.get(f"/api/notes?limit={limit}", headers=user).get_json()["items"]) == expected
+
+
+def test_bad_limit_is_invalid_input(client, user):
+    resp = client.get("/api/notes?limit=ten", headers=user)
+    assert resp.status_code == 400
+    assert resp.get_json()["error"]["code"] == "INVALID_INPUT"
+
+
+def test_listing_uses_keyset_index(app_module):
+    sql, params = app_module.notes_query(1, position=(1000, 5), limit=10)
+    conn = app_module.read_db()
+    try:
+        plan = " ".join(r["detail"] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+    finally:
+        conn.close()
+    assert "idx_notes_user_updated_ms" in plan and "TEMP B-TREE" not in plan
+
+
+def ndjson(resp):
+    return [json.loads(line) for line in resp.data.decode("utf-8").splitlines()]
+
+
+def test_ndjson_streams_every_row_then_a_trailer(client, user):
+    ids = add_notes(client, user, [1000, 2000, 3000])
+    resp = client.get("/api/notes", headers={**user, "Accept": "application/x-ndjson"})
+    assert resp.mimetype == "application/x-ndjson"
+    lines = ndjson(resp)
+    assert [n["remote_id"] for n in lines[:-1]] == ids
+    assert set(lines[-1]) == {"server_now", "next_cursor"}
+    # The trailer's cursor resumes after the last streamed row
+    (later,) = add_notes(client, user, [9000])
+    tail = ndjson(client.get(f"/api/notes?stream=1&cursor={lines[-1]['next_cursor']}", headers=user))
+    assert [n["remote_id"] for n in tail[:-1]] == [later]
+
+
+def test_ndjson_ignores_the_json_page_size(client, user, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "NOTES_PAGE_MAX", 2)
+    monkeypatch.setattr(app_module, "STREAM_FETCH_ROWS", 2)
+    add_notes(client, user, [1000 + i for i in range(5)])
+    assert len(ndjson(client.get("/api/notes?stream=1", headers=user))) == 6
+    assert len(ndjson(client.get("/api/notes?stream=1&limit=0", headers=user))) == 2  # clamped to 1
+
+
+def test_json_and_ndjson_have_distinct_etags(client, user):
+    json_resp = client.get("/api/notes", headers=user)
+    nd_resp = client.get("/api/notes", headers={**user, "Accept": "application/x-ndjson"})
+    nd_resp.get_data()  # finish the stream inside its request context
+    assert json_resp.headers["ETag"] != nd_resp.headers["ETag"]
+    for resp in (json_resp, nd_resp):
+        assert "Accept" in resp.headers["Vary"]
+    again = client.get("/api/notes", headers={**user, "If-None-Match": json_resp.headers["ETag"],
+                                              "Accept": "application/x-ndjson"})
+    assert again.status_code == 200
+    again.get_data()
+    not_modified = client.get("/api/notes", headers={**user, "If-None-Match": nd_resp.headers["ETag"],
+                                                     "Accept": "application/x-ndjson"})
+    assert not_modified.status_code == 304 and "Accept" in not_modified.headers["Vary"]
+
+
+def test_ndjson_stream_is_gzipped(client, user):
+    add_notes(client, user, [1000])
+    resp = client.get("/api/notes?stream=1", headers={**user, "Accept-Encoding": "gzip"})
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert len(gzip.decompress(resp.data).splitlines()) == 2
@@ -0,0 +1,67 @@
+import gzip
+import json
+
+
+def pull(client, user, path, saved):
+    """One client pull of `path`: (status, body, etag), sending the saved ETag if it is for this path"""
+    headers = dict(user)
+    if saved and saved[0] == path:
+        headers["If-None-Match"] = saved[1]
+    resp = client.get(path, headers=headers)
+    return resp.status_code, (resp.get_json() if resp.status_code == 200 else None), resp.headers.get("ETag")
+
+
+def test_idle_polls_get_304(client, user):
+    client.post("/api/notes/upsert", json={"title": "a", "updated_at": "2026-01-01T10:00:00Z"}, headers=user)
+
+    # Same sequence as pull() in src/utils/sync.ts
+    status, body, etag = pull(client, user, "/api/notes", None)
+    assert status == 200 and len(body["items"]) == 1
+    since = body["server_now"]
+    path = f"/api/notes?updated_after={since}"
+
+    status, body, etag = pull(client, user, path, None)
+    assert status == 200 and body["items"] == []
+    saved = (path, etag)  # empty pull: the bookmark (and so the path) stays
+
+    status, _, _ = pull(client, user, path, saved)
+    assert status == 304
+    status, _, _ = pull(client, user, path, saved)
+    assert status == 304
+
+    client.post("/api/notes/upsert", json={"title": "b", "updated_at": "2099-01-01T00:00:00Z"}, headers=user)
+    status, body, _ = pull(client, user, path, saved)
+    assert status == 200 and [n["title"] for n in body["items"]] == ["b"]
+
+
+def test_folder_listing_etag(client, user):
+    resp = client.get("/api/folders", headers=user)
+    etag = resp.headers["ETag"]
+    assert client.get("/api/folders", headers={**user, "If-None-Match": etag}).status_code == 304
+    client.post("/api/folders", json={"name": "Work"}, headers=user)
+    resp = client.get("/api/folders", headers={**user, "If-None-Match": etag})
+    assert resp.status_code == 200
+    assert [f["name"] for f in resp.get_json()["items"]] == ["Work"]
+
+
+def test_etag_is_per_user(client, user):
+    etag = client.get("/api/notes", headers=user).headers["ETag"]
+    other = client.get("/api/notes", headers={"X-User": "2", "If-None-Match": etag})
+    assert other.status_code == 200
+
+
+def test_gzip_response_and_its_etag_validate(client, user):
+    client.post("/api/notes/upsert", json={"title": "big", "content": "x" * 5000}, headers=user)
+    resp = client.get("/api/notes", headers={**user, "Accept-Encoding": "gzip"})
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in resp.headers["Vary"]
+    assert json.loads(gzip.decompress(resp.data))["items"][0]["title"] == "big"
+    etag = resp.headers["ETag"]
+    assert etag.endswith('-gzip"')
+    again = client.get("/api/notes", headers={**user, "Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert again.status_code == 304
+
+
+def test_small_responses_are_not_compressed(client, user):
+    resp = client.get("/api/folders", headers={**user, "Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in resp.headers
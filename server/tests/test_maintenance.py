@@ -0,0 +1,105 @@
+import datetime
+import time
+
+from maintenance import Budget, MaintenanceScheduler
+
+
+def tombstone(client, user, updated_at):
+    resp = client.post("/api/notes/upsert", json={"title": "t", "is_deleted": True, "updated_at": updated_at}, headers=user)
+    return resp.get_json()["id"]
+
+
+def note_ids(app_module):
+    conn = app_module.read_db()
+    try:
+        return {r["id"] for r in conn.execute("SELECT id FROM notes")}
+    finally:
+        conn.close()
+
+
+def run(app_module, job):
+    result = app_module.maintenance.run_job(job)
+    assert app_module.maintenance.jobs[job].last_error is None
+    return result
+
+
+def days_ago(days):
+    return datetime.datetime.utcnow() - datetime.timedelta(days=days)
+
+
+def test_purge_tombstones_compares_instants(client, user, app_module):
+    ttl = app_module.TOMBSTONE_TTL_DAYS
+    old_ms = int(time.time() * 1000) - int((ttl + 1) * 86400000)
+    old = tombstone(client, user, old_ms)
+    # Same day as the cutoff but after it; as text "YYYY-MM-DD HH..." sorts before "YYYY-MM-DDT..."
+    recent = tombstone(client, user, (days_ago(ttl) + datetime.timedelta(hours=1)).strftime("%Y-%m-%d %H:%M:%S"))
+    live = client.post("/api/notes/upsert", json={"title": "live", "updated_at": old_ms}, headers=user).get_json()["id"]
+
+    assert run(app_module, "purge_tombstones") == {"purged": 1}
+    assert note_ids(app_module) == {recent, live}
+    assert old not in note_ids(app_module)
+
+
+def test_purge_prefers_deleted_at(client, user, app_module):
+    nid = tombstone(client, user, "2020-01-01T00:00:00Z")
+    recent = days_ago(1).isoformat() + "Z"
+    app_module.write(lambda c: c.execute("UPDATE notes SET deleted_at=? WHERE id=?", (recent, nid)))
+    assert run(app_module, "purge_tombstones") == {"purged": 0}
+
+
+def test_tombstone_scan_uses_index(app_module):
+    conn = app_module.read_db()
+    try:
+        plan = " ".join(r["detail"] for r in conn.execute(
+            f"EXPLAIN QUERY PLAN SELECT id FROM notes WHERE is_deleted = 1 AND {app_module.TOMBSTONE_AGE_SQL} < ?", (0,)))
+    finally:
+        conn.close()
+    assert "idx_notes_tombstones_ms" in plan
+
+
+def test_trim_sync_queue(app_module):
+    def fill(c):
+        c.execute("INSERT INTO sync_queue(user_id, action, table_name, created_at) VALUES (1, 'x', 'notes', '2000-01-01 00:00:00')")
+        c.execute("INSERT INTO sync_queue(user_id, action, table_name) VALUES (1, 'x', 'notes')")
+    app_module.write(fill)
+    assert run(app_module, "trim_sync_queue") == {"removed": 1}
+
+
+def test_compact_changes_keeps_latest_per_entity(client, user, app_module):
+    nid = client.post("/api/notes/upsert", json={"title": "a", "updated_at": 1000}, headers=user).get_json()["id"]
+    for n in range(2, 5):
+        client.post("/api/notes/upsert", json={"id": nid, "title": "a", "updated_at": 1000 * n}, headers=user)
+    assert len(client.get("/api/changes", headers=user).get_json()["changes"]) == 4
+    assert app_module.compact_changes() == 3
+    changes = client.get("/api/changes", headers=user).get_json()["changes"]
+    assert [(c["id"], c["op"], c["version"]) for c in changes] == [(nid, "update", 4)]
+
+
+def test_optimize_and_vacuum_run(app_module):
+    assert run(app_module, "optimize")["ran"] in ("analyze", "optimize")
+    assert "pages_freed" in run(app_module, "incremental_vacuum")
+
+
+def test_scheduler_records_failures():
+    scheduler = MaintenanceScheduler()
+    scheduler.add("boom", lambda budget: 1 / 0, interval=60)
+    scheduler.add("off", lambda budget: None, interval=0)
+    assert scheduler.run_job("boom") is None
+    status = scheduler.stats()
+    assert list(status) == ["boom"]
+    assert status["boom"]["failures"] == 1 and "division" in status["boom"]["last_error"]
+
+
+def test_budget_interrupts_long_statement(app_module):
+    conn = app_module.read_db()
+    try:
+        budget = Budget(0.0)
+        with budget.interruptible(conn, every_n_ops=100):
+            try:
+                conn.execute("WITH RECURSIVE r(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM r) SELECT COUNT(*) FROM r").fetchall()
+                interrupted = False
+            except Exception as e:
+                interrupted = "interrupted" in str(e)
+    finally:
+        conn.close()
+    assert interrupted
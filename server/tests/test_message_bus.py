@@ -0,0 +1,99 @@
+import threading
+import time
+
+import pytest
+
+from message_bus import LocalBus, SQLiteBus, create_bus
+
+
+@pytest.fixture
+def buses(tmp_path):
+    """Two workers sharing one broker file"""
+    path = str(tmp_path / "bus.db")
+    started = [SQLiteBus(path, poll_interval=0.005), SQLiteBus(path, poll_interval=0.005)]
+    yield started
+    for bus in started:
+        bus.stop()
+
+
+def collect(bus, channel):
+    got = []
+    arrived = threading.Event()
+
+    def on_message(message):
+        got.append(message)
+        arrived.set()
+    bus.subscribe(channel, on_message)
+    return got, arrived
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_messages_reach_other_processes_only(buses):
+    a, b = buses
+    got_a, _ = collect(a, "emit")
+    got_b, _ = collect(b, "emit")
+    a.start()
+    b.start()
+    for i in range(3):
+        a.publish("emit", {"n": i})
+    wait_for(lambda: len(got_b) == 3)
+    assert got_b == [{"n": 0}, {"n": 1}, {"n": 2}]
+    time.sleep(0.05)
+    assert got_a == []
+    assert a.stats()["published"] == 3 and b.stats()["received"] == 3
+
+
+def test_channels_are_separate(buses):
+    a, b = buses
+    emits, _ = collect(b, "emit")
+    statuses, arrived = collect(b, "sync_status")
+    a.start()
+    b.start()
+    a.publish("sync_status", {"op": "connection_opened"})
+    assert arrived.wait(5)
+    assert statuses == [{"op": "connection_opened"}] and emits == []
+
+
+def test_only_new_messages_are_delivered(buses):
+    a, b = buses
+    a.start()
+    a.publish("emit", {"old": True})
+    wait_for(lambda: a.stats()["queued"] == 0)
+    time.sleep(0.05)
+    got, arrived = collect(b, "emit")
+    b.start()
+    a.publish("emit", {"old": False})
+    assert arrived.wait(5)
+    assert got == [{"old": False}]
+
+
+def test_failing_subscriber_is_counted(buses):
+    a, b = buses
+    b.subscribe("emit", lambda message: 1 / 0)
+    got, arrived = collect(b, "emit")
+    a.start()
+    b.start()
+    a.publish("emit", {})
+    assert arrived.wait(5)
+    assert b.stats()["delivery_errors"] == 1 and got == [{}]
+
+
+def test_create_bus(tmp_path):
+    assert isinstance(create_bus(None), LocalBus) and not create_bus("local").shared
+    bus = create_bus(f"sqlite:{tmp_path / 'bus.db'}")
+    assert isinstance(bus, SQLiteBus) and bus.shared
+    for spec in ("sqlite:", "redis://localhost"):
+        with pytest.raises(ValueError):
+            create_bus(spec)
+
+
+def test_local_bus_counts_publishes():
+    bus = LocalBus()
+    bus.publish("emit", {})
+    assert bus.stats() == {"backend": "local", "published": 1}
@@ -0,0 +1,54 @@
+import re
+
+from metrics import Histogram, Metrics, param_shapes
+
+
+def sample(text, name, **labels):
+    """Value of one Prometheus sample in `text`"""
+    label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    m = re.search(rf"^{re.escape(name)}\{{{re.escape(label_text)}\}} (\S+)$", text, re.M)
+    return float(m.group(1)) if m else None
+
+
+def test_request_latency_is_recorded_per_route(client, user):
+    client.get("/api/notes", headers=user)
+    text = client.get("/api/metrics").data.decode()
+    assert sample(text, "mynote_http_request_duration_seconds_count",
+                  method="GET", endpoint="/api/notes", status="200") >= 1
+
+
+def test_writer_thread_sql_counts_towards_the_request(client, user):
+    client.post("/api/notes/upsert", json={"title": "a"}, headers=user)
+    text = client.get("/api/metrics").data.decode()
+    # The INSERT ran on the group-commit writer thread
+    assert sample(text, "mynote_sql_statements_per_request_sum", endpoint="/api/notes/upsert") >= 1
+
+
+def test_slow_queries_are_listed_in_health(client, user, app_module, monkeypatch):
+    monkeypatch.setattr(app_module.metrics, "slow_query_seconds", 0.0)
+    client.post("/api/notes/upsert", json={"title": "secret title"}, headers=user)
+    slow = client.get("/api/health").get_json()["slow_queries"]
+    insert = next(q for q in slow if q["sql"].startswith("INSERT INTO notes"))
+    assert "str[12]" in insert["params"]
+    assert "secret title" not in str(slow)
+
+
+def test_slow_log_is_bounded_and_newest_first():
+    m = Metrics(slow_query_ms=0, slow_log_size=2)
+    for n in range(3):
+        m.on_statement(f"SELECT {n}", (), 0.001)
+    assert [q["sql"] for q in m.recent_slow_queries()] == ["SELECT 2", "SELECT 1"]
+
+
+def test_param_shapes_hide_values():
+    assert param_shapes((1, "abc", None, b"xy", 1.5)) == ["int", "str[3]", "None", "bytes[2]", "float"]
+
+
+def test_histogram_buckets_are_cumulative():
+    h = Histogram("h", "help", buckets=(0.1, 1.0))
+    h.observe(0.05)
+    h.observe(0.5)
+    text = "\n".join(h.render())
+    assert 'h_bucket{le="0.1"} 1' in text
+    assert 'h_bucket{le="1"} 2' in text
+    assert 'h_bucket{le="+Inf"} 2' in text
@@ -0,0 +1,87 @@
+import sqlite3
+
+import pytest
+
+from migrations import Migration, MigrationError, MigrationRunner, schema_version
+
+
+def connect(path):
+    conn = sqlite3.connect(str(path), isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def create_items(c):
+    c.execute("CREATE TABLE items(id INTEGER PRIMARY KEY, n INTEGER, doubled INTEGER)")
+    c.executemany("INSERT INTO items(n) VALUES (?)", [(i,) for i in range(10)])
+
+
+def start_doubling(c):
+    return 0  # backfill from id 0
+
+
+def make_fill(fail_after=None):
+    calls = []
+
+    def fill(c, last_id, limit):
+        if fail_after is not None and len(calls) >= fail_after:
+            raise RuntimeError("boom")
+        calls.append(last_id)
+        c.execute("UPDATE items SET doubled = n * 2 WHERE id > ? AND id <= ?", (last_id, last_id + limit))
+        rows = c.rowcount
+        c.execute("SELECT MAX(id) FROM items")
+        return rows, (last_id + limit if last_id + limit < c.fetchone()[0] else None)
+    return fill, calls
+
+
+def migrations(fill):
+    return [Migration(1, "items", create_items), Migration(2, "double", start_doubling, fill)]
+
+
+def test_applies_in_batches_and_records_version(tmp_path):
+    conn = connect(tmp_path / "m.db")
+    fill, calls = make_fill()
+    reports = MigrationRunner(conn, migrations(fill), batch_size=3, on_progress=None).run()
+    assert [r["version"] for r in reports] == [1, 2]
+    assert calls == [0, 3, 6, 9]
+    assert schema_version(conn) == 2
+    assert conn.execute("SELECT COUNT(*) FROM items WHERE doubled = n * 2").fetchone()[0] == 10
+    assert MigrationRunner(conn, migrations(fill)).run() == []  # nothing pending
+
+
+def test_interrupted_backfill_resumes_from_last_batch(tmp_path):
+    conn = connect(tmp_path / "m.db")
+    fill, _ = make_fill(fail_after=2)
+    with pytest.raises(MigrationError):
+        MigrationRunner(conn, migrations(fill), batch_size=3, on_progress=None).run()
+    assert schema_version(conn) == 1
+    status = MigrationRunner(conn, migrations(fill)).status()
+    assert status[1]["in_progress"] is True and status[1]["rows_done"] == 6
+
+    fill, calls = make_fill()
+    MigrationRunner(conn, migrations(fill), batch_size=3, on_progress=None).run()
+    assert calls == [6, 9]  # the two committed batches are not redone
+    assert schema_version(conn) == 2
+
+
+def test_dry_run_changes_nothing(tmp_path):
+    conn = connect(tmp_path / "m.db")
+    fill, calls = make_fill()
+    reports = MigrationRunner(conn, migrations(fill)).run(dry_run=True)
+    assert [r["version"] for r in reports] == [1, 2] and calls == []
+    assert schema_version(conn) == 0
+    assert conn.execute("SELECT 1 FROM sqlite_master WHERE name='items'").fetchone() is None
+
+
+def test_versions_must_be_contiguous():
+    with pytest.raises(ValueError):
+        MigrationRunner(None, [Migration(2, "x", start_doubling)])
+
+
+def test_server_schema_is_current_and_idempotent(app_module):
+    conn = app_module.db()
+    try:
+        assert schema_version(conn) == app_module.SCHEMA_VERSION
+    finally:
+        conn.close()
+    app_module.init_db()  # no DDL once current
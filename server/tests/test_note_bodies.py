@@ -0,0 +1,66 @@
+import pytest
+
+from note_bodies import BodyStore, deflate, inflate, migrate_inline_bodies
+
+BIG = "lorem ipsum dolor " * 100
+
+
+@pytest.fixture
+def compressed(app_module, monkeypatch):
+    monkeypatch.setattr(app_module.bodies, "enabled", True)
+    monkeypatch.setattr(app_module.bodies, "min_bytes", 256)
+    return app_module
+
+
+def rows(app_module, sql, params=()):
+    conn = app_module.read_db()
+    try:
+        return [tuple(r) for r in conn.execute(sql, params)]
+    finally:
+        conn.close()
+
+
+def test_round_trip():
+    codec, data = deflate(BIG)
+    assert inflate(codec, data) == BIG and len(data) < len(BIG)
+
+
+def test_identical_bodies_are_stored_once(client, user, compressed):
+    for _ in range(2):
+        client.post("/api/notes/upsert", json={"title": "big", "content": BIG}, headers=user)
+    client.post("/api/notes/upsert", json={"title": "small", "content": "tiny"}, headers=user)
+    assert rows(compressed, "SELECT COUNT(*) FROM note_bodies") == [(1,)]
+    assert rows(compressed, "SELECT content IS NULL, body_hash IS NOT NULL FROM notes ORDER BY id") == [
+        (1, 1), (1, 1), (0, 0)]
+    items = client.get("/api/notes", headers=user).get_json()["items"]
+    assert [n["content"] for n in items[:2]] == [BIG, BIG]
+
+
+def test_compressed_bodies_are_searchable(client, user, compressed):
+    client.post("/api/notes/upsert", json={"title": "big", "content": BIG + " zebra"}, headers=user)
+    assert len(client.get("/api/notes/search?q=zebra", headers=user).get_json()["items"]) == 1
+
+
+def test_unreferenced_bodies_are_purged(client, user, compressed):
+    nid = client.post("/api/notes/upsert", json={"title": "big", "content": BIG, "updated_at": 1000},
+                      headers=user).get_json()["id"]
+    client.post("/api/notes/upsert", json={"id": nid, "content": "short now", "updated_at": 2000}, headers=user)
+    assert compressed.maintenance.run_job("purge_note_bodies") == {"purged": 1}
+    assert rows(compressed, "SELECT COUNT(*) FROM note_bodies") == [(0,)]
+
+
+def test_migrating_inline_bodies_adds_no_changes(client, user, app_module):
+    client.post("/api/notes/upsert", json={"title": "big", "content": BIG}, headers=user)
+    latest = client.get("/api/changes", headers=user).get_json()["last_seq"]
+    conn = app_module.db()
+    try:
+        assert migrate_inline_bodies(conn, BodyStore(enabled=True, min_bytes=256)) == 1
+    finally:
+        conn.close()
+    assert client.get(f"/api/changes?since_seq={latest}", headers=user).get_json()["changes"] == []
+    assert client.get("/api/notes", headers=user).get_json()["items"][0]["content"] == BIG
+
+
+def test_small_or_disabled_content_stays_inline():
+    assert BodyStore(enabled=False).prepare(None, BIG) == (BIG, None)
+    assert BodyStore(enabled=True, min_bytes=10000).prepare(None, BIG) == (BIG, None)
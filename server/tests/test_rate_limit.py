@@ -0,0 +1,93 @@
+import threading
+
+from rate_limit import ConcurrencyLimiter, RateLimiter, retry_after_header
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_allows_burst_then_refills():
+    clock = FakeClock()
+    limiter = RateLimiter(rate=2, burst=3, clock=clock)
+    assert [limiter.acquire(1) for _ in range(3)] == [0, 0, 0]
+    assert limiter.acquire(1) == 0.5
+    assert limiter.acquire(2) == 0  # buckets are per key
+    clock.now += 0.5
+    assert limiter.acquire(1) == 0
+    assert limiter.acquire(1) == 0.5
+    clock.now += 60
+    assert [limiter.acquire(1) for _ in range(4)] == [0, 0, 0, 0.5]  # never more than burst
+    stats = limiter.stats()
+    assert (stats["allowed"], stats["limited"], stats["top_limited"]) == (8, 3, {"1": 3})
+
+
+def test_disabled_limiter_allows_everything():
+    limiter = RateLimiter(rate=0, burst=1)
+    assert all(limiter.acquire(1) == 0 for _ in range(100))
+    assert limiter.stats()["tracked_keys"] == 0
+
+
+def test_full_buckets_are_pruned():
+    clock = FakeClock()
+    limiter = RateLimiter(rate=1, burst=2, max_keys=2, clock=clock)
+    limiter.acquire(1)
+    limiter.acquire(2)
+    clock.now += 10
+    limiter.acquire(3)
+    assert limiter.stats()["tracked_keys"] == 1
+
+
+def test_retry_after_header_is_whole_seconds():
+    assert [retry_after_header(s) for s in (0.01, 1, 1.2)] == ["1", "1", "2"]
+
+
+def test_concurrency_limiter_queues_then_rejects():
+    slots = ConcurrencyLimiter(max_active=1, max_queued=1, queue_timeout=5)
+    assert slots.acquire()
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(slots.acquire()))
+    waiter.start()
+    while slots.stats()["queued"] == 0:
+        pass
+    assert not slots.acquire()  # queue full
+    slots.release()
+    waiter.join(5)
+    assert results == [True]
+    stats = slots.stats()
+    assert (stats["active"], stats["admitted"], stats["waited"], stats["rejected"]) == (1, 2, 1, 1)
+
+
+def test_concurrency_limiter_wait_times_out():
+    slots = ConcurrencyLimiter(max_active=1, max_queued=1, queue_timeout=0.01)
+    assert slots.acquire()
+    assert not slots.acquire()
+    assert slots.stats()["timeouts"] == 1
+
+
+def test_rate_limited_request(client, user, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "write_limiter", RateLimiter(rate=0.1, burst=1))
+    assert client.post("/api/notes/upsert", json={"title": "a"}, headers=user).status_code == 200
+    resp = client.post("/api/notes/upsert", json={"title": "b"}, headers=user)
+    assert resp.status_code == 429
+    assert resp.headers["Retry-After"] == "10"
+    assert resp.get_json()["error"]["code"] == "RATE_LIMITED"
+    # Reads and other users have their own buckets
+    assert client.get("/api/notes", headers=user).status_code == 200
+    assert client.post("/api/notes/upsert", json={"title": "c"}, headers={"X-User": "2"}).status_code == 200
+
+
+def test_busy_server_returns_503(client, user, app_module, monkeypatch):
+    slots = ConcurrencyLimiter(max_active=1)
+    monkeypatch.setattr(app_module, "request_slots", slots)
+    assert slots.acquire()
+    resp = client.get("/api/notes", headers=user)
+    assert resp.status_code == 503 and resp.headers["Retry-After"] == "1"
+    assert client.get("/api/health").status_code == 200
+    slots.release()
+    assert client.get("/api/notes", headers=user).status_code == 200
+    assert slots.stats()["active"] == 0  # released at teardown
@@ -0,0 +1,72 @@
+from read_cache import UserCache
+
+
+def folder_names(resp):
+    return [f["name"] for f in resp.get_json()["items"]]
+
+
+def test_folder_listing_is_served_from_cache(client, user, app_module):
+    client.post("/api/folders", json={"name": "Work"}, headers=user)
+    client.get("/api/folders", headers=user)
+    hits = app_module.cache.stats()["hits"]["folders"]
+    assert folder_names(client.get("/api/folders", headers=user)) == ["Work"]
+    assert app_module.cache.stats()["hits"]["folders"] == hits + 1
+
+
+def test_cached_listing_not_served_before_invalidation(client, user, app_module):
+    client.post("/api/folders", json={"name": "Work"}, headers=user)
+    client.get("/api/folders", headers=user)  # cached
+    # A folder write that has committed but not yet invalidated the cache
+    app_module.write(lambda c: c.execute(
+        "INSERT INTO folders (user_id, name, created_at, updated_at) VALUES (1, 'Home', 'x', 'x')"))
+    resp = client.get("/api/folders", headers=user)
+    assert folder_names(resp) == ["Home", "Work"]
+    # The ETag sent with those rows is the one for the new state
+    assert client.get("/api/folders", headers={**user, "If-None-Match": resp.headers["ETag"]}).status_code == 304
+
+
+def test_folder_writes_invalidate(client, user):
+    folder = client.post("/api/folders", json={"name": "Work"}, headers=user).get_json()["id"]
+    client.get("/api/folders", headers=user)
+    client.put(f"/api/folders/{folder}", json={"name": "Jobs"}, headers=user)
+    assert folder_names(client.get("/api/folders", headers=user)) == ["Jobs"]
+    client.delete(f"/api/folders/{folder}", headers=user)
+    assert folder_names(client.get("/api/folders", headers=user)) == []
+
+
+def test_note_metadata_cache_keeps_last_writer_wins(client, user, app_module):
+    nid = client.post("/api/notes/upsert", json={"title": "a", "updated_at": "2026-01-01T10:00:00Z"},
+                      headers=user).get_json()["id"]
+    newer = client.post("/api/notes/upsert", json={"id": nid, "title": "b", "updated_at": "2026-01-01T11:00:00Z"},
+                        headers=user).get_json()
+    assert newer["version"] == 2
+    stale = client.post("/api/notes/upsert", json={"id": nid, "title": "c", "updated_at": "2026-01-01T10:30:00Z"},
+                        headers=user).get_json()
+    assert stale["version"] == 2
+    assert app_module.cache.stats()["hits"]["note_meta"] >= 2
+    assert client.get("/api/notes", headers=user).get_json()["items"][0]["title"] == "b"
+
+
+def test_put_folders_skipped_after_invalidation():
+    cache = UserCache()
+    generation = cache.folders_generation(1)
+    cache.invalidate_folders(1)
+    cache.put_folders(1, [("row",)], 5, generation)
+    assert cache.get_folders(1, 5) is None
+
+
+def test_get_folders_requires_matching_seq():
+    cache = UserCache()
+    cache.put_folders(1, [("row",)], 5, cache.folders_generation(1))
+    assert cache.get_folders(1, 5) == [("row",)]
+    assert cache.get_folders(1, 6) is None
+
+
+def test_lru_evicts_whole_users():
+    cache = UserCache(max_entries=3)
+    for uid in (1, 2):
+        cache.put_note(uid, 10, {"id": 10})
+        cache.put_note(uid, 11, {"id": 11})
+    assert cache.get_note(1, 10) is None
+    assert cache.get_note(2, 11) == {"id": 11}
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,65 @@
+import hashlib
+import sqlite3
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def writer(app_module, monkeypatch):
+    """The writer connection, held with an uncommitted transaction open"""
+    pool = app_module.get_pool()
+    monkeypatch.setattr(pool, "timeout", 0.5)  # a read waiting on the writer fails fast
+    conn = pool.acquire()
+    yield conn
+    pool.release(conn)
+
+
+def test_pools(app_module):
+    assert app_module.get_pool().max_size == app_module.DB_WRITERS == 1
+    assert app_module.get_read_pool().read_only and not app_module.get_pool().read_only
+    conn = app_module.read_db()
+    try:
+        assert conn.execute("PRAGMA query_only").fetchone()[0] == 1
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM notes")
+    finally:
+        conn.close()
+
+
+def test_reads_do_not_wait_for_the_writer(client, user, writer):
+    writer.execute("INSERT INTO folders(user_id, name) VALUES (1, 'uncommitted-folder')")
+    for path in ("/api/notes", "/api/folders", "/api/notes?format=ndjson", "/api/changes?since=0", "/api/sync-status"):
+        resp = client.get(path, headers=user)
+        assert resp.status_code == 200, path
+        assert b"uncommitted-folder" not in resp.get_data(), path  # uncommitted writes are invisible
+
+
+def test_reads_see_each_commit(client, user, app_module):
+    for i in range(3):
+        client.post("/api/notes/upsert", json={"title": f"n{i}"}, headers=user)
+        items = client.get("/api/notes", headers=user).get_json()["items"]
+        assert len(items) == i + 1
+
+
+def test_blob_gc_does_not_hold_the_writer_while_waiting_for_the_store(client, user, app_module, monkeypatch):
+    data = b"x" * 100
+    sha = hashlib.sha256(data).hexdigest()
+    upload_id = client.post("/api/blobs/uploads", json={"sha256": sha, "size": len(data)},
+                            headers=user).get_json()["upload_id"]
+    client.put(f"/api/blobs/uploads/{upload_id}", data=data,
+               headers={**user, "Content-Range": f"bytes 0-{len(data) - 1}/{len(data)}"})
+    monkeypatch.setattr(app_module, "BLOB_GC_GRACE", -5)
+    monkeypatch.setattr(app_module.get_pool(), "timeout", 2)
+    store = app_module.get_blob_store()
+    result = {}
+    with store._lock:  # as if an upload were moving its file into place
+        gc = threading.Thread(target=lambda: result.update(app_module.maintenance.run_job("collect_blobs")))
+        gc.start()
+        gc.join(0.2)
+        assert gc.is_alive()
+        # The writer is free while GC waits for the lock
+        assert client.post("/api/notes/upsert", json={"title": "meanwhile"}, headers=user).status_code == 200
+    gc.join(5)
+    assert result["blobs"] == 1
+    assert client.get(f"/api/blobs/{sha}", headers=user).status_code == 404
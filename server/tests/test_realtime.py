@@ -0,0 +1,59 @@
+import threading
+
+from realtime import EventBatcher
+
+
+def batcher(notes=None, max_payload_bytes=65536):
+    sent = []
+    rows = notes or {}
+    b = EventBatcher(lambda event, payload, room: sent.append((event, payload, room)),
+                     lambda uid, ids: {i: rows[i] for i in ids if i in rows},
+                     window=3600, max_payload_bytes=max_payload_bytes, now=lambda: "now")
+    return b, sent
+
+
+def test_changes_in_a_window_become_one_event():
+    b, sent = batcher({1: {"remote_id": 1}, 2: {"remote_id": 2}})
+    b.note_changed(7, 1, "created")
+    b.note_changed(7, 1, "updated")  # still "created" for receivers
+    b.note_changed(7, 2, "updated")
+    b.note_changed(7, 3, "deleted")
+    b.flush_all()
+    assert len(sent) == 1
+    event, payload, room = sent[0]
+    assert (event, room) == ("notes_changed", "user:7")
+    assert payload["changes"] == [{"id": 1, "op": "created"}, {"id": 2, "op": "updated"}, {"id": 3, "op": "deleted"}]
+    assert payload["notes"] == [{"remote_id": 1}, {"remote_id": 2}] and payload["bodies_included"] is True
+
+
+def test_one_event_per_user():
+    b, sent = batcher()
+    b.note_changed(1, 10, "deleted")
+    b.note_changed(2, 20, "deleted")
+    b.flush_all()
+    assert sorted(room for _, _, room in sent) == ["user:1", "user:2"]
+
+
+def test_large_payload_omits_bodies():
+    b, sent = batcher({1: {"content": "x" * 500}}, max_payload_bytes=100)
+    b.note_changed(1, 1, "updated")
+    b.flush_all()
+    assert sent[0][1]["bodies_included"] is False and "notes" not in sent[0][1]
+
+
+def test_batches_flush_after_the_window():
+    done = threading.Event()
+    b = EventBatcher(lambda *args: done.set(), lambda uid, ids: {}, window=0.01)
+    b.note_changed(1, 1, "deleted")
+    assert done.wait(5)
+    b.stop()
+
+
+def test_write_endpoints_feed_the_batcher(client, user, app_module, monkeypatch):
+    sent = []
+    monkeypatch.setattr(app_module.realtime, "_emit", lambda event, payload, room: sent.append(payload))
+    nid = client.post("/api/notes/upsert", json={"title": "a", "updated_at": 1000}, headers=user).get_json()["id"]
+    client.post("/api/notes/upsert", json={"id": nid, "title": "b", "updated_at": 2000}, headers=user)
+    app_module.realtime.flush_all()
+    assert sent[0]["changes"] == [{"id": nid, "op": "created"}]
+    assert sent[0]["notes"][0]["title"] == "b"  # rows are read at flush time
@@ -0,0 +1,66 @@
+import pytest
+
+
+def note(client, user, title, content="", **extra):
+    return client.post("/api/notes/upsert", json={"title": title, "content": content, **extra}, headers=user).get_json()["id"]
+
+
+def search(client, user, query):
+    resp = client.get(f"/api/notes/search?{query}", headers=user)
+    assert resp.status_code == 200
+    return resp.get_json()["items"]
+
+
+def test_prefix_terms_must_all_match(client, user):
+    both = note(client, user, "Grocery list", "apples and bananas")
+    note(client, user, "Other", "apples only")
+    assert [r["remote_id"] for r in search(client, user, "q=appl+banan")] == [both]
+
+
+def test_title_matches_rank_first(client, user, app_module):
+    if not app_module.FTS_AVAILABLE:
+        pytest.skip("SQLite built without FTS5")
+    body = note(client, user, "Notes", "meeting meeting meeting")
+    title = note(client, user, "Meeting agenda", "items")
+    results = search(client, user, "q=meeting")
+    assert [r["remote_id"] for r in results] == [title, body]
+    assert "<mark>Meeting</mark>" in results[0]["title_highlight"]
+    assert "<mark>meeting</mark>" in results[1]["snippet"]
+
+
+def test_index_follows_updates_and_deletes(client, user):
+    nid = note(client, user, "draft", "alpha", updated_at=1000)
+    client.post("/api/notes/upsert", json={"id": nid, "title": "draft", "content": "omega", "updated_at": 2000}, headers=user)
+    assert search(client, user, "q=alpha") == []
+    assert [r["remote_id"] for r in search(client, user, "q=omega")] == [nid]
+    client.delete(f"/api/notes/{nid}", headers=user)
+    assert search(client, user, "q=omega") == []
+
+
+def test_filters(client, user):
+    fav = note(client, user, "kiwi fav", is_favorite=True)
+    gone = note(client, user, "kiwi gone", is_deleted=True)
+    assert {r["remote_id"] for r in search(client, user, "q=kiwi&favorites_only=1")} == {fav}
+    assert gone not in {r["remote_id"] for r in search(client, user, "q=kiwi")}
+    assert gone in {r["remote_id"] for r in search(client, user, "q=kiwi&include_deleted=1")}
+    assert search(client, {"X-User": "2"}, "q=kiwi") == []
+
+
+def test_quotes_in_query_are_literal(client, user):
+    note(client, user, 'say "hi"')
+    assert len(search(client, user, 'q="hi')) == 1
+
+
+@pytest.mark.parametrize("query", ["q=", "q=a&limit=x", "q=a&offset=1.5"])
+def test_invalid_input(client, user, query):
+    resp = client.get(f"/api/notes/search?{query}", headers=user)
+    assert resp.status_code == 400
+    assert resp.get_json()["error"]["code"] == "INVALID_INPUT"
+
+
+def test_limit_and_offset(client, user):
+    for n in range(5):
+        note(client, user, f"melon {n}", updated_at=1000 + n)
+    assert len(search(client, user, "q=melon&limit=2")) == 2
+    assert len(search(client, user, "q=melon&offset=4")) == 1
+    assert len(search(client, user, "q=melon&limit=-1")) == 1  # clamped
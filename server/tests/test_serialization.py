@@ -0,0 +1,70 @@
+import json
+import sqlite3
+
+import pytest
+
+import serialization
+from serialization import RowLayout, dumps, json_object_tail
+
+LAYOUT = RowLayout("id", "title", "score")
+
+
+@pytest.fixture(params=["orjson", "json"])
+def encoder(request, monkeypatch):
+    """Run with orjson (when installed) and with the stdlib fallback"""
+    if request.param == "json":
+        monkeypatch.setattr(serialization, "orjson", None)
+    elif serialization.orjson is None:
+        pytest.skip("orjson not installed")
+    return request.param
+
+
+@pytest.fixture
+def cursor():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t(id INTEGER PRIMARY KEY, title TEXT, score REAL)")
+    conn.executemany("INSERT INTO t VALUES (?,?,?)", [(i, f"né \"{i}\"", i / 2) for i in range(1, 8)])
+    return conn.execute("SELECT id, title, score FROM t ORDER BY id")
+
+
+def test_dumps_is_compact(encoder):
+    data = {"a": [1, None, "é"], "b": {"c": 1.5}}
+    assert json.loads(dumps(data)) == data
+    assert dumps(data).startswith(b'{"a":[1,null,"')
+
+
+def test_json_object_tail(encoder):
+    assert json.loads(b'{"items":[]' + json_object_tail({"next": None, "more": True})) == {
+        "items": [], "next": None, "more": True}
+    assert json_object_tail({}) == b"}"
+
+
+def test_check_rejects_drifted_columns(cursor):
+    LAYOUT.check(cursor.description)
+    with pytest.raises(ValueError):
+        RowLayout("id", "score", "title").check(cursor.description)
+
+
+def test_encode_ndjson(encoder, cursor):
+    lines = LAYOUT.encode_ndjson(cursor.fetchall()).decode("utf-8").splitlines()
+    assert [json.loads(line) for line in lines][0] == {"id": 1, "title": 'né "1"', "score": 0.5}
+    assert len(lines) == 7
+
+
+@pytest.mark.parametrize("limit,batch_size,written,more", [
+    (None, 3, 7, False), (7, 3, 7, False), (6, 3, 6, True), (3, 200, 3, True), (0, 3, 0, True)])
+def test_write_array(encoder, cursor, limit, batch_size, written, more):
+    buf = bytearray(b'{"items":')
+    count, last, has_more = LAYOUT.write_array(buf, cursor, limit, batch_size)
+    items = json.loads(bytes(buf + json_object_tail({"has_more": has_more})))["items"]
+    assert (count, has_more) == (written, more)
+    assert [item["id"] for item in items] == list(range(1, written + 1))
+    assert last == (tuple(cursor.connection.execute("SELECT * FROM t WHERE id=?", (written,)).fetchone())
+                    if written else None)
+
+
+def test_write_array_on_empty_result(encoder):
+    conn = sqlite3.connect(":memory:")
+    buf = bytearray()
+    assert LAYOUT.write_array(buf, conn.execute("SELECT 1, 2, 3 WHERE 0"), 10) == (0, None, False)
+    assert bytes(buf) == b"[]"
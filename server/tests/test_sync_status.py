@@ -0,0 +1,66 @@
+import json
+import sqlite3
+
+from sync_status import SyncStatusTracker
+
+
+def test_counters_follow_recorded_deltas():
+    tracker = SyncStatusTracker(None)
+    tracker.record("note_creations", {"note_id": 1}, notes=2)
+    tracker.record("note_deletions", {"note_id": 1}, notes=-1)
+    tracker.connection_opened()
+    tracker.connection_closed()
+    tracker.connection_closed()  # never below zero
+    snap = tracker.snapshot()
+    assert snap["sync_status"]["total_notes"] == 1
+    assert snap["sync_status"]["websocket_connections"] == 0
+    assert snap["sync_status"]["last_sync_operation"] == "note_deletions"
+    assert [op["type"] for op in snap["recent_operations"]] == ["note_deletions", "note_creations"]
+
+
+def test_recent_operations_are_bounded():
+    tracker = SyncStatusTracker(None, max_recent=3)
+    for n in range(5):
+        tracker.record(f"op{n}")
+    assert [op["type"] for op in tracker.snapshot()["recent_operations"]] == ["op4", "op3", "op2"]
+
+
+def test_load_counts_seeds_from_database():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript("""CREATE TABLE users(id); CREATE TABLE folders(id); CREATE TABLE notes(id, dirty);
+                          INSERT INTO users VALUES (1); INSERT INTO notes VALUES (1, 1), (2, 0);""")
+    tracker = SyncStatusTracker(None)
+    tracker.load_counts(conn)
+    status = tracker.snapshot()["sync_status"]
+    assert (status["total_users"], status["total_notes"], status["total_folders"],
+            status["pending_sync_operations"]) == (1, 2, 0, 1)
+
+
+def test_flush_writes_only_when_dirty(tmp_path):
+    path = tmp_path / "status.json"
+    tracker = SyncStatusTracker(str(path))
+    tracker.record("folder_creations", folders=1)
+    assert tracker.flush() is True
+    assert json.loads(path.read_text())["sync_status"]["total_folders"] == 1
+    assert tracker.flush() is False
+    assert tracker.snapshot()["unflushed_operations"] == 0
+    assert not (tmp_path / "status.json.tmp").exists()
+
+
+def test_background_flush_coalesces_writes(tmp_path):
+    path = tmp_path / "status.json"
+    tracker = SyncStatusTracker(str(path), flush_interval=0.05)
+    tracker.start()
+    for _ in range(20):
+        tracker.record("note_updates")
+    tracker.stop()  # flushes whatever is left
+    assert len(json.loads(path.read_text())["recent_operations"]) == 10
+    assert tracker.snapshot()["unflushed_operations"] == 0
+
+
+def test_endpoint_reports_writes(client, user):
+    before = client.get("/api/sync-status").get_json()["sync_status"]["total_notes"]
+    client.post("/api/notes/upsert", json={"title": "a"}, headers=user)
+    status = client.get("/api/sync-status").get_json()
+    assert status["sync_status"]["total_notes"] == before + 1
+    assert status["recent_operations"][0]["type"] == "note_creations"
@@ -0,0 +1,97 @@
+import sqlite3
+
+import pytest
+
+from migrations import MigrationRunner, schema_version
+from note_bodies import register_functions
+from schema import MIGRATIONS
+from timestamps import MAX_MS, client_timestamp, ms_sql, ms_to_iso, to_ms
+
+INSTANT = 1767261600000  # 2026-01-01T10:00:00Z
+
+FORMATS = [
+    ("2026-01-01 10:00:00", INSTANT),  # SQLite datetime('now')
+    ("2026-01-01T10:00:00Z", INSTANT),  # now_iso()
+    ("2026-01-01T10:00:00.123Z", INSTANT + 123),  # toISOString()
+    ("2026-01-01T10:00:00.5", INSTANT + 500),
+    ("2026-01-01T12:00:00+02:00", INSTANT),
+    ("2026-01-01T10:00:00.1234z", INSTANT + 123),
+    ("2026-01-01T10:00:00.1235Z", INSTANT + 124),  # sub-millisecond digits round
+]
+
+
+@pytest.mark.parametrize("text,ms", FORMATS)
+def test_iso_formats(text, ms):
+    assert to_ms(text) == ms
+
+
+@pytest.mark.parametrize("text,ms", FORMATS)
+def test_sql_conversion_matches(text, ms):
+    conn = sqlite3.connect(":memory:")
+    assert conn.execute(f"SELECT {ms_sql('?1')}", (text,)).fetchone()[0] == ms
+
+
+def test_text_order_is_not_time_order():
+    earlier, later = "2026-01-01 10:00:01", "2026-01-01T10:00:00Z"
+    assert earlier < later and to_ms(earlier) > to_ms(later)
+
+
+@pytest.mark.parametrize("value", [None, True, False, "", "yesterday", "2026-13-01T00:00:00Z",
+                                   float("nan"), float("inf"), MAX_MS + 1, [INSTANT]])
+def test_invalid_values(value):
+    assert to_ms(value) is None and client_timestamp(value) is None
+
+
+def test_numbers_and_round_trip():
+    assert to_ms(INSTANT) == INSTANT and to_ms(INSTANT + 0.9) == INSTANT
+    assert ms_to_iso(INSTANT + 123) == "2026-01-01T10:00:00.123Z"
+    assert to_ms(ms_to_iso(MAX_MS)) == MAX_MS
+    assert client_timestamp(INSTANT) == ("2026-01-01T10:00:00.000Z", INSTANT)
+    assert client_timestamp("2026-01-01 10:00:00") == ("2026-01-01 10:00:00", INSTANT)
+
+
+def connect(path):
+    conn = sqlite3.connect(str(path), isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    register_functions(conn)
+    return conn
+
+
+def test_updated_ms_migration_backfills_existing_notes(tmp_path):
+    conn = connect(tmp_path / "old.db")
+    MigrationRunner(conn, MIGRATIONS[:7], on_progress=None).run()
+    values = [text for text, _ in FORMATS] + ["not a date", "2026-01-01T10:00:00.000Z"]
+    conn.executemany("INSERT INTO notes(user_id, title, updated_at, is_deleted) VALUES (1, 't', ?, ?)",
+                     [(v, i % 2) for i, v in enumerate(values)])
+    changes = conn.execute("SELECT COUNT(*) FROM changes").fetchone()[0]
+
+    reports = MigrationRunner(conn, MIGRATIONS, batch_size=4, on_progress=None).run()
+    assert [r["version"] for r in reports] == [8, 9]
+    assert reports[0]["rows"] == len(values)
+    assert schema_version(conn) == len(MIGRATIONS)
+    assert [r[0] for r in conn.execute("SELECT updated_ms FROM notes ORDER BY id")] == (
+        [ms for _, ms in FORMATS] + [0, INSTANT])
+    # Filling in updated_ms is not a change clients need to pull
+    assert conn.execute("SELECT COUNT(*) FROM changes").fetchone()[0] == changes
+
+    indexes = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    assert {"idx_notes_user_updated_ms", "idx_notes_tombstones_ms"} <= indexes
+    assert not {"idx_notes_user_updated_id", "idx_notes_tombstones"} & indexes
+
+    # A real update still logs a change
+    conn.execute("UPDATE notes SET title='u', version=version+1 WHERE id=1")
+    assert conn.execute("SELECT COUNT(*) FROM changes").fetchone()[0] == changes + 1
+
+
+def test_api_stores_updated_ms(client, user, app_module):
+    resp = client.post("/api/notes/upsert", json={"title": "t", "updated_at": "2026-01-01T12:00:00+02:00"},
+                       headers=user)
+    assert resp.status_code == 200
+    conn = app_module.read_db()
+    try:
+        assert tuple(conn.execute("SELECT updated_at, updated_ms FROM notes").fetchone()) == (
+            "2026-01-01T12:00:00+02:00", INSTANT)
+    finally:
+        conn.close()
+    resp = client.post("/api/notes/upsert", json={"title": "t", "updated_at": "soon"}, headers=user)
+    assert resp.status_code == 400
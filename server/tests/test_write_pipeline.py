@@ -0,0 +1,108 @@
+import threading
+
+import pytest
+
+from db_pool import ConnectionPool
+from metrics import Metrics
+from write_pipeline import GroupCommitWriter, WriteQueueTimeout
+
+
+@pytest.fixture
+def pool(tmp_path):
+    p = ConnectionPool(str(tmp_path / "w.db"), max_size=1)
+    with p.connection() as conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.commit()
+    yield p
+    p.close()
+
+
+def values(pool):
+    with pool.connection() as conn:
+        return sorted(r[0] for r in conn.execute("SELECT x FROM t"))
+
+
+def insert(x):
+    def op(c):
+        c.execute("INSERT INTO t VALUES (?)", (x,))
+        return x
+    return op
+
+
+def test_concurrent_writes_share_transactions(pool):
+    writer = GroupCommitWriter(pool.acquire, window=0.05)
+    results = []
+    threads = [threading.Thread(target=lambda n=n: results.append(writer.submit(insert(n), timeout=10)))
+               for n in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(results) == list(range(20)) and values(pool) == list(range(20))
+    stats = writer.stats()
+    assert stats["operations"] == 20 and stats["batches"] < 20
+
+
+def test_failing_operation_is_rolled_back_alone(pool):
+    aborted = []
+    writer = GroupCommitWriter(pool.acquire, window=0.05, on_abort=lambda: aborted.append(1))
+
+    def bad(c):
+        c.execute("INSERT INTO t VALUES (99)")
+        raise ValueError("nope")
+
+    errors = []
+
+    def submit(op):
+        try:
+            writer.submit(op, timeout=10)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=submit, args=(op,)) for op in (insert(1), bad, insert(2))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(errors) == 1 and aborted
+    assert values(pool) == [1, 2]
+
+
+def test_timed_out_operation_is_never_applied(pool):
+    waiting = threading.Event()
+
+    def acquire():
+        waiting.set()
+        return pool.acquire()
+
+    writer = GroupCommitWriter(acquire, window=0.0)
+    holder = pool.acquire()  # the writer cannot get the only connection
+    first = threading.Thread(target=lambda: writer.submit(insert(1), timeout=10))
+    first.start()
+    assert waiting.wait(5)  # the writer thread is stuck on its first batch
+    with pytest.raises(WriteQueueTimeout):
+        writer.submit(insert(5), timeout=0.1)
+    holder.close()
+    first.join(10)
+    writer.submit(insert(2), timeout=10)
+    assert values(pool) == [1, 2] and writer.stats()["cancelled"] == 1
+
+
+def test_disabled_writer_commits_inline(pool):
+    writer = GroupCommitWriter(pool.acquire, enabled=False)
+    assert writer.submit(insert(3)) == 3
+    assert values(pool) == [3] and writer.stats()["batches"] == 0
+
+
+def test_sql_is_counted_for_the_submitting_thread(tmp_path):
+    metrics = Metrics()
+    p = ConnectionPool(str(tmp_path / "m.db"), max_size=1, on_statement=metrics.on_statement)
+    with p.connection() as conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.commit()
+    writer = GroupCommitWriter(p.acquire, sql_capture=metrics)
+    metrics.begin_capture()
+    writer.submit(insert(1), timeout=10)
+    statements, _ = metrics.end_capture()
+    p.close()
+    assert statements == 1  # the INSERT, not the writer's own BEGIN/SAVEPOINT
@@ -0,0 +1,85 @@
+"""
+Integer epoch-millisecond timestamps for sync comparisons.
+
+``notes.updated_at`` keeps the ISO 8601 text it was written with, and that
+comes in several shapes: SQLite's ``datetime('now')`` ("2026-01-01 10:00:00"),
+``now_iso()`` ("2026-01-01T10:00:00Z") and browser ``toISOString()``
+("2026-01-01T10:00:00.123Z"). Compared as text they sort wrongly (a space
+sorts before "T", "Z" after "."), so ``notes.updated_ms`` holds the same
+instant as UTC epoch milliseconds and every range scan, cursor and
+last-writer-wins check uses it. Timestamps are converted once, where they
+enter the API; naive ones are UTC, as in SQLite.
+"""
+
+import calendar
+import datetime
+import math
+import re
+import time
+
+# Fraction and zone at the end of an ISO timestamp, rewritten before parsing:
+# fromisoformat() only takes "Z" and fractions other than 3 or 6 digits on 3.11+
+_ISO_TAIL = re.compile(r"(\.\d+)?([zZ]|[+-]\d{2}:\d{2})?$")
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+# Epoch ms that datetime (and so ms_to_iso) can represent
+MIN_MS = (datetime.datetime.min - _EPOCH) // datetime.timedelta(milliseconds=1)
+MAX_MS = (datetime.datetime.max - _EPOCH) // datetime.timedelta(milliseconds=1)
+
+
+def _parse_iso(text):
+    m = _ISO_TAIL.search(text)
+    fraction, zone = m.group(1), m.group(2)
+    if fraction:
+        fraction = "." + (fraction[1:] + "000000")[:6]
+    if zone in ("Z", "z"):
+        zone = "+00:00"
+    return datetime.datetime.fromisoformat(text[:m.start()] + (fraction or "") + (zone or ""))
+
+
+def to_ms(value):
+    """Epoch milliseconds for an ISO 8601 string or a number of epoch ms; None if invalid"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        if not math.isfinite(value) or not MIN_MS <= value <= MAX_MS:
+            return None
+        return int(value)
+    if not isinstance(value, str):
+        return None
+    try:
+        dt = _parse_iso(value.strip())
+        if dt.tzinfo is not None:
+            dt = dt.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    except (ValueError, OverflowError):  # offsets can push year 1 / 9999 out of range
+        return None
+    # Sub-millisecond digits round, like SQLite's date functions
+    return calendar.timegm(dt.timetuple()) * 1000 + (dt.microsecond + 500) // 1000
+
+
+def now_ms():
+    """Current time in epoch milliseconds"""
+    return int(time.time() * 1000)
+
+
+def ms_to_iso(ms):
+    """'YYYY-MM-DDTHH:MM:SS.sssZ' for epoch milliseconds"""
+    dt = _EPOCH + datetime.timedelta(milliseconds=ms)
+    return dt.isoformat(timespec="milliseconds") + "Z"
+
+
+def client_timestamp(value):
+    """(updated_at text, updated_ms) for a timestamp sent by a client, or None if it is not one.
+
+    ISO strings are stored as sent; epoch ms get an ISO text form.
+    """
+    ms = to_ms(value)
+    if ms is None:
+        return None
+    return (value if isinstance(value, str) else ms_to_iso(ms)), ms
+
+
+def ms_sql(column):
+    """SQL computing to_ms() of an ISO 8601 text column (NULL when SQLite cannot parse it)"""
+    return (f"CAST(strftime('%s', {column}) AS INTEGER) * 1000 "
+            f"+ CAST(substr(strftime('%f', {column}), 4) AS INTEGER)")
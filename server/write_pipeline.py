@@ -0,0 +1,175 @@
+"""
+Group commit for single-row write handlers.
+
+Handlers hand a function ``op(cursor)`` to ``GroupCommitWriter.submit()``
+instead of committing themselves. One writer thread collects the operations
+that arrive within ``window`` seconds (at most ``max_batch``), runs each in
+its own SAVEPOINT inside a shared ``BEGIN IMMEDIATE`` transaction, commits
+once and then resolves every caller with its own result or exception.
+A caller that gives up waiting cancels its operation; operations cancelled
+before the writer picks them up are never applied, so a client retrying
+after a timeout cannot end up writing twice.
+
+An operation that raises is rolled back to its savepoint without affecting
+the others in the batch. Operations run on the writer thread: they must not
+touch Flask's request context and must not commit. ``on_abort()`` is called
+whenever some operation's effects were rolled back, so state derived from
+inside operations (such as cached rows) can be dropped. With ``sql_capture``
+(``Metrics``) the SQL each operation runs on the writer thread is counted
+and added to the submitting thread's request metrics.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+
+class WriteQueueTimeout(Exception):
+    """The writer did not finish an operation within the caller's timeout"""
+
+
+class GroupCommitWriter:
+    """Single writer thread applying queued write operations in shared transactions"""
+
+    def __init__(self, acquire, window=0.002, max_batch=128, enabled=True, on_abort=None, sql_capture=None):
+        # acquire() returns a connection; conn.close() gives it back
+        self._acquire = acquire
+        self._on_abort = on_abort or (lambda: None)
+        self._sql_capture = sql_capture
+        self.window = window
+        self.max_batch = max_batch
+        self.enabled = enabled
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        self.batches = 0
+        self.operations = 0
+        self.max_batch_seen = 0
+        self.cancelled = 0
+
+    def submit(self, op, timeout=None):
+        """Run op(cursor) in a committed transaction and return its result"""
+        if not self.enabled:
+            return self._run_alone(op)
+        future = Future()
+        self._queue.put((op, future))
+        self._ensure_thread()
+        try:
+            result, error, work = future.result(timeout)
+        except FutureTimeoutError:
+            if future.cancel():
+                with self._stats_lock:
+                    self.cancelled += 1
+                raise WriteQueueTimeout(f"Write not applied within {timeout:.1f}s")
+            # The writer already started on it, so it is applied (or fails) with its batch
+            result, error, work = future.result()
+        if work is not None:
+            self._sql_capture.add_request_sql(work)
+        if error is not None:
+            raise error
+        return result
+
+    def _run_alone(self, op):
+        conn = self._acquire()
+        try:
+            c = conn.cursor()
+            c.execute("BEGIN IMMEDIATE")  # reads inside op see what it writes against
+            result = op(c)
+            conn.commit()
+            return result
+        except Exception:
+            self._on_abort()
+            raise
+        finally:
+            conn.close()
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="group-commit-writer", daemon=True)
+                    self._thread.start()
+
+    def _collect(self):
+        """Block for the first operation, then gather more until the window closes"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._apply(batch)
+            except Exception as e:
+                # Commit (or connection checkout) failed: nothing in the batch was applied
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _apply(self, batch):
+        # Skip operations whose callers timed out and cancelled them
+        batch = [(op, future) for op, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        conn = self._acquire()
+        results = []
+        try:
+            c = conn.cursor()
+            c.execute("BEGIN IMMEDIATE")
+            capture = self._sql_capture
+            for op, future in batch:
+                c.execute("SAVEPOINT op")
+                if capture is not None:
+                    capture.begin_capture()
+                try:
+                    result, error = op(c), None
+                except Exception as e:
+                    result, error = None, e
+                work = capture.end_capture() if capture is not None else None
+                if error is None:
+                    c.execute("RELEASE op")
+                else:
+                    c.execute("ROLLBACK TO op")
+                    c.execute("RELEASE op")
+                    self._on_abort()
+                # Resolved as (result, exception, SQL work) so failed ops report their SQL too
+                results.append((future, (result, error, work)))
+            conn.commit()
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            self._on_abort()
+            raise
+        finally:
+            conn.close()
+
+        with self._stats_lock:
+            self.batches += 1
+            self.operations += len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+        # Callers only hear back once their write is durable
+        for future, outcome in results:
+            future.set_result(outcome)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "enabled": self.enabled,
+                "queued": self._queue.qsize(),
+                "batches": self.batches,
+                "operations": self.operations,
+                "avg_batch": round(self.operations / self.batches, 2) if self.batches else 0,
+                "max_batch": self.max_batch_seen,
+                "cancelled": self.cancelled,
+            }
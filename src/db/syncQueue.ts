@@ -59,6 +59,21 @@ export async function removeQueueItem(id: number) {
   });
 }
 
+export async function removeQueueItems(ids: number[]) {
+  if (!ids.length) return;
+  const db = await getDB();
+  return new Promise<void>((resolve, reject) => {
+    db.transaction(tx => {
+      tx.executeSql(
+        `DELETE FROM sync_queue WHERE id IN (${ids.map(() => '?').join(',')})`,
+        ids,
+        () => resolve(),
+        (_, e) => { reject(e); return false; }
+      );
+    });
+  });
+}
+
 export async function bumpQueueAttempt(id: number, err: string) {
   const db = await getDB();
   return new Promise<void>((resolve, reject) => {
@@ -102,22 +102,16 @@ export default function SearchScreen({ navigation }: any) {
         console.log('🔌 SearchScreen WebSocket connected');
       });
 
-      socket.on('note_created', (data: any) => {
-        console.log('📝 Note created, refreshing search results:', data);
+      // One coalesced event per burst of note changes (created/updated/deleted)
+      socket.on('notes_changed', (data: any) => {
+        console.log('📝 Notes changed, refreshing search results:', data?.changes?.length ?? 0);
         setTimeout(() => {
           doSearch(query, opts);
         }, 100);
       });
 
-      socket.on('note_updated', (data: any) => {
-        console.log('📝 Note updated, refreshing search results:', data);
-        setTimeout(() => {
-          doSearch(query, opts);
-        }, 100);
-      });
-
-      socket.on('note_deleted', (data: any) => {
-        console.log('🗑️ Note deleted, refreshing search results:', data);
+      socket.on('notes_imported', (data: any) => {
+        console.log('📥 Notes imported, refreshing search results:', data);
         setTimeout(() => {
           doSearch(query, opts);
         }, 100);
@@ -30,6 +30,16 @@ export async function getJson<T>(path: string) {
   return res.json() as Promise<T>;
 }
 
+/** GET with If-None-Match; resolves to null when the server answers 304 Not Modified. */
+export async function getJsonIfChanged<T>(path: string, etag: string | null) {
+  const headers: Record<string, string> = await authHeaders();
+  if (etag) headers['If-None-Match'] = etag;
+  const res = await withTimeout(fetch(`${BASE_URL}${path}`, { headers }));
+  if (res.status === 304) return null;
+  if (!res.ok) throw new Error(`${res.status} ${res.statusText}`);
+  return { data: (await res.json()) as T, etag: res.headers.get('ETag') };
+}
+
 export async function postJson<T>(path: string, body: any) {
   const headers = await authHeaders();
   const res = await withTimeout(fetch(`${BASE_URL}${path}`, {
@@ -61,13 +61,29 @@ export async function startRealtime() {
     setConnectionStatus(false);
   });
 
-  // Server push: any update/delete → trigger one sync
-  socket.on('note_updated', (data) => {
-    console.log('📝 Note updated:', data);
-    scheduleSync();
+  // Server push: one coalesced event per burst of note changes. Small bursts
+  // carry the changed rows, which are applied directly; otherwise run one sync.
+  socket.on('notes_changed', async (data) => {
+    console.log('📝 Notes changed:', data?.changes?.length ?? 0);
+    const { isAutoSyncEnabled, applyPushedChanges } = await import('./sync');
+    if (!data?.bodies_included || !(await isAutoSyncEnabled())) {
+      scheduleSync();
+      return;
+    }
+    try {
+      const deleted = (data.changes ?? [])
+        .filter((ch: any) => ch.op === 'deleted')
+        .map((ch: any) => ch.id);
+      await applyPushedChanges(data.notes ?? [], deleted);
+    } catch (e) {
+      console.log('Failed to apply pushed changes, falling back to sync:', e);
+      scheduleSync();
+    }
   });
-  socket.on('note_deleted', (data) => {
-    console.log('🗑️ Note deleted:', data);
+
+  // Server push after a bulk import: no per-note rows, so pull them
+  socket.on('notes_imported', (data) => {
+    console.log('📥 Notes imported:', data?.notes ?? 0);
     scheduleSync();
   });
 
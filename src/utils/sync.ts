@@ -1,88 +1,110 @@
 import AsyncStorage from '@react-native-async-storage/async-storage';
 import { getDB, nowISO } from '../db/sqlite';
-import { listQueue, removeQueueItem, bumpQueueAttempt } from '../db/syncQueue';
-import { getJson, postJson, del } from './api';
+import { listQueue, removeQueueItems, bumpQueueAttempt } from '../db/syncQueue';
+import { getJsonIfChanged, postJson } from './api';
 import { showToast } from '../components/Toast';
 import { getCurrentUserId } from './session';
 import { getItem } from './storage';
 
 const LAST_KEY = (uid: number) => `sync.last.${uid}`;
+// ETag of the last first-page pull, with the path it belongs to
+const ETAG_KEY = (uid: number) => `sync.etag.${uid}`;
 
 let SYNC_IN_FLIGHT = false;
 let AUTO_SYNC_INTERVAL: NodeJS.Timeout | null = null;
 
+// Max remote ids per /notes/batch_delete request (server accepts up to 500)
+const DELETE_BATCH_SIZE = 500;
+
 async function pushDeleteQueue(uid: number) {
-  const items = await listQueue(uid, 50);
-  for (const it of items) {
-    try {
-      if (!it.remote_id) { await removeQueueItem(it.id); continue; }
-      await del(`/notes/${encodeURIComponent(it.remote_id)}`);
-      await removeQueueItem(it.id);
-    } catch (e: any) {
-      await bumpQueueAttempt(it.id, String(e?.message || e));
-      if (/timeout|Network/i.test(String(e))) {
-        throw e; // Re-throw network errors to be caught by main sync function
+  while (true) {
+    const items = await listQueue(uid, DELETE_BATCH_SIZE);
+    if (!items.length) return;
+
+    // Items without a (numeric) remote id never reached the server: nothing to delete there
+    const stale = items.filter(it => !/^\d+$/.test(String(it.remote_id ?? '')));
+    const pending = items.filter(it => /^\d+$/.test(String(it.remote_id ?? '')));
+    if (stale.length) await removeQueueItems(stale.map(it => it.id));
+
+    if (pending.length) {
+      try {
+        // Ids reported as not_found are already gone on the server, so the whole batch is done
+        await postJson<{ deleted: number[]; not_found: number[] }>(`/notes/batch_delete`, {
+          ids: pending.map(it => Number(it.remote_id)),
+        });
+        await removeQueueItems(pending.map(it => it.id));
+      } catch (e: any) {
+        for (const it of pending) {
+          await bumpQueueAttempt(it.id, String(e?.message || e));
+        }
+        if (/timeout|Network/i.test(String(e))) {
+          throw e; // Re-throw network errors to be caught by main sync function
+        }
+        return;
       }
     }
+    if (items.length < DELETE_BATCH_SIZE) return;
   }
 }
 
+// Max notes per /notes/batch_upsert request (server accepts up to 500)
+const PUSH_BATCH_SIZE = 200;
+
+type UpsertResult = { id: string | number; version: number; updated_at: string; skipped?: boolean };
+
 async function pushDirty(uid: number): Promise<number> {
   const db = await getDB();
-  let pushedCount = 0;
-  await new Promise<void>((resolve, reject) => {
+  const dirty = await new Promise<any[]>((resolve, reject) => {
     db.readTransaction(tx => {
       tx.executeSql(
         `SELECT * FROM notes WHERE dirty=1 AND user_id=? ORDER BY updated_at ASC`,
         [uid],
-        async (_, rs) => {
-          try {
-            for (let i = 0; i < rs.rows.length; i++) {
-              const n = rs.rows.item(i);
-              const payload = {
-                id: n.remote_id ?? null,
-                title: n.title ?? '',
-                content: n.content ?? '',
-                folder_id: n.folder_id ?? null,
-                is_favorite: n.is_favorite ? 1 : 0,
-                is_deleted: n.is_deleted ? 1 : 0,
-                updated_at: n.updated_at,
-                version: n.version ?? 1,
-              };
-              const res = await postJson<{id:string|number, version:number, updated_at:string}>(`/notes/upsert`, payload);
-              await new Promise<void>((resv, rej) => {
-                db.transaction(txx => {
-                  txx.executeSql(
-                    `UPDATE notes SET dirty=0, remote_id=?, version=?, updated_at=? WHERE id=?`,
-                    [res.id ? String(res.id) : n.remote_id, res.version ?? n.version, res.updated_at ?? n.updated_at, n.id],
-                    () => resv(),
-                    () => { rej(new Error("update failed")); return false; }
-                  );
-                });
-              });
-              pushedCount++;
-            }
-            resolve();
-          } catch (error) {
-            reject(error);
-          }
+        (_, rs) => {
+          const arr: any[] = [];
+          for (let i = 0; i < rs.rows.length; i++) arr.push(rs.rows.item(i));
+          resolve(arr);
         },
         (_, e) => { reject(e); return false; }
       );
     });
   });
+
+  let pushedCount = 0;
+  for (let start = 0; start < dirty.length; start += PUSH_BATCH_SIZE) {
+    const chunk = dirty.slice(start, start + PUSH_BATCH_SIZE);
+    const payload = chunk.map(n => ({
+      id: n.remote_id ?? null,
+      title: n.title ?? '',
+      content: n.content ?? '',
+      folder_id: n.folder_id ?? null,
+      is_favorite: n.is_favorite ? 1 : 0,
+      is_deleted: n.is_deleted ? 1 : 0,
+      updated_at: n.updated_at,
+      version: n.version ?? 1,
+    }));
+    // One request per chunk; results come back in the same order as the payload
+    const res = await postJson<{ items: UpsertResult[] }>(`/notes/batch_upsert`, { items: payload });
+    await new Promise<void>((resolve, reject) => {
+      db.transaction(tx => {
+        chunk.forEach((n, i) => {
+          const r = res.items?.[i];
+          tx.executeSql(
+            `UPDATE notes SET dirty=0, remote_id=?, version=?, updated_at=? WHERE id=?`,
+            [r?.id ? String(r.id) : n.remote_id, r?.version ?? n.version, r?.updated_at ?? n.updated_at, n.id]
+          );
+        });
+      }, (error) => {
+        reject(error);
+      }, () => {
+        resolve();
+      });
+    });
+    pushedCount += chunk.length;
+  }
   return pushedCount;
 }
 
-async function pull(uid: number): Promise<number> {
-  const since = await AsyncStorage.getItem(LAST_KEY(uid));
-  const qs = since ? `?updated_after=${encodeURIComponent(since)}` : '';
-  const data = await getJson<any>(`/notes${qs}`);
-  
-  // Support both old array format and new object format
-  const rows = Array.isArray(data) ? data : (data.items ?? []);
-  const serverNow = Array.isArray(data) ? null : data.server_now ?? null;
-  
+async function applyRemoteNotes(uid: number, rows: any[]): Promise<number> {
   const db = await getDB();
   let pulledCount = 0;
 
@@ -126,13 +148,76 @@ async function pull(uid: number): Promise<number> {
     });
   });
 
+  return pulledCount;
+}
+
+/**
+ * Apply a realtime notes_changed push: upsert the carried rows and drop
+ * notes deleted on the server (unless they have unsynced local edits).
+ */
+export async function applyPushedChanges(rows: any[], deletedIds: number[]): Promise<number> {
+  const uid = (await getCurrentUserId()) ?? 1;
+  let applied = await applyRemoteNotes(uid, rows);
+  if (deletedIds.length) {
+    const db = await getDB();
+    const ph = deletedIds.map(() => '?').join(',');
+    const [rs] = await db.executeSql(
+      `DELETE FROM notes WHERE user_id = ? AND dirty = 0 AND remote_id IN (${ph});`,
+      [uid, ...deletedIds.map(String)]
+    );
+    applied += rs.rowsAffected ?? 0;
+  }
+  return applied;
+}
+
+async function pull(uid: number): Promise<number> {
+  const since = await AsyncStorage.getItem(LAST_KEY(uid));
+  let cursor: string | null = null;
+  let serverNow: string | null = null;
+  let maxUpdated: string = since || '1970-01-01T00:00:00Z';
+  let pulledCount = 0;
+  let rowCount = 0;
+
+  const saved = JSON.parse((await AsyncStorage.getItem(ETAG_KEY(uid))) || 'null');
+
+  // Follow next_cursor until the server reports no more pages
+  while (true) {
+    const qs = cursor
+      ? `?cursor=${encodeURIComponent(cursor)}`
+      : since ? `?updated_after=${encodeURIComponent(since)}` : '';
+    const path = `/notes${qs}`;
+    // Idle polls repeat the same first-page request, which the server answers with 304
+    const etag = !cursor && saved?.path === path ? saved.etag : null;
+    const resp = await getJsonIfChanged<any>(path, etag);
+    if (resp === null) return pulledCount; // Nothing changed since the last pull; keep the bookmark
+    const data = resp.data;
+    if (!cursor && resp.etag) {
+      await AsyncStorage.setItem(ETAG_KEY(uid), JSON.stringify({ path, etag: resp.etag }));
+    }
+
+    // Support both old array format and new object format
+    const rows = Array.isArray(data) ? data : (data.items ?? []);
+    // Bookmark the first page's server time so rows changed while paging are pulled again next sync
+    if (serverNow === null && !Array.isArray(data)) serverNow = data.server_now ?? null;
+
+    rowCount += rows.length;
+    pulledCount += await applyRemoteNotes(uid, rows);
+    maxUpdated = rows.reduce(
+      (m: string, r: any) => (r.updated_at && r.updated_at > m ? r.updated_at : m),
+      maxUpdated
+    );
+
+    if (Array.isArray(data) || !data.has_more || !data.next_cursor) break;
+    cursor = data.next_cursor;
+  }
+
+  // An empty pull keeps the bookmark, so the next idle poll repeats the same
+  // request and its saved ETag gets a 304 (the ETag covers the query string)
+  if (rowCount === 0 && since) return pulledCount;
+
   // Use server_now if available, otherwise use max(updated_at) as bookmark to avoid missing same-second data
-  const maxUpdated = rows.reduce(
-    (m: string, r: any) => (r.updated_at && r.updated_at > m ? r.updated_at : m),
-    since || '1970-01-01T00:00:00Z'
-  );
   await AsyncStorage.setItem(LAST_KEY(uid), serverNow ?? maxUpdated ?? nowISO());
-  
+
   return pulledCount;
 }
 